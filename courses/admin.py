@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, UserProfile, Category, Course, CourseModule, Lesson, Enrollment
+from .models import CustomUser, UserProfile, Category, Course, CourseModule, Lesson, Enrollment, LessonCompletion, ChunkedUpload, CourseStats, CourseDailyStats
 
 
 class CustomUserAdmin(UserAdmin):
@@ -25,7 +25,30 @@ admin.site.register(Lesson)
 
 @admin.register(Enrollment)
 class EnrollmentAdmin(admin.ModelAdmin):
-    list_display = ['student', 'course', 'progress_percentage', 'is_completed', 'enrolled_at']
+    list_display = ['student', 'course', 'completed_lessons', 'progress_percentage', 'is_completed', 'enrolled_at']
     list_filter = ['is_completed', 'enrolled_at']
     search_fields = ['student__email', 'course__title']
-    readonly_fields = ['enrolled_at', 'completed_at']
\ No newline at end of file
+    readonly_fields = ['enrolled_at', 'completed_at', 'completed_lessons', 'progress_percentage', 'is_completed']
+
+@admin.register(LessonCompletion)
+class LessonCompletionAdmin(admin.ModelAdmin):
+    list_display = ['enrollment', 'lesson', 'completed_at']
+    raw_id_fields = ['enrollment', 'lesson']
+
+@admin.register(ChunkedUpload)
+class ChunkedUploadAdmin(admin.ModelAdmin):
+    list_display = ['filename', 'owner', 'target', 'object_id', 'received', 'size', 'status', 'updated_at']
+    list_filter = ['status', 'target']
+    raw_id_fields = ['owner']
+
+@admin.register(CourseStats)
+class CourseStatsAdmin(admin.ModelAdmin):
+    list_display = ['course', 'module_count', 'total_duration', 'enrollment_count', 'completed_count', 'reconciled_at']
+    readonly_fields = ['module_count', 'total_duration', 'enrollment_count', 'completed_count', 'reconciled_at']
+    raw_id_fields = ['course']
+
+@admin.register(CourseDailyStats)
+class CourseDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ['course', 'date', 'enrollments', 'started', 'completions', 'lessons_completed']
+    list_filter = ['date']
+    raw_id_fields = ['course']
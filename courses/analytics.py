@@ -0,0 +1,170 @@
+import threading
+from collections import Counter, defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, DecimalField, F, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+from .models import Course, CourseDailyStats, Enrollment, LessonCompletion
+
+# Instructor analytics from daily rollups.
+#
+# CourseDailyStats keeps one row per course and day with the enrollments, first
+# lesson completions ("started"), course completions and lesson completions
+# that happened that day. Enrollments add to today's row with F() updates;
+# deleting an enrollment takes its events back out. Lesson completions are the
+# hottest write path, so they don't touch the row inside their transaction:
+# ActivityBuffer sums them per course and day in memory and writes each sum
+# with one F() update every ANALYTICS_FLUSH_SECONDS. Dashboard
+# queries aggregate these rows only, so their cost follows courses x days, not
+# the number of enrollments. Revenue is enrollments x the course's current
+# price. backfill_rollups() rebuilds the rows of a batch of courses from
+# Enrollment/LessonCompletion history, and also repairs drift from bulk paths
+# that bypass the incremental updates (recompute_progress, cascading lesson
+# deletes).
+
+ROLLUP_FIELDS = ('enrollments', 'started', 'completions', 'lessons_completed')
+DEFAULT_DAYS = 30
+
+def record_activity(course_id, day=None, **deltas):
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if course_id is None or not deltas:
+        return
+
+    day = day or timezone.now().date()
+    rows = CourseDailyStats.objects.filter(course_id=course_id, date=day)
+    # counts never go below zero, even if a decrement races a backfill
+    updates = {field: Greatest(F(field) + delta, Value(0)) if delta < 0 else F(field) + delta for field, delta in deltas.items()}
+
+    if rows.update(**updates) or all(delta < 0 for delta in deltas.values()):
+        return
+    try:
+        with transaction.atomic():
+            CourseDailyStats.objects.create(course_id=course_id, date=day, **{field: max(delta, 0) for field, delta in deltas.items()})
+    except IntegrityError:
+        # another request created today's row first
+        rows.update(**updates)
+
+class ActivityBuffer:
+    # one per server process; a timer flushes what has piled up, and a crashed
+    # process loses at most one interval (backfill_rollups() repairs it)
+
+    def __init__(self):
+        self._pending = defaultdict(Counter)
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def add(self, course_id, day, **deltas):
+        with self._lock:
+            self._pending[course_id, day].update(deltas)
+            if self._timer is None:
+                self._timer = threading.Timer(settings.ANALYTICS_FLUSH_SECONDS, self.flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        # write the pending sums; returns the number of rollup rows touched
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(Counter)
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        for (course_id, day), deltas in pending.items():
+            record_activity(course_id, day, **deltas)
+        return len(pending)
+
+    def flush_in_background(self):
+        try:
+            self.flush()
+        finally:
+            connection.close()
+
+activity_buffer = ActivityBuffer()
+
+def buffer_activity(course_id, **deltas):
+    day = timezone.now().date()
+    if not settings.ANALYTICS_FLUSH_SECONDS:
+        record_activity(course_id, day, **deltas)
+        return
+    # only committed completions count
+    transaction.on_commit(lambda: activity_buffer.add(course_id, day, **deltas))
+
+def forget_enrollment(enrollment):
+    # take a deleted enrollment's events out of the rollups it was counted in;
+    # flush first so buffered completions of it aren't added back afterwards
+    activity_buffer.flush()
+    record_activity(enrollment.course_id, enrollment.enrolled_at.date(), enrollments=-1)
+    if enrollment.completed_at is not None:
+        record_activity(enrollment.course_id, enrollment.completed_at.date(), completions=-1)
+
+    days = (LessonCompletion.objects.filter(enrollment=enrollment).annotate(day=TruncDate('completed_at'))
+            .values('day').annotate(total=Count('id')).order_by('day'))
+    for index, row in enumerate(days):
+        record_activity(enrollment.course_id, row['day'], lessons_completed=-row['total'], started=-int(index == 0))
+
+def backfill_rollups(course_ids):
+    # rebuild every rollup row of these courses from history; returns the rows written
+    enrollments = Enrollment.objects.filter(course_id__in=course_ids).order_by()
+    totals = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+
+    for row in enrollments.values('course_id', day=TruncDate('enrolled_at')).annotate(total=Count('id')):
+        totals[row['course_id'], row['day']]['enrollments'] = row['total']
+
+    for row in (enrollments.filter(completed_at__isnull=False)
+                .values('course_id', day=TruncDate('completed_at')).annotate(total=Count('id'))):
+        totals[row['course_id'], row['day']]['completions'] = row['total']
+
+    first = LessonCompletion.objects.filter(enrollment=OuterRef('pk')).order_by().values('enrollment').annotate(first=Min('completed_at')).values('first')
+    for row in (enrollments.annotate(started_at=Subquery(first)).filter(started_at__isnull=False)
+                .values('course_id', day=TruncDate('started_at')).annotate(total=Count('id'))):
+        totals[row['course_id'], row['day']]['started'] = row['total']
+
+    for row in (LessonCompletion.objects.filter(enrollment__course_id__in=course_ids).order_by()
+                .values(course_id=F('enrollment__course_id'), day=TruncDate('completed_at')).annotate(total=Count('id'))):
+        totals[row['course_id'], row['day']]['lessons_completed'] = row['total']
+
+    with transaction.atomic():
+        CourseDailyStats.objects.filter(course_id__in=course_ids).delete()
+        CourseDailyStats.objects.bulk_create(
+            [CourseDailyStats(course_id=course_id, date=day, **counts) for (course_id, day), counts in totals.items()],
+            batch_size=1000,
+        )
+    return len(totals)
+
+def money(row):
+    # as a string with two places, like Course.price in the API
+    row['revenue'] = f"{row['revenue']:.2f}"
+    return row
+
+def dashboard(instructor_id, start=None, end=None, course_id=None):
+    activity_buffer.flush()
+    end = end or timezone.now().date()
+    start = start or end - timedelta(days=DEFAULT_DAYS - 1)
+
+    rows = CourseDailyStats.objects.filter(course__instructor_id=instructor_id)
+    if course_id is not None:
+        rows = rows.filter(course_id=course_id)
+    window = rows.filter(date__range=(start, end))
+
+    amount = DecimalField(max_digits=14, decimal_places=2)
+    revenue = Coalesce(Sum(F('enrollments') * F('course__price'), output_field=amount), Value(0), output_field=amount)
+    # revenue goes first: the counts reuse the column names it reads
+    counts = {field: Coalesce(Sum(field), 0) for field in ROLLUP_FIELDS}
+
+    funnel = rows.aggregate(**counts)
+    courses = Course.objects.filter(instructor_id=instructor_id).order_by('-created_at', '-id')
+    if course_id is not None:
+        courses = courses.filter(pk=course_id)
+    per_course = {row.pop('course_id'): money(row) for row in window.values('course_id').annotate(revenue=revenue, **counts).order_by()}
+    empty = money({**dict.fromkeys(ROLLUP_FIELDS, 0), 'revenue': 0})
+
+    return {
+        'start': start,
+        'end': end,
+        'totals': money(window.aggregate(revenue=revenue, **counts)),
+        # all-time stages, each counted once per enrollment
+        'funnel': {'enrolled': funnel['enrollments'], 'started': funnel['started'], 'completed': funnel['completions']},
+        'daily': [money(row) for row in window.values('date').annotate(revenue=revenue, **counts).order_by('date')],
+        'courses': [{'id': pk, 'title': title, **per_course.get(pk, empty)} for pk, title in courses.values_list('pk', 'title')],
+    }
@@ -0,0 +1,388 @@
+import hashlib
+import json
+import os
+import re
+import tarfile
+import time
+import zlib
+from tempfile import SpooledTemporaryFile
+from django.core.exceptions import ValidationError as ModelValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from .authoring import BATCH_SIZE, tree_grew
+from .models import Category, Course, CourseModule, Lesson
+from .uploads import TARGETS
+from .validators import file_type_for_name, matches_signature
+
+# Course archives, for moving and cloning courses between environments.
+#
+# An archive is a tar stream (gzipped by default) holding manifest.ndjson
+# first, then one media/<sha256> member per distinct file. The manifest has a
+# course line, then one line per module and one per lesson; thumbnail and
+# document_file refer to media by content hash. Export hashes the files while
+# it writes the manifest to a spooled temporary file, then yields tar blocks
+# as it reads the database and storage, so nothing is built in memory.
+#
+# Import reads the stream once, front to back. Manifest lines are inserted with
+# bulk_create in BATCH_SIZE batches inside one transaction; media then go to
+# content-addressed names (upload_to + sha256 + extension), so a file that an
+# earlier import already stored is skipped and its bytes are never written
+# twice. Files are checked against their hash, type signature and size limit.
+# The course stays an unpublished draft without a thumbnail until every file
+# is in, and is deleted again if the media part fails. Memory use is bounded by
+# the batch size plus one entry per module and per distinct media file.
+# The archive's category must already exist unless the caller is trusted to
+# create one (staff on the API, and the import_course command).
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.ndjson'
+MEDIA_DIR = 'media/'
+CHUNK_SIZE = 64 * 1024
+# the manifest is spooled to disk beyond this size
+MANIFEST_MEMORY = 1024 * 1024
+
+COURSE_FIELDS = ('title', 'slug', 'description', 'price', 'level', 'duration', 'is_published')
+CATEGORY_FIELDS = ('name', 'slug', 'description')
+MODULE_FIELDS = ('title', 'description', 'order')
+LESSON_FIELDS = ('title', 'content', 'lesson_type', 'order', 'video_url', 'duration', 'is_preview')
+
+SHA256_RE = re.compile(r'[0-9a-f]{64}')
+EXTENSION_RE = re.compile(r'\.[a-z0-9]{1,10}')
+
+def read_chunks(file):
+    return iter(lambda: file.read(CHUNK_SIZE), b'')
+
+def tar_member(name, size, chunks):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    yield info.tobuf()
+
+    remaining = size
+    for chunk in chunks:
+        chunk = chunk[:remaining]
+        remaining -= len(chunk)
+        if chunk:
+            yield chunk
+        if not remaining:
+            break
+    # a file that shrank since it was hashed is padded out; import rejects it by its hash
+    padding = remaining + (-size % tarfile.BLOCKSIZE)
+    if padding:
+        yield b'\0' * padding
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+class CourseExport:
+    def __init__(self, course_id):
+        self.course_id = course_id
+        self.manifest = SpooledTemporaryFile(MANIFEST_MEMORY)
+        # storage name -> media entry, so each file is hashed once
+        self.entries = {}
+        # sha256 -> storage name, so each content is shipped once
+        self.media = {}
+        # files the database refers to but storage does not have
+        self.missing = []
+
+    def write_manifest(self):
+        # reads the course (Course.DoesNotExist if it is gone); call before stream()
+        course = Course.objects.select_related('category').get(pk=self.course_id)
+        self.write({
+            'type': 'course',
+            'version': FORMAT_VERSION,
+            **{field: getattr(course, field) for field in COURSE_FIELDS},
+            'category': {field: getattr(course.category, field) for field in CATEGORY_FIELDS},
+            'thumbnail': self.media_entry(course.thumbnail.name),
+        })
+
+        modules = CourseModule.objects.filter(course_id=self.course_id).order_by('order').values('id', *MODULE_FIELDS)
+        for module in modules.iterator(chunk_size=BATCH_SIZE):
+            self.write({'type': 'module', **module})
+
+        lessons = (Lesson.objects.filter(module__course_id=self.course_id).order_by('module__order', 'order')
+                   .values('module_id', 'document_file', *LESSON_FIELDS))
+        for lesson in lessons.iterator(chunk_size=BATCH_SIZE):
+            module, document = lesson.pop('module_id'), lesson.pop('document_file')
+            self.write({'type': 'lesson', 'module': module, **lesson, 'document_file': self.media_entry(document)})
+
+        return course
+
+    def write(self, record):
+        self.manifest.write(json.dumps(record, default=str).encode() + b'\n')
+
+    def media_entry(self, name):
+        if not name:
+            return None
+
+        if name not in self.entries:
+            digest, size = hashlib.sha256(), 0
+            try:
+                with default_storage.open(name) as file:
+                    for chunk in read_chunks(file):
+                        digest.update(chunk)
+                        size += len(chunk)
+            except FileNotFoundError:
+                self.missing.append(name)
+                self.entries[name] = None
+                return None
+
+            self.entries[name] = {'sha256': digest.hexdigest(), 'ext': os.path.splitext(name)[1].lower(), 'size': size}
+            self.media.setdefault(digest.hexdigest(), name)
+        return self.entries[name]
+
+    def stream(self, compress=True):
+        chunks = self.tar_chunks()
+        return gzip_chunks(chunks) if compress else chunks
+
+    def tar_chunks(self):
+        size = self.manifest.tell()
+        self.manifest.seek(0)
+        with self.manifest:
+            yield from tar_member(MANIFEST, size, read_chunks(self.manifest))
+
+        for digest, name in self.media.items():
+            with default_storage.open(name) as file:
+                yield from tar_member(MEDIA_DIR + digest, self.entries[name]['size'], read_chunks(file))
+
+        # end-of-archive marker
+        yield b'\0' * (2 * tarfile.BLOCKSIZE)
+
+def available_slug(slug):
+    candidate, suffix = slug, 1
+    while Course.objects.filter(slug=candidate).exists():
+        suffix += 1
+        candidate = f'{slug[:200 - len(str(suffix)) - 1]}-{suffix}'
+    return candidate
+
+class VerifyingReader:
+    # file-like over an archive member that hashes what storage reads, with its
+    # first bytes read ahead for the type check
+    def __init__(self, file):
+        self.file = file
+        self.head = file.read(CHUNK_SIZE)
+        self.pending = self.head
+        self.digest = hashlib.sha256(self.head)
+
+    def read(self, size=-1):
+        if self.pending:
+            data, self.pending = self.pending, b''
+            return data
+
+        data = self.file.read(size)
+        self.digest.update(data)
+        return data
+
+class CourseImport:
+    def __init__(self, instructor_id, slug=None, create_categories=False):
+        self.instructor_id = instructor_id
+        self.slug = slug
+        # only trusted callers may add categories; otherwise they must exist already
+        self.create_categories = create_categories
+        self.course = None
+        self.thumbnail = None
+        self.is_published = False
+        # archive module id -> new module id
+        self.modules = {}
+        # sha256 -> {storage name: upload target} still to be stored
+        self.wanted = {}
+        self.module_rows = []
+        self.lesson_rows = []
+        self.lesson_count = self.module_count = self.duration = 0
+
+    def read_manifest(self, lines):
+        # lines: the manifest as bytes, one JSON record per line
+        try:
+            with transaction.atomic():
+                for number, line in enumerate(lines, 1):
+                    if line.strip():
+                        self.add(number, self.parse(number, line))
+                self.flush_modules()
+                self.flush_lessons()
+        except IntegrityError:
+            raise ValidationError('Module and lesson orders must be unique within their course and module.')
+
+        if self.course is None:
+            raise ValidationError(f'{MANIFEST} has no course.')
+        tree_grew(self.course.pk, self.module_count, self.lesson_count, self.duration)
+
+    def parse(self, number, line):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ValidationError({f'line {number}': 'Not valid JSON.'})
+        if not isinstance(record, dict):
+            raise ValidationError({f'line {number}': 'Expected an object.'})
+        return record
+
+    def add(self, number, record):
+        kind = record.get('type')
+
+        if (kind == 'course') != (self.course is None):
+            raise ValidationError({f'line {number}': 'The manifest must start with exactly one course.'})
+
+        if kind == 'course':
+            self.add_course(number, record)
+        elif kind == 'module':
+            module = self.row(number, CourseModule(course=self.course), record, MODULE_FIELDS, exclude=['course'])
+            self.module_rows.append((record.get('id'), module))
+            if len(self.module_rows) >= BATCH_SIZE:
+                self.flush_modules()
+        elif kind == 'lesson':
+            self.add_lesson(number, record)
+        else:
+            raise ValidationError({f'line {number}': f'Unknown record type {kind!r}.'})
+
+    def add_course(self, number, record):
+        if record.get('version') != FORMAT_VERSION:
+            raise ValidationError(f'Unsupported archive version {record.get("version")!r}.')
+        if not isinstance(record.get('category'), dict):
+            raise ValidationError({f'line {number}': 'The course needs a category.'})
+
+        # published, with its thumbnail, only once every file is stored
+        course = self.row(number, Course(instructor_id=self.instructor_id), record, COURSE_FIELDS,
+                          exclude=['instructor', 'category', 'thumbnail', 'slug'])
+        self.is_published, course.is_published = course.is_published, False
+        self.thumbnail = self.want(number, record.get('thumbnail'), Course, 'thumbnail', TARGETS['course.thumbnail'])
+
+        course.slug = available_slug(self.slug or course.slug)
+        course.category = self.category(number, record['category'])
+        course.save()
+        self.course = course
+
+    def category(self, number, data):
+        category = Category.objects.filter(Q(slug=data.get('slug')) | Q(name=data.get('name'))).first()
+        if category is None:
+            if not self.create_categories:
+                raise ValidationError({f'line {number}': f'Unknown category {data.get("slug")!r}.'})
+            category = self.row(number, Category(), data, CATEGORY_FIELDS)
+            category.save()
+        return category
+
+    def add_lesson(self, number, record):
+        if self.module_rows:
+            self.flush_modules()
+        if record.get('module') not in self.modules:
+            raise ValidationError({f'line {number}': f'Lesson of unknown module {record.get("module")!r}.'})
+
+        lesson = self.row(number, Lesson(module_id=self.modules[record['module']]), record, LESSON_FIELDS,
+                          exclude=['module', 'document_file'])
+        lesson.document_file = self.want(number, record.get('document_file'), Lesson, 'document_file',
+                                         TARGETS['lesson.document_file'])
+        self.lesson_rows.append(lesson)
+        if len(self.lesson_rows) >= BATCH_SIZE:
+            self.flush_lessons()
+
+    def row(self, number, instance, record, fields, exclude=()):
+        for field in fields:
+            if field in record:
+                setattr(instance, field, record[field])
+        try:
+            # field checks only; uniqueness is left to the database
+            instance.clean_fields(exclude=exclude)
+        except ModelValidationError as e:
+            raise ValidationError({f'line {number}': e.message_dict})
+        return instance
+
+    def want(self, number, entry, model, field, target):
+        # the storage name this media entry will be imported to
+        if entry is None:
+            return None
+
+        digest, ext = str(entry.get('sha256', '')), str(entry.get('ext', ''))
+        if not SHA256_RE.fullmatch(digest):
+            raise ValidationError({f'line {number}': f'{field}: not a sha256 digest.'})
+        if not EXTENSION_RE.fullmatch(ext):
+            raise ValidationError({f'line {number}': f'{field}: not a file extension.'})
+        name = f'{model._meta.get_field(field).upload_to}{digest}{ext}'
+        if file_type_for_name(name) not in target.file_types:
+            raise ValidationError({f'line {number}': f'{field}: {ext or "no extension"} is not allowed.'})
+        self.wanted.setdefault(digest, {})[name] = target
+        return name
+
+    def flush_modules(self):
+        created = CourseModule.objects.bulk_create([module for _, module in self.module_rows])
+        self.modules.update((archive_id, module.pk) for (archive_id, _), module in zip(self.module_rows, created))
+        self.module_count += len(created)
+        self.module_rows = []
+
+    def flush_lessons(self):
+        Lesson.objects.bulk_create(self.lesson_rows)
+        self.lesson_count += len(self.lesson_rows)
+        self.duration += sum(lesson.duration or 0 for lesson in self.lesson_rows)
+        self.lesson_rows = []
+
+    def store_media(self, member, file):
+        digest = member.name[len(MEDIA_DIR):] if member.name.startswith(MEDIA_DIR) else None
+        if not member.isfile() or digest not in self.wanted:
+            return
+
+        stored = None
+        for name, target in self.wanted.pop(digest).items():
+            if member.size > target.max_size():
+                raise ValidationError(f'{member.name} is larger than {target.max_size()} bytes.')
+            # content-addressed: an existing file under this name has these bytes
+            if default_storage.exists(name):
+                continue
+
+            if stored is None:
+                reader = VerifyingReader(file)
+                self.check_type(member, name, reader.head)
+                saved = default_storage.save(name, File(reader, name=os.path.basename(name)))
+                if reader.digest.hexdigest() != digest:
+                    default_storage.delete(saved)
+                    raise ValidationError(f'{member.name} does not match its hash.')
+            else:
+                with default_storage.open(stored) as copy:
+                    self.check_type(member, name, copy.read(CHUNK_SIZE))
+                    copy.seek(0)
+                    saved = default_storage.save(name, File(copy, name=os.path.basename(name)))
+
+            if saved != name:
+                # a concurrent import stored the same content first
+                default_storage.delete(saved)
+            stored = name
+
+    def check_type(self, member, name, head):
+        if not matches_signature(file_type_for_name(name), head):
+            raise ValidationError(f'{member.name} is not a {os.path.splitext(name)[1]} file.')
+
+    def finish(self):
+        if self.wanted:
+            raise ValidationError(f'The archive is missing {len(self.wanted)} media file(s).')
+
+        self.course.thumbnail = self.thumbnail
+        self.course.is_published = self.is_published
+        self.course.save(update_fields=['thumbnail', 'is_published', 'updated_at'])
+
+def import_course(fileobj, instructor_id, slug=None, create_categories=False):
+    # reads fileobj once, front to back; returns the new course
+    importer = CourseImport(instructor_id, slug, create_categories)
+
+    try:
+        with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+            member = archive.next()
+            if member is None or member.name != MANIFEST:
+                raise ValidationError(f'The archive must start with {MANIFEST}.')
+            importer.read_manifest(archive.extractfile(member))
+
+            try:
+                while (member := archive.next()) is not None:
+                    importer.store_media(member, archive.extractfile(member))
+                importer.finish()
+            except BaseException:
+                importer.course.delete()
+                raise
+    except (tarfile.TarError, EOFError, zlib.error) as e:
+        raise ValidationError(f'Not a readable course archive: {e}')
+
+    return importer.course
@@ -0,0 +1,156 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth import aauthenticate
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404, HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, MethodNotAllowed, NotAuthenticated, NotFound, Throttled
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from .authentication import CachedJWTAuthentication
+from .cache import course_tree_cache, acatalog_stamp
+from .categories import category_snapshot, category_list_response
+from .db import aread_from_replica, primary_while_recent
+from .conditional import not_modified, add_validators
+from .models import CustomUser
+from .serializers import UserLoginSerializer, UserSerializer
+from .throttling import LoginRateThrottle
+from .views import CourseViewSet, catalog_scope, course_list_etag, course_tree_etag, login_payload
+
+# Async read path for the ASGI deployment, enabled with ASYNC_READ_VIEWS=1.
+#
+# The hot GET endpoints (course list and detail, categories, profile) run as
+# coroutines under ASGI, so a slow client or a cache round trip no longer pins
+# a worker thread. Authentication, version stamps, the 304 check and course
+# tree cache hits are awaited natively. Building a page or a tree is left to
+# CourseViewSet's own helpers, run in a thread, so the two paths cannot drift.
+# Anything else on the same URL (writes, HEAD, the browsable API) is handed to
+# the usual DRF view in a thread.
+#
+# login_view is always a coroutine, under WSGI too: it awaits the password hash
+# pool, so under ASGI a login storm does not tie up request threads.
+
+authentication = CachedJWTAuthentication()
+
+def render(data, status=200, headers=None):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json', headers=headers)
+
+def error_response(exc):
+    # same body and headers as DRF's exception handler
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    headers = None
+    if exc.status_code == 401:
+        headers = {'WWW-Authenticate': authentication.authenticate_header(None)}
+    elif isinstance(exc, Throttled) and exc.wait is not None:
+        headers = {'Retry-After': str(int(exc.wait))}
+    return render(data, status=exc.status_code, headers=headers)
+
+def wants_json(request):
+    return 'format' not in request.GET and 'text/html' not in request.META.get('HTTP_ACCEPT', '')
+
+async def authenticate(request):
+    result = await authentication.aauthenticate(request)
+    return result[0] if result else AnonymousUser()
+
+def api_request(request, user):
+    # a DRF request for the pieces that expect one (query_params, paginators, serializer context)
+    drf_request = Request(request)
+    drf_request.user = user
+    return drf_request
+
+def course_view(drf_request, action, **kwargs):
+    # a CourseViewSet bound to the request, whose helpers then run in a thread
+    return CourseViewSet(request=drf_request, action=action, args=(), kwargs=kwargs, format_kwarg=None)
+
+def async_reads(sync_view, handler):
+    async def view(request, *args, **kwargs):
+        if request.method != 'GET' or not wants_json(request):
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+
+        try:
+            return await handler(request, *args, **kwargs)
+        except Http404 as exc:
+            return error_response(NotFound(*exc.args))
+        except APIException as exc:
+            return error_response(exc)
+
+    view.csrf_exempt = True
+    return view
+
+async def course_list(request):
+    user = await authenticate(request)
+    await aread_from_replica(request, user)
+
+    version, last_modified = await acatalog_stamp()
+    etag = course_list_etag(request, user, version)
+
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+    primary_while_recent(last_modified)
+
+    view = course_view(api_request(request, user), 'list')
+    return add_validators(render(await sync_to_async(view.list_page)(view.request)), etag, last_modified)
+
+async def course_detail(request, pk):
+    user = await authenticate(request)
+    await aread_from_replica(request, user)
+    course_id = str(pk)
+
+    version, last_modified = await course_tree_cache.astamp(course_id)
+    etag = course_tree_etag(course_id, user, version)
+
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+    primary_while_recent(last_modified)
+
+    view = course_view(api_request(request, user), 'retrieve', pk=course_id)
+    if catalog_scope(user) != 'public':
+        return add_validators(render(await sync_to_async(view.tree)(view.request)), etag, last_modified)
+
+    # a hit is answered without leaving the event loop
+    body = await course_tree_cache.aget(course_id, version, request.build_absolute_uri('/'))
+    cache_status = 'HIT'
+    if body is None:
+        body, cache_status = await sync_to_async(view.cached_tree)(view.request, course_id, version)
+
+    response = HttpResponse(body, content_type='application/json', headers={'X-Cache': cache_status})
+    return add_validators(response, etag, last_modified)
+
+async def category_list(request):
+    await authenticate(request)
+    return category_list_response(request, await category_snapshot.aget())
+
+async def profile(request):
+    user = await authenticate(request)
+    if not user.is_authenticated:
+        raise NotAuthenticated()
+
+    # request.user may be a token-backed ClaimsUser, so load the model instance
+    instance = await CustomUser.objects.select_related('profile').aget(pk=user.pk)
+    return render(UserSerializer(instance).data)
+
+@csrf_exempt
+async def login_view(request):
+    try:
+        if request.method != 'POST':
+            raise MethodNotAllowed(request.method)
+
+        drf_request = Request(request, parsers=[JSONParser(), FormParser(), MultiPartParser()])
+        throttle = LoginRateThrottle()
+        if not throttle.allow_request(drf_request, None):
+            raise Throttled(throttle.wait())
+
+        serializer = UserLoginSerializer(data=drf_request.data)
+        serializer.is_valid(raise_exception=True)
+    except APIException as exc:
+        return error_response(exc)
+
+    user = await aauthenticate(request, **serializer.validated_data)
+
+    if getattr(request, 'hash_pool_busy', False):
+        return render({'error': 'Too many logins in progress, try again shortly'}, status=503, headers={'Retry-After': '1'})
+    if user is None:
+        return render({'non_field_errors': ['Invalid credentials']}, status=400)
+    return render(await sync_to_async(login_payload)(user))
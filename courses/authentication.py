@@ -0,0 +1,138 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import CustomUser
+from .cache import is_local
+
+# JWT authentication without a per-request user lookup.
+#
+# Tokens minted by login_view carry the user's role and staff flags plus a
+# `uv` claim holding CustomUser.token_version. Requests build a ClaimsUser from
+# those claims and only check (token_version, is_active) against a short-TTL
+# cache, so most requests make no user query at all. Changing role, is_active
+# or the staff flags bumps token_version and overwrites the cache entry, which
+# revokes older tokens immediately on workers sharing that cache and within the
+# TTL everywhere else. Tokens without the claims fall back to the usual lookup.
+
+VERSION_CLAIM = 'uv'
+CLAIM_FIELDS = ('role', 'email', 'is_staff', 'is_superuser')
+
+def tokens_for_user(user):
+    refresh = RefreshToken.for_user(user)
+
+    for field in CLAIM_FIELDS:
+        refresh[field] = getattr(user, field)
+    refresh[VERSION_CLAIM] = user.token_version
+
+    return refresh
+
+class UserStateCache:
+    def __init__(self, alias='default', timeout=60):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def key(self, user_id):
+        return f'auth:user-state:{user_id}'
+
+    def get(self, user_id):
+        # (token_version, is_active), or None for a deleted user
+        key = self.key(user_id)
+        state = self.cache.get(key)
+
+        if state is None:
+            row = CustomUser.objects.filter(pk=user_id).values_list('token_version', 'is_active').first()
+            state = row or (None, False)
+            self.cache.set(key, state, self.timeout)
+
+        return state
+
+    async def aget(self, user_id):
+        key = self.key(user_id)
+        state = self.cache.get(key) if is_local(self.cache) else await self.cache.aget(key)
+
+        if state is None:
+            row = await CustomUser.objects.filter(pk=user_id).values_list('token_version', 'is_active').afirst()
+            state = row or (None, False)
+            await self.cache.aset(key, state, self.timeout)
+
+        return state
+
+    def set(self, user):
+        self.cache.set(self.key(user.pk), (user.token_version, user.is_active), self.timeout)
+
+    def invalidate(self, user_id):
+        self.cache.delete(self.key(user_id))
+
+user_state_cache = UserStateCache(
+    getattr(settings, 'AUTH_USER_STATE_CACHE', 'default'),
+    getattr(settings, 'AUTH_USER_STATE_TTL', 60),
+)
+
+class ClaimsUser(TokenUser):
+    # simplejwt stores the id claim as a string; compare equal to model pks
+    @cached_property
+    def id(self):
+        return CustomUser._meta.pk.to_python(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def pk(self):
+        return self.id
+
+    @cached_property
+    def role(self):
+        return self.token.get('role')
+
+    @cached_property
+    def email(self):
+        return self.token.get('email', '')
+
+    def __str__(self):
+        return self.email
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if VERSION_CLAIM not in validated_token or 'role' not in validated_token:
+            return super().get_user(validated_token)
+
+        user = ClaimsUser(validated_token)
+        return self.check_state(user, validated_token, user_state_cache.get(user.pk))
+
+    async def aauthenticate(self, request):
+        # authenticate() for the async views; takes a plain Django request
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+
+        if VERSION_CLAIM not in validated_token or 'role' not in validated_token:
+            return await sync_to_async(super().get_user)(validated_token), validated_token
+
+        user = ClaimsUser(validated_token)
+        return self.check_state(user, validated_token, await user_state_cache.aget(user.pk)), validated_token
+
+    def check_state(self, user, validated_token, state):
+        version, is_active = state
+
+        if version is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if not is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if version != validated_token[VERSION_CLAIM]:
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+
+        return user
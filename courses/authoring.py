@@ -0,0 +1,57 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from rest_framework.exceptions import ValidationError
+from .cache import course_tree_cache, bump_catalog_version
+from .models import Course, CourseModule, Lesson, Enrollment
+from .progress import repoint_enrollments
+from .search import index_course_on_commit
+from .stats import adjust_course_stats
+
+# Batched course authoring.
+#
+# A whole course tree, or a batch of new modules and lessons for an existing
+# course, is written in one transaction with one bulk INSERT per table, after
+# ownership was checked once by the caller. bulk_create sends no signals, so
+# add_to_course() does once what the module and lesson handlers would have done
+# per row (tree_grew()): lesson count, stats, course tree cache, search index
+# and the next-lesson pointers of enrollments that had run out of lessons.
+
+BATCH_SIZE = 500
+
+def create_course_tree(instructor_id, data):
+    modules = data.pop('modules', [])
+
+    with transaction.atomic():
+        course = Course.objects.create(instructor_id=instructor_id, **data)
+        add_to_course(course.pk, modules)
+
+    return course
+
+def add_to_course(course_id, modules=(), lessons=()):
+    # modules: dicts with their own 'lessons'; lessons: dicts naming an existing 'module' id
+    try:
+        with transaction.atomic():
+            created = CourseModule.objects.bulk_create(
+                [CourseModule(course_id=course_id, **{key: value for key, value in module.items() if key != 'lessons'}) for module in modules],
+                batch_size=BATCH_SIZE,
+            )
+            rows = [Lesson(module=module, **lesson) for module, spec in zip(created, modules) for lesson in spec.get('lessons', [])]
+            rows += [Lesson(module_id=lesson.pop('module'), **lesson) for lesson in lessons]
+            Lesson.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    except IntegrityError:
+        raise ValidationError('Module and lesson orders must be unique within their course and module.')
+
+    tree_grew(course_id, len(created), len(rows), sum(lesson.duration or 0 for lesson in rows))
+    return created, rows
+
+def tree_grew(course_id, modules, lessons, duration):
+    # what the module and lesson signals would have done for rows added with bulk_create
+    if lessons:
+        Course.objects.filter(pk=course_id).update(lesson_count=F('lesson_count') + lessons)
+        repoint_enrollments(Enrollment.objects.filter(course_id=course_id))
+    adjust_course_stats(course_id, module_count=modules, total_duration=duration)
+
+    course_tree_cache.bump(course_id)
+    index_course_on_commit(course_id)
+    # lesson_count is on the course list too
+    bump_catalog_version()
@@ -1,5 +1,6 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from .hashers import HashPoolBusy, password_pool
 
 User = get_user_model()
 
@@ -7,11 +8,58 @@ class EmailBackend(ModelBackend):
     def authenticate(self, request, username = None, password = None, **kwargs):
         email = kwargs.get('email', username)
 
+        if email is None or password is None:
+            return None
+
         try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
+            try:
+                # joined so the login response's profile needs no second query
+                user = User.objects.select_related('profile').get(email=email)
+            except User.DoesNotExist:
+                # hash anyway so unknown emails take as long as wrong passwords
+                password_pool.hash(password)
+                return None
+
+            matches, needs_rehash = password_pool.verify(password, user.password)
+            if not matches or not self.user_can_authenticate(user):
+                return None
+
+            if needs_rehash:
+                user.password = password_pool.hash(password)
+                user.save(update_fields=['password'])
+        except HashPoolBusy:
+            return self.pool_busy(request)
+
+        return user
+
+    async def aauthenticate(self, request, username = None, password = None, **kwargs):
+        # authenticate() with the hashes awaited, for the login coroutine
+        email = kwargs.get('email', username)
+
+        if email is None or password is None:
             return None
-        
-        if user.check_password(password):
-            return user
-        return None
\ No newline at end of file
+
+        try:
+            try:
+                user = await User.objects.select_related('profile').aget(email=email)
+            except User.DoesNotExist:
+                await password_pool.ahash(password)
+                return None
+
+            matches, needs_rehash = await password_pool.averify(password, user.password)
+            if not matches or not self.user_can_authenticate(user):
+                return None
+
+            if needs_rehash:
+                user.password = await password_pool.ahash(password)
+                await user.asave(update_fields=['password'])
+        except HashPoolBusy:
+            return self.pool_busy(request)
+
+        return user
+
+    def pool_busy(self, request):
+        # a failed login for callers like the admin; the login view answers 503 instead
+        if request is not None:
+            request.hash_pool_busy = True
+        return None
@@ -0,0 +1,268 @@
+import threading
+import time
+from collections import OrderedDict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+# Cache for pre-rendered published course trees.
+#
+# Entries are keyed by course id plus a version counter kept in a shared Django
+# cache. Signals bump the counter whenever the course, one of its modules or
+# lessons changes, so stale entries are never read again and simply age out of
+# the backend. Versions start from a millisecond timestamp, so a counter that is
+# lost from the shared cache can never collide with an older version.
+#
+# Signals run inside the writer's transaction, so a concurrent cache miss could
+# still read the old committed rows and store them under the new version. Every
+# bump is therefore repeated once the transaction commits, which retires such an
+# entry (the category snapshot does the same).
+
+DEFAULT_SETTINGS = {
+    'BACKEND': 'courses.cache.LRUBackend',
+    'OPTIONS': {'max_entries': 1000, 'max_bytes': 64 * 1024 * 1024},
+    'VERSION_CACHE': 'default',
+}
+
+def is_local(cache):
+    # Django's async cache methods run the sync ones in a thread; in-process
+    # backends never block, so async callers can skip that hop
+    return isinstance(cache, (LocMemCache, DummyCache))
+
+class LRUBackend:
+    def __init__(self, max_entries=1000, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+
+            self._data[key] = value
+            self.size += len(value)
+
+            while len(self._data) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, value):
+        self.set(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+class DjangoCacheBackend:
+    # Stores entries in a configured Django cache (locmem, file-based, ...).
+    # Eviction is up to that cache, so it is not counted here.
+    evictions = 0
+
+    def __init__(self, alias='default', timeout=None):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.timeout)
+
+    async def aget(self, key):
+        if is_local(self.cache):
+            return self.get(key)
+        return await self.cache.aget(key)
+
+    async def aset(self, key, value):
+        if is_local(self.cache):
+            self.set(key, value)
+        else:
+            await self.cache.aset(key, value, self.timeout)
+
+    def clear(self):
+        self.cache.clear()
+
+class VersionStamps:
+    # Monotonic version counters plus the time of their last bump, kept in a
+    # Django cache so every worker sharing that cache sees the same stamps.
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        modified_key = f'{key}:modified'
+        values = self.cache.get_many([key, modified_key])
+
+        if key not in values or modified_key not in values:
+            now = time.time()
+            self.cache.add(key, int(now * 1000), None)
+            self.cache.add(modified_key, now, None)
+            values = self.cache.get_many([key, modified_key])
+
+        return values.get(key), values.get(modified_key)
+
+    async def aget(self, key):
+        if is_local(self.cache):
+            return self.get(key)
+
+        modified_key = f'{key}:modified'
+        values = await self.cache.aget_many([key, modified_key])
+
+        if key not in values or modified_key not in values:
+            now = time.time()
+            await self.cache.aadd(key, int(now * 1000), None)
+            await self.cache.aadd(modified_key, now, None)
+            values = await self.cache.aget_many([key, modified_key])
+
+        return values.get(key), values.get(modified_key)
+
+    def bump(self, key):
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.add(key, int(time.time() * 1000), None)
+        self.cache.set(f'{key}:modified', time.time(), None)
+
+    def bump_many(self, keys):
+        # one read and one write for all keys; a concurrent bump of one of them
+        # may fold into this one, which still retires every older version
+        now = time.time()
+        current = self.cache.get_many(keys)
+        self.cache.set_many({key: current[key] + 1 if key in current else int(now * 1000) for key in keys}, None)
+        self.cache.set_many({f'{key}:modified': now for key in keys}, None)
+
+class CourseTreeCache:
+    def __init__(self, config=None):
+        config = {**DEFAULT_SETTINGS, **(config or {})}
+        self.backend = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+        self.stamps = VersionStamps(config['VERSION_CACHE'])
+        self.hits = 0
+        self.misses = 0
+
+    def version_key(self, course_id):
+        return f'course-tree:version:{course_id}'
+
+    def entry_key(self, course_id, version, host):
+        return f'course-tree:{course_id}:{version}:{host}'
+
+    def stamp(self, course_id):
+        # (version, last modified timestamp)
+        return self.stamps.get(self.version_key(course_id))
+
+    async def astamp(self, course_id):
+        return await self.stamps.aget(self.version_key(course_id))
+
+    def version(self, course_id):
+        return self.stamp(course_id)[0]
+
+    def bump(self, course_id):
+        key = self.version_key(course_id)
+        self.stamps.bump(key)
+        transaction.on_commit(lambda: self.stamps.bump(key))
+
+    def bump_many(self, course_ids):
+        keys = [self.version_key(course_id) for course_id in course_ids]
+        if keys:
+            self.stamps.bump_many(keys)
+            transaction.on_commit(lambda: self.stamps.bump_many(keys))
+
+    def get(self, course_id, version, host):
+        body = self.backend.get(self.entry_key(course_id, version, host))
+
+        if body is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return body
+
+    def set(self, course_id, version, host, body):
+        self.backend.set(self.entry_key(course_id, version, host), body)
+
+    async def aget(self, course_id, version, host):
+        body = await self.backend.aget(self.entry_key(course_id, version, host))
+
+        if body is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return body
+
+    async def aset(self, course_id, version, host, body):
+        await self.backend.aset(self.entry_key(course_id, version, host), body)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.backend.evictions}
+
+    def clear(self):
+        self.backend.clear()
+        self.hits = self.misses = 0
+
+course_tree_cache = CourseTreeCache(getattr(settings, 'COURSE_TREE_CACHE', None))
+
+# Bumped whenever a course is saved or deleted, or something shown in catalog
+# rows changes (category or instructor names).
+CATALOG_VERSION_KEY = 'catalog:version'
+
+# Enrollment figures in catalog rows change far more often than anything else
+# there, so they move the catalog version on a coarse interval: a committed
+# change records when the stats went stale, and the first catalog read once
+# CATALOG_STATS_INTERVAL has passed bumps the version.
+CATALOG_STATS_KEY = 'catalog:stats:changed'
+
+def catalog_stats_changed():
+    cache = course_tree_cache.stamps.cache
+    transaction.on_commit(lambda: cache.add(CATALOG_STATS_KEY, time.time(), None))
+
+def catalog_stats_due(changed):
+    return changed is not None and time.time() - changed >= settings.CATALOG_STATS_INTERVAL
+
+def catalog_stamp():
+    stamps = course_tree_cache.stamps
+    # delete() tells concurrent readers which one of them bumps
+    if catalog_stats_due(stamps.cache.get(CATALOG_STATS_KEY)) and stamps.cache.delete(CATALOG_STATS_KEY):
+        stamps.bump(CATALOG_VERSION_KEY)
+    return stamps.get(CATALOG_VERSION_KEY)
+
+async def acatalog_stamp():
+    stamps = course_tree_cache.stamps
+    if is_local(stamps.cache):
+        return catalog_stamp()
+
+    if catalog_stats_due(await stamps.cache.aget(CATALOG_STATS_KEY)) and await stamps.cache.adelete(CATALOG_STATS_KEY):
+        await sync_to_async(stamps.bump)(CATALOG_VERSION_KEY)
+    return await stamps.aget(CATALOG_VERSION_KEY)
+
+def bump_catalog_version():
+    course_tree_cache.stamps.bump(CATALOG_VERSION_KEY)
+    transaction.on_commit(lambda: course_tree_cache.stamps.bump(CATALOG_VERSION_KEY))
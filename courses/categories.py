@@ -0,0 +1,139 @@
+import json
+import threading
+from types import MappingProxyType
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.http import HttpResponse
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from .cache import course_tree_cache
+from .db import using_primary
+from .conditional import make_etag, not_modified, add_validators
+from .models import Category
+from .serializers import CategoryListSerializer
+
+# In-process snapshot of the category list.
+#
+# Categories change rarely, so each worker keeps one immutable build of the list
+# (with published course counts) rendered to JSON bytes, per page and per
+# category. A request only compares the snapshot's version with the shared
+# 'categories:version' stamp, which signals bump whenever a category or course
+# changes, and rebuilds with a single aggregate query when they differ. The
+# stamp is bumped again after commit so no worker keeps a build made from rows
+# another transaction had not committed yet.
+
+CATEGORY_VERSION_KEY = 'categories:version'
+
+def category_queryset():
+    return Category.objects.annotate(course_count=Count('courses', filter=Q(courses__is_published=True))).order_by('name')
+
+class CategorySnapshot:
+    def __init__(self, version, modified, rows, page_size):
+        rendered = [JSONRenderer().render(row) for row in rows]
+
+        self.version = version
+        self.modified = modified
+        self.count = len(rows)
+        self.page_size = page_size
+        self.rows = tuple(rows)
+        self.items = MappingProxyType({row['id']: body for row, body in zip(rows, rendered)})
+        self.pages = tuple(b'[' + b','.join(rendered[start:start + page_size]) + b']'
+                           for start in range(0, len(rendered), page_size)) or (b'[]',)
+
+    @property
+    def num_pages(self):
+        return len(self.pages)
+
+    def page_number(self, value):
+        # same rules and message as PageNumberPagination
+        if value == 'last':
+            return self.num_pages
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            number = 0
+        if not 1 <= number <= self.num_pages:
+            raise NotFound('Invalid page.')
+        return number
+
+    def page_links(self, number, request):
+        url = request.build_absolute_uri()
+        following = replace_query_param(url, 'page', number + 1) if number < self.num_pages else None
+        if number == 1:
+            previous = None
+        elif number == 2:
+            previous = remove_query_param(url, 'page')
+        else:
+            previous = replace_query_param(url, 'page', number - 1)
+        return following, previous
+
+    def render_page(self, number, request):
+        following, previous = self.page_links(number, request)
+        return (b'{"count":%d,"next":%s,"previous":%s,"results":%s}'
+                % (self.count, json.dumps(following).encode(), json.dumps(previous).encode(), self.pages[number - 1]))
+
+    def page_data(self, number, request):
+        following, previous = self.page_links(number, request)
+        start = (number - 1) * self.page_size
+        return {'count': self.count, 'next': following, 'previous': previous, 'results': list(self.rows[start:start + self.page_size])}
+
+class CategorySnapshotCache:
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    @property
+    def stamps(self):
+        return course_tree_cache.stamps
+
+    @property
+    def page_size(self):
+        return settings.REST_FRAMEWORK.get('PAGE_SIZE') or 10
+
+    def current(self, version):
+        snapshot = self._snapshot
+        return snapshot if snapshot is not None and snapshot.version == version else None
+
+    def get(self):
+        version, modified = self.stamps.get(CATEGORY_VERSION_KEY)
+        return self.current(version) or self.build(version, modified)
+
+    async def aget(self):
+        version, modified = await self.stamps.aget(CATEGORY_VERSION_KEY)
+        return self.current(version) or await sync_to_async(self.build)(version, modified)
+
+    def build(self, version, modified):
+        with self._lock:
+            snapshot = self.current(version)
+            if snapshot is None:
+                # every worker keeps this build for the version, so never from a lagging replica
+                with using_primary():
+                    rows = CategoryListSerializer(category_queryset(), many=True).data
+                snapshot = self._snapshot = CategorySnapshot(version, modified, rows, self.page_size)
+                self.builds += 1
+            return snapshot
+
+    def invalidate(self):
+        self.stamps.bump(CATEGORY_VERSION_KEY)
+        transaction.on_commit(lambda: self.stamps.bump(CATEGORY_VERSION_KEY))
+
+    def clear(self):
+        self._snapshot = None
+
+category_snapshot = CategorySnapshotCache()
+
+def category_list_response(request, snapshot):
+    # works with a DRF request and with a plain Django one (async views)
+    etag = make_etag('categories', snapshot.version, request.get_full_path())
+
+    response = not_modified(request, etag, snapshot.modified)
+    if response is not None:
+        return response
+
+    number = snapshot.page_number(request.GET.get('page') or 1)
+    response = HttpResponse(snapshot.render_page(number, request), content_type='application/json')
+    return add_validators(response, etag, snapshot.modified)
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.checks import Error, register
+from .cache import is_local
+
+# Version stamps, cached auth state and the replica pin only work if every
+# worker reads the same cache. A process-local alias is fine for one worker
+# reading one database; anything more needs a shared backend.
+
+def shared_aliases():
+    return {
+        'COURSE_TREE_CACHE VERSION_CACHE': getattr(settings, 'COURSE_TREE_CACHE', {}).get('VERSION_CACHE', 'default'),
+        'AUTH_USER_STATE_CACHE': getattr(settings, 'AUTH_USER_STATE_CACHE', 'default'),
+        'REPLICA_PIN_CACHE': getattr(settings, 'REPLICA_PIN_CACHE', 'default'),
+    }
+
+@register()
+def check_shared_caches(app_configs, **kwargs):
+    workers = getattr(settings, 'WEB_WORKERS', 1)
+    replicas = getattr(settings, 'REPLICA_DATABASES', [])
+    if workers <= 1 and not replicas:
+        return []
+
+    return [
+        Error(
+            f'{setting} uses the process-local cache {alias!r}, but {workers} worker(s) '
+            f'and {len(replicas)} replica(s) are configured.',
+            hint='Set SHARED_CACHE_URL, or point the setting at a cache every worker shares.',
+            id='courses.E001',
+        )
+        for setting, alias in shared_aliases().items() if is_local(caches[alias])
+    ]
@@ -0,0 +1,32 @@
+import hashlib
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+# Conditional GET helpers. Views compute their validators from version stamps or a
+# single aggregate query, so a matching If-None-Match/If-Modified-Since is answered
+# with a 304 before anything is serialized.
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest())
+
+def not_modified(request, etag=None, last_modified=None):
+    if request.method not in ('GET', 'HEAD'):
+        return None
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified) if last_modified else None)
+
+    if response is not None:
+        patch_vary_headers(response, ['Authorization'])
+    return response
+
+def add_validators(response, etag=None, last_modified=None):
+    if response.status_code != 200:
+        return response
+
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(int(last_modified))
+
+    patch_vary_headers(response, ['Authorization'])
+    return response
@@ -0,0 +1,156 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+from .cache import is_local
+
+# Database tuning and read replica routing.
+#
+# SQLite connections get the SQLITE_PRAGMAS from settings as they open (WAL, so
+# readers no longer block the writer, plus synchronous/busy_timeout/mmap_size).
+#
+# With REPLICA_DATABASES configured, ReplicaRoutingMiddleware gives each request
+# a RoutingState. Catalog GETs (CourseViewSet, CategoryViewSet and their async
+# views) call read_from_replica(), which points the request's reads at one
+# replica; everything else keeps reading the primary. Read-your-writes: any
+# write in a request sends its later reads to the primary, and a user who made
+# a write request is pinned to the primary for REPLICA_PIN_SECONDS, longer than
+# the replicas are expected to lag. Work that fills the shared caches (course
+# tree bodies, the category snapshot) runs under using_primary() so a lagging
+# replica can never be stored under a new version stamp. Responses whose ETag
+# comes from a version stamp (course list and detail) are read from the primary
+# while that stamp is younger than REPLICA_PIN_SECONDS (primary_while_recent()),
+# so a lagging replica's rows are never tagged with the new version either.
+
+class RoutingState:
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+routing = ContextVar('db_routing', default=None)
+
+def tune_sqlite(connection):
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+def replica_aliases():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+def pin_key(user_id):
+    return f'db:pinned:{user_id}'
+
+def pin_cache():
+    # shared, so a write on one worker pins the user's reads on all of them
+    return caches[getattr(settings, 'REPLICA_PIN_CACHE', 'default')]
+
+def pinned(user):
+    return user.is_authenticated and pin_cache().get(pin_key(user.pk)) is not None
+
+async def apinned(user):
+    if not user.is_authenticated:
+        return False
+    cache, key = pin_cache(), pin_key(user.pk)
+    return (cache.get(key) if is_local(cache) else await cache.aget(key)) is not None
+
+def choose_replica(request, is_pinned):
+    state = routing.get()
+    if state is not None and request.method in SAFE_METHODS and replica_aliases() and not is_pinned:
+        state.replica = random.choice(replica_aliases())
+
+def read_from_replica(request):
+    # request.user must be authenticated already, i.e. call from initial() or later
+    if replica_aliases():
+        choose_replica(request, pinned(request.user))
+
+async def aread_from_replica(request, user):
+    if replica_aliases():
+        choose_replica(request, await apinned(user))
+
+def primary_while_recent(last_modified):
+    # for a response validated by a version stamp last bumped at last_modified
+    state = routing.get()
+    if state is not None and state.replica is not None and time.time() - last_modified < settings.REPLICA_PIN_SECONDS:
+        state.replica = None
+
+@contextmanager
+def using_primary():
+    state = routing.get()
+    replica = state.replica if state is not None else None
+
+    if state is not None:
+        state.replica = None
+    try:
+        yield
+    finally:
+        if state is not None and not state.wrote:
+            state.replica = replica
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = routing.get()
+        if state is not None and state.replica is not None and not state.wrote:
+            return state.replica
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = routing.get()
+        if state is not None:
+            state.wrote = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        state = RoutingState()
+        token = routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing.reset(token)
+
+        if self.wrote(request, state):
+            self.pin(request.user)
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routing.reset(token)
+
+        if self.wrote(request, state):
+            # request.user may still be a lazy session user here
+            await sync_to_async(self.pin)(request.user)
+        return response
+
+    def wrote(self, request, state):
+        return hasattr(request, 'user') and (state.wrote or request.method not in SAFE_METHODS)
+
+    def pin(self, user):
+        # DRF copies the authenticated user onto the Django request
+        if user.is_authenticated:
+            pin_cache().set(pin_key(user.pk), True, settings.REPLICA_PIN_SECONDS)
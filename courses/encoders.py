@@ -0,0 +1,150 @@
+from decimal import Decimal
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Prefetch
+from django.utils import timezone
+from .models import Course, CourseModule, CustomUser, Lesson, UserProfile
+from .variants import variant_urls
+from .media import protected_file_url
+
+# Flat, precompiled encoders for the course tree. Each encoder is a fixed tuple of
+# (key, attribute, converter) built once at import time, so encoding a row is a
+# tight loop instead of DRF's per-instance field binding and reflection.
+# The output matches CourseDetailSerializer key for key.
+
+def _identity(value, request):
+    return value
+
+def _datetime(value, request):
+    if value is None:
+        return None
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+def _date(value, request):
+    return value.isoformat() if value is not None else None
+
+def _decimal(places):
+    quantum = Decimal(1).scaleb(-places)
+
+    def convert(value, request):
+        return str(Decimal(value).quantize(quantum)) if value is not None else None
+    return convert
+
+def _file(value, request):
+    if not value:
+        return None
+    url = value.url
+    return request.build_absolute_uri(url) if request is not None else url
+
+def _variants(model, image_field):
+    storage = model._meta.get_field(image_field).storage
+
+    def convert(value, request):
+        return variant_urls(value, storage, request)
+    return convert
+
+def _protected_file(view_name):
+    def convert(value, request):
+        return protected_file_url(value, view_name, request) if value else None
+    return convert
+
+def _nested(encoder, default=None):
+    def convert(value, request):
+        return encoder(value, request) if value is not None else default
+    return convert
+
+def _many(encoder):
+    def convert(value, request):
+        return [encoder(item, request) for item in value.all()]
+    return convert
+
+def compile_encoder(spec):
+    fields = tuple((key, attr or key, convert or _identity) for key, attr, convert in spec)
+
+    def encode(obj, request=None):
+        data = {}
+        for key, attr, convert in fields:
+            try:
+                value = getattr(obj, attr)
+            except ObjectDoesNotExist:
+                value = None
+            data[key] = convert(value, request)
+        return data
+    return encode
+
+encode_lesson = compile_encoder([
+    ('id', None, None),
+    ('title', None, None),
+    ('content', None, None),
+    ('lesson_type', None, None),
+    ('order', None, None),
+    ('video_url', None, None),
+    ('document_file', None, _protected_file('lesson-document')),
+    ('duration', None, None),
+    ('is_preview', None, None),
+])
+
+encode_module = compile_encoder([
+    ('id', None, None),
+    ('title', None, None),
+    ('description', None, None),
+    ('order', None, None),
+    ('lessons', None, _many(encode_lesson)),
+])
+
+encode_profile = compile_encoder([
+    ('phone_number', None, None),
+    ('date_of_birth', None, _date),
+    ('expertise', None, None),
+])
+
+encode_user = compile_encoder([
+    ('id', None, None),
+    ('email', None, None),
+    ('username', None, None),
+    ('first_name', None, None),
+    ('last_name', None, None),
+    ('role', None, None),
+    ('bio', None, None),
+    ('profile_picture', None, _file),
+    ('profile_picture_variants', None, _variants(CustomUser, 'profile_picture')),
+    # users without a profile row yet encode the defaults, like UserSerializer
+    ('profile', None, _nested(encode_profile, default=encode_profile(UserProfile()))),
+    ('date_joined', None, _datetime),
+])
+
+encode_category = compile_encoder([
+    ('id', None, None),
+    ('name', None, None),
+    ('slug', None, None),
+    ('description', None, None),
+])
+
+encode_course_tree = compile_encoder([
+    ('id', None, None),
+    ('modules', None, _many(encode_module)),
+    ('instructor', None, _nested(encode_user)),
+    ('category', None, _nested(encode_category)),
+    ('thumbnail_variants', None, _variants(Course, 'thumbnail')),
+    ('title', None, None),
+    ('slug', None, None),
+    ('description', None, None),
+    ('thumbnail', None, _file),
+    ('price', None, _decimal(Course._meta.get_field('price').decimal_places)),
+    ('level', None, None),
+    ('duration', None, None),
+    ('is_published', None, None),
+    ('lesson_count', None, None),
+    ('created_at', None, _datetime),
+    ('updated_at', None, _datetime),
+])
+
+def with_course_tree(queryset):
+    # course + instructor + profile + category in one joined query, then one query
+    # each for modules and lessons regardless of course size
+    return queryset.select_related('instructor__profile', 'category').prefetch_related(
+        Prefetch('modules', queryset=CourseModule.objects.order_by('order', 'id')),
+        Prefetch('modules__lessons', queryset=Lesson.objects.order_by('order', 'id')),
+    )
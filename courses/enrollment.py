@@ -0,0 +1,67 @@
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.functions import Lower
+from .models import CustomUser, Enrollment
+from .stats import adjust_course_stats
+from .analytics import record_activity
+from .progress import repoint_enrollments
+
+# Bulk enrollment for cohort imports.
+#
+# Students are resolved and inserted batch by batch with
+# bulk_create(ignore_conflicts=True), letting the (student, course) unique
+# constraint skip students who are already enrolled or enroll concurrently.
+# Rows the insert actually added are found by their ids, which are above the
+# largest id taken just before it, so only those are counted and repointed.
+# Emails are matched case-insensitively through the index on lower(email); an
+# address that matches several users is reported instead of guessed at.
+
+BATCH_SIZE = 1000
+
+def chunked(values, size):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def bulk_enroll(course, student_ids=(), emails=(), batch_size=BATCH_SIZE):
+    requested = len(set(student_ids)) + len({email.lower() for email in emails})
+    students = CustomUser.objects.filter(role='STUDENT')
+    found = set()
+    invalid = []
+    ambiguous = []
+
+    with transaction.atomic():
+        for batch in chunked(set(student_ids), batch_size):
+            ids = set(students.filter(pk__in=batch).values_list('id', flat=True))
+            invalid.extend(sorted(set(batch) - ids))
+            found.update(ids)
+
+        for batch in chunked({email.lower() for email in emails}, batch_size):
+            matches = {}
+            for email, student_id in students.annotate(email_lower=Lower('email')).filter(email_lower__in=batch).values_list('email_lower', 'id'):
+                matches.setdefault(email, []).append(student_id)
+
+            invalid.extend(sorted(set(batch) - set(matches)))
+            ambiguous.extend(sorted(email for email, ids in matches.items() if len(ids) > 1))
+            found.update(ids[0] for ids in matches.values() if len(ids) == 1)
+
+        created = 0
+        for batch in chunked(found, batch_size):
+            last_id = Enrollment.objects.aggregate(last_id=Max('pk'))['last_id'] or 0
+            Enrollment.objects.bulk_create([Enrollment(student_id=student_id, course=course) for student_id in batch],
+                                           ignore_conflicts=True)
+            new = list(Enrollment.objects.filter(course=course, student_id__in=batch, pk__gt=last_id).values_list('pk', flat=True))
+            repoint_enrollments(Enrollment.objects.filter(pk__in=new))
+            created += len(new)
+
+        # bulk_create sends no post_save
+        adjust_course_stats(course.pk, enrollment_count=created)
+        record_activity(course.pk, enrollments=created)
+
+    return {
+        'requested': requested,
+        'created': created,
+        'already_enrolled': len(found) - created,
+        'invalid': invalid,
+        'ambiguous': ambiguous,
+    }
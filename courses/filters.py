@@ -0,0 +1,58 @@
+from django.db.models import Count
+from django_filters import rest_framework as filters
+from .models import Course
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
+
+class CharInFilter(filters.BaseInFilter, filters.CharFilter):
+    pass
+
+class CourseFilter(filters.FilterSet):
+    # ids are filtered as plain numbers so validating them costs no extra query
+    category = NumberInFilter(field_name='category_id')
+    level = CharInFilter(field_name='level')
+    instructor = filters.NumberFilter(field_name='instructor_id')
+    price_min = filters.NumberFilter(field_name='price', lookup_expr='gte')
+    price_max = filters.NumberFilter(field_name='price', lookup_expr='lte')
+    duration_min = filters.NumberFilter(field_name='duration', lookup_expr='gte')
+    duration_max = filters.NumberFilter(field_name='duration', lookup_expr='lte')
+
+    FACETS = ('category', 'level')
+
+    class Meta:
+        model = Course
+        fields = ['category', 'level', 'instructor', 'price_min', 'price_max', 'duration_min', 'duration_max']
+
+def course_facets(queryset, params):
+    # Category and level counts from a single GROUP BY (category, level) over the
+    # courses matching every other filter. Each facet then honours the selection
+    # in the other one, but not its own, so clients can still widen a selection.
+    data = params.copy()
+    for name in CourseFilter.FACETS:
+        data.pop(name, None)
+
+    base = CourseFilter(data, queryset=queryset).qs.order_by()
+    rows = base.values('category_id', 'category__name', 'level').annotate(count=Count('id'))
+
+    selected = CourseFilter(params, queryset=queryset).form
+    selected.is_valid()
+    categories = {int(category) for category in selected.cleaned_data.get('category') or []}
+    levels = set(selected.cleaned_data.get('level') or [])
+
+    category_counts = {}
+    level_counts = {}
+
+    for row in rows:
+        if not levels or row['level'] in levels:
+            entry = category_counts.setdefault(row['category_id'], {'id': row['category_id'], 'name': row['category__name'], 'count': 0})
+            entry['count'] += row['count']
+
+        if not categories or row['category_id'] in categories:
+            entry = level_counts.setdefault(row['level'], {'level': row['level'], 'count': 0})
+            entry['count'] += row['count']
+
+    return {
+        'category': sorted(category_counts.values(), key=lambda entry: (-entry['count'], entry['name'])),
+        'level': sorted(level_counts.values(), key=lambda entry: (-entry['count'], entry['level'])),
+    }
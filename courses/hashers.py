@@ -0,0 +1,102 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password, make_password
+
+# Password hashing for the login path.
+#
+# TunablePBKDF2PasswordHasher reads its work factor from settings, and since it
+# keeps the pbkdf2_sha256 algorithm name, changing PASSWORD_HASH_ITERATIONS makes
+# Django flag existing hashes for upgrade; EmailBackend then rehashes them on the
+# next successful login.
+#
+# Hashing runs on a bounded thread pool. hashlib releases the GIL, so the pool
+# uses every core while capping how many hashes run at once; requests beyond
+# max_pending wait at most queue_timeout and then fail fast with HashPoolBusy
+# instead of piling up behind a login storm.
+#
+# The login view is a coroutine and awaits the pool (arun), so under ASGI no
+# request thread waits for a hash; under WSGI Django runs it on the request's
+# own thread, which then waits as any sync view would. EmailBackend turns a busy
+# pool into a failed authentication, flagged on the request for the login view.
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_HASH_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
+class HashPoolBusy(Exception):
+    pass
+
+class PasswordHashPool:
+    def __init__(self, max_workers=None, max_pending=None, queue_timeout=2.0):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 4
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='password-hash')
+        return self._executor
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise HashPoolBusy('Too many logins in progress')
+
+        try:
+            return self.executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    async def arun(self, fn, *args):
+        # the same bound, waited for on the event loop instead of a thread
+        deadline = time.monotonic() + self.queue_timeout
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                raise HashPoolBusy('Too many logins in progress')
+            await asyncio.sleep(0.01)
+
+        try:
+            return await asyncio.wrap_future(self.executor.submit(fn, *args))
+        finally:
+            self._slots.release()
+
+    def verify(self, password, encoded):
+        # (matches, needs_rehash)
+        return self.run(_verify, password, encoded)
+
+    def hash(self, password):
+        return self.run(make_password, password)
+
+    async def averify(self, password, encoded):
+        return await self.arun(_verify, password, encoded)
+
+    async def ahash(self, password):
+        return await self.arun(make_password, password)
+
+def _verify(password, encoded):
+    outdated = []
+    matches = check_password(password, encoded, setter=lambda raw: outdated.append(True))
+    return matches, bool(outdated)
+
+def init_hash_worker():
+    # initializer for spawned hashing processes (see courses.user_import); this
+    # module is importable before the app registry, unlike ones that touch models
+    import django
+    django.setup()
+
+pool_settings = getattr(settings, 'PASSWORD_HASH_POOL', {})
+password_pool = PasswordHashPool(
+    max_workers=pool_settings.get('MAX_WORKERS'),
+    max_pending=pool_settings.get('MAX_PENDING'),
+    queue_timeout=pool_settings.get('QUEUE_TIMEOUT', 2.0),
+)
@@ -0,0 +1,38 @@
+import hashlib
+import io
+from PIL import Image, ImageOps
+
+# Image resizing for the variant pipeline (courses/variants.py). This module runs
+# inside spawned worker processes, so it depends on Pillow only and never imports
+# Django models.
+
+SAVE_OPTIONS = {
+    'webp': {'format': 'WEBP', 'method': 4},
+    'jpeg': {'format': 'JPEG', 'optimize': True, 'progressive': True},
+}
+
+def render_variants(data, widths, formats, quality=80):
+    # returns [(format, width, content hash, bytes)], never upscaling the source
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        image.load()
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+    variants = []
+    for width in sorted(set(widths)):
+        if width > image.width:
+            continue
+
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+
+        for image_format in formats:
+            frame = resized.convert('RGB') if image_format == 'jpeg' else resized
+            buffer = io.BytesIO()
+            frame.save(buffer, quality=quality, **SAVE_OPTIONS[image_format])
+            content = buffer.getvalue()
+            variants.append((image_format, width, hashlib.sha256(content).hexdigest()[:32], content))
+
+    return variants
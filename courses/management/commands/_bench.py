@@ -0,0 +1,43 @@
+import time
+from contextlib import contextmanager
+from django.db import transaction
+from courses.models import CustomUser, Category
+
+# Shared helpers for the bench_* management commands. Every benchmark runs inside
+# a transaction that is rolled back, so synthetic rows never reach the database.
+
+class Rollback(Exception):
+    pass
+
+@contextmanager
+def rolled_back():
+    try:
+        with transaction.atomic():
+            yield
+            raise Rollback
+    except Rollback:
+        pass
+
+def timed(fn, repeat=5):
+    # returns (best, median) wall time in milliseconds
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[0], samples[len(samples) // 2]
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def synthetic_instructor(tag='bench'):
+    instructor = CustomUser(username=f'{tag}-instructor', email=f'{tag}-instructor@example.com',
+                            first_name='Bench', last_name='Instructor', role='INSTRUCTOR')
+    instructor.set_unusable_password()
+    instructor.save()
+    return instructor
+
+def synthetic_category(tag='bench'):
+    return Category.objects.create(name=f'{tag} category', slug=f'{tag}-category')
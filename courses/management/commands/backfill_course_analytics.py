@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from courses.analytics import backfill_rollups
+from courses.models import Course
+
+class Command(BaseCommand):
+    help = ('Rebuild the daily analytics rollups from enrollment and completion history, a batch of courses '
+            'per transaction; also repairs drift after bulk progress recomputes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses', help='Only these course ids (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Courses rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        courses = Course.objects.order_by('pk')
+        if options['courses']:
+            courses = courses.filter(pk__in=options['courses'])
+
+        # keyset over course ids, so each batch is one short transaction
+        last_id = 0
+        total_courses = total_rows = 0
+        while True:
+            batch = list(courses.filter(pk__gt=last_id).values_list('pk', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+
+            total_rows += backfill_rollups(batch)
+            total_courses += len(batch)
+            last_id = batch[-1]
+            self.stdout.write(f'{total_courses} courses, {total_rows} rollup rows')
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {total_rows} daily rollup rows for {total_courses} courses'))
@@ -0,0 +1,192 @@
+import asyncio
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from courses.authentication import tokens_for_user
+from courses.models import Course, CourseModule, Lesson, CustomUser, Category
+from ._bench import percentile, synthetic_instructor, synthetic_category
+
+TAG = 'bench-asgi'
+ENDPOINTS = ['course-list', 'course-detail', 'category-list', 'profile']
+
+# (name, uvicorn target, extra arguments, ASYNC_READ_VIEWS)
+SERVERS = [
+    ('sync-wsgi', 'learning_platform.wsgi:application', ['--interface', 'wsgi'], '0'),
+    # the DRF views under ASGI, learning_platform/asgi.py's default
+    ('sync-asgi', 'learning_platform.asgi:application', [], '0'),
+    ('async-asgi', 'learning_platform.asgi:application', [], '1'),
+]
+
+class Command(BaseCommand):
+    help = ('Compare the DRF views under WSGI and ASGI with courses.async_views under ASGI: each runs in '
+            'uvicorn and is driven by many concurrent keep-alive connections on the hot read endpoints')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000)
+        parser.add_argument('--duration', type=float, default=20.0, help='Seconds measured per server')
+        parser.add_argument('--warmup', type=float, default=5.0, help='Seconds of unmeasured load first')
+        parser.add_argument('--courses', type=int, default=50)
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--only', choices=[name for name, _, _, _ in SERVERS])
+        parser.add_argument('--endpoint', action='append', choices=ENDPOINTS, help='Only load these endpoints (repeatable)')
+
+    def handle(self, *args, **options):
+        try:
+            import uvicorn  # noqa: F401
+        except ImportError:
+            raise CommandError('bench_asgi needs uvicorn (pip install uvicorn)')
+
+        # one socket per connection, plus the server's side when it runs locally
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        wanted = options['connections'] * 2 + 256
+        if soft < wanted:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+
+        # the servers are separate processes, so the data is committed and deleted afterwards
+        paths = [(path, token) for endpoint, path, token in self.seed(options['courses'])
+                 if endpoint in (options['endpoint'] or ENDPOINTS)]
+
+        try:
+            for name, target, extra, async_reads in SERVERS:
+                if options['only'] in (None, name):
+                    with self.server(target, extra, async_reads, options['port']):
+                        self.report(name, asyncio.run(self.load(options['port'], paths, options['connections'], options['duration'], options['warmup'])))
+        finally:
+            Course.objects.filter(slug__startswith=TAG).delete()
+            CustomUser.objects.filter(username=f'{TAG}-instructor').delete()
+            Category.objects.filter(slug=f'{TAG}-category').delete()
+
+    def seed(self, count):
+        instructor = synthetic_instructor(TAG)
+        category = synthetic_category(TAG)
+        courses = [
+            Course.objects.create(title=f'Bench course {i}', slug=f'{TAG}-{i}', description='Synthetic',
+                                  instructor=instructor, category=category, is_published=True, level='BEGINNER')
+            for i in range(count)
+        ]
+        for course in courses:
+            modules = CourseModule.objects.bulk_create([CourseModule(course=course, title=f'Module {i}', order=i) for i in range(5)])
+            Lesson.objects.bulk_create([Lesson(module=module, title=f'Lesson {i}', order=i, duration=5) for module in modules for i in range(5)])
+
+        token = str(tokens_for_user(instructor).access_token)
+        return [
+            ('course-list', '/api/courses/', None),
+            ('category-list', '/api/categories/', None),
+            ('profile', '/api/auth/profile/', token),
+        ] + [('course-detail', f'/api/courses/{course.pk}/', None) for course in courses[:10]]
+
+    def server(self, target, extra, async_reads, port):
+        command = self
+
+        class Server:
+            def __enter__(self):
+                env = {**os.environ, 'ASYNC_READ_VIEWS': async_reads, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+                self.process = subprocess.Popen(
+                    [sys.executable, '-m', 'uvicorn', target, '--port', str(port), '--log-level', 'warning',
+                     '--no-access-log', '--backlog', '4096', *extra],
+                    env=env, cwd=settings.BASE_DIR,
+                )
+                command.wait_for_port(port, self.process)
+
+            def __exit__(self, *exc):
+                self.process.terminate()
+                self.process.wait(10)
+
+        return Server()
+
+    def wait_for_port(self, port, process, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'uvicorn exited with status {process.returncode}')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f'uvicorn did not listen on port {port} within {timeout}s')
+
+    async def load(self, port, paths, connections, duration, warmup):
+        requests = [
+            (f'GET {path} HTTP/1.1\r\nHost: localhost\r\nAccept: application/json\r\n'
+             + (f'Authorization: Bearer {token}\r\n' if token else '') + '\r\n').encode()
+            for path, token in paths
+        ]
+        latencies = []
+        statuses = {}
+        measuring = False
+
+        async def client(index):
+            reader = writer = None
+            i = index
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        if writer is None:
+                            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                        status, close = await fetch(reader, writer, requests[i % len(requests)])
+                    except (OSError, asyncio.IncompleteReadError):
+                        status, close = 'error', True
+                    if measuring:
+                        latencies.append((time.perf_counter() - start) * 1000)
+                        statuses[status] = statuses.get(status, 0) + 1
+                    if close and writer is not None:
+                        writer.close()
+                        reader = writer = None
+                    i += 1
+            finally:
+                if writer is not None:
+                    writer.close()
+
+        # only responses that complete inside the window count; the rest are dropped
+        tasks = [asyncio.create_task(client(i)) for i in range(connections)]
+        await asyncio.sleep(warmup)
+        measuring = True
+        await asyncio.sleep(duration)
+        measuring = False
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return latencies, statuses, duration
+
+    def report(self, name, result):
+        latencies, statuses, elapsed = result
+        if not latencies:
+            self.stdout.write(f'{name:<11} no completed requests, statuses={statuses}')
+            return
+        self.stdout.write(f'{name:<11} {len(latencies) / elapsed:8.1f} req/s  p50={percentile(latencies, 50):7.1f}ms '
+                          f'p99={percentile(latencies, 99):7.1f}ms  statuses={statuses}')
+
+async def fetch(reader, writer, request):
+    # one keep-alive HTTP/1.1 exchange; returns (status, connection closed)
+    writer.write(request)
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise asyncio.IncompleteReadError(b'', None)
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        header, _, value = line.decode('latin-1').partition(':')
+        headers[header.strip().lower()] = value.strip().lower()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+
+    return int(status_line.split()[1]), headers.get('connection') == 'close'
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from courses.models import Course, CourseModule, Lesson
+from courses.serializers import CourseDetailSerializer
+from courses.encoders import encode_course_tree, with_course_tree
+from ._bench import rolled_back, timed, synthetic_instructor, synthetic_category
+
+class Command(BaseCommand):
+    help = 'Compare CourseDetailSerializer against the flat course tree encoder on a synthetic course'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modules', type=int, default=500)
+        parser.add_argument('--lessons', type=int, default=20, help='Lessons per module')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            course = self.build_course(options['modules'], options['lessons'])
+            total = options['modules'] * options['lessons']
+            self.stdout.write(f'Synthetic course: {options["modules"]} modules x {options["lessons"]} lessons = {total} lessons')
+
+            def serializer_path():
+                CourseDetailSerializer(Course.objects.get(pk=course.pk)).data
+
+            def encoder_path():
+                encode_course_tree(with_course_tree(Course.objects.all()).get(pk=course.pk))
+
+            for name, fn in (('CourseDetailSerializer', serializer_path), ('encode_course_tree', encoder_path)):
+                with CaptureQueriesContext(connection) as queries:
+                    fn()
+                best, median = timed(fn, options['repeat'])
+                self.stdout.write(f'{name:<24} queries={len(queries):<6} best={best:9.1f}ms median={median:9.1f}ms')
+
+    def build_course(self, module_count, lesson_count):
+        course = Course.objects.create(title='Bench course', slug='bench-course', description='Synthetic',
+                                       instructor=synthetic_instructor(), category=synthetic_category(), is_published=True)
+        modules = CourseModule.objects.bulk_create([
+            CourseModule(course=course, title=f'Module {order}', order=order) for order in range(module_count)
+        ])
+        Lesson.objects.bulk_create([
+            Lesson(module=module, title=f'Lesson {order}', content='Lorem ipsum', order=order, duration=5)
+            for module in modules for order in range(lesson_count)
+        ], batch_size=1000)
+        return course
@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand
+from django.contrib.auth.hashers import make_password
+from courses.models import Course, CustomUser
+from courses.enrollment import bulk_enroll
+from ._bench import rolled_back, synthetic_instructor, synthetic_category
+
+class Command(BaseCommand):
+    help = 'Time a bulk cohort import into one course, then the same import again (all conflicts)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=50_000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            course = Course.objects.create(title='Bench course', slug='bench-course', description='Synthetic',
+                                           instructor=synthetic_instructor(), category=synthetic_category(), is_published=True)
+            unusable = make_password(None)
+            students = CustomUser.objects.bulk_create([
+                CustomUser(username=f'bench-student-{i}', email=f'bench-student-{i}@example.com', password=unusable)
+                for i in range(options['students'])
+            ], batch_size=5000)
+            ids = [student.pk for student in students]
+
+            for label, kwargs in (('ids', {'student_ids': ids}), ('ids again', {'student_ids': ids}),
+                                  ('emails again', {'emails': [s.email for s in students]})):
+                start = time.perf_counter()
+                result = bulk_enroll(course, batch_size=options['batch_size'], **kwargs)
+                elapsed = time.perf_counter() - start
+
+                self.stdout.write(f'{label:<13} {elapsed:7.2f}s {options["students"] / elapsed:10.0f} rows/s '
+                                  f'created={result["created"]} already_enrolled={result["already_enrolled"]}')
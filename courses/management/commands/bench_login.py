@@ -0,0 +1,71 @@
+import os
+import time
+from asgiref.sync import async_to_sync
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.test import APIRequestFactory
+from courses.models import CustomUser
+from courses.hashers import password_pool
+from courses.throttling import LoginRateThrottle, TokenBucketStore
+from courses.async_views import login_view
+from ._bench import percentile
+
+PASSWORD = 'bench-password'
+
+class Command(BaseCommand):
+    help = 'Measure login throughput (logins/s and per core) against the login view from concurrent clients'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--logins', type=int, default=400)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--throttle', action='store_true', help='Keep the login throttle on')
+
+    def handle(self, *args, **options):
+        # worker threads use their own connections, so the users are committed
+        # (and deleted afterwards) instead of living in a rolled back transaction
+        encoded = make_password(PASSWORD)
+        CustomUser.objects.bulk_create([
+            CustomUser(username=f'bench-login-{i}', email=f'bench-login-{i}@example.com', password=encoded)
+            for i in range(options['users'])
+        ], batch_size=1000)
+
+        if not options['throttle']:
+            LoginRateThrottle.ip_buckets = LoginRateThrottle.email_buckets = TokenBucketStore(rate=1e9, burst=1e9)
+
+        try:
+            self.run(options)
+        finally:
+            CustomUser.objects.filter(username__startswith='bench-login-').delete()
+
+    def run(self, options):
+        factory = APIRequestFactory()
+        users = options['users']
+
+        def login(i):
+            request = factory.post('/api/auth/login/', {'email': f'bench-login-{i % users}@example.com', 'password': PASSWORD},
+                                   format='json', HTTP_HOST='localhost', REMOTE_ADDR=f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}')
+            start = time.perf_counter()
+            try:
+                status = async_to_sync(login_view)(request).status_code
+            finally:
+                connection.close()
+            return status, (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            results = list(executor.map(login, range(options['logins'])))
+        elapsed = time.perf_counter() - start
+
+        statuses = {}
+        for status, _ in results:
+            statuses[status] = statuses.get(status, 0) + 1
+        latencies = [latency for _, latency in results]
+        rate = options['logins'] / elapsed
+        cores = os.cpu_count() or 1
+
+        self.stdout.write(f'hash pool: {password_pool.max_workers} workers, {password_pool.max_pending} pending; {cores} cores')
+        self.stdout.write(f'{options["logins"]} logins in {elapsed:.2f}s: {rate:.1f} logins/s, {rate / cores:.1f} per core')
+        self.stdout.write(f'latency p50={percentile(latencies, 50):.1f}ms p95={percentile(latencies, 95):.1f}ms statuses={statuses}')
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from courses.models import Course
+from courses.pagination import CourseKeysetPagination
+from ._bench import rolled_back, timed, synthetic_instructor, synthetic_category
+
+class Command(BaseCommand):
+    help = 'Compare page-number and keyset pagination latency at deep offsets of the course catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--offsets', type=int, nargs='+', default=[1_000, 100_000, 1_000_000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        page_size = CourseKeysetPagination.page_size
+
+        with rolled_back():
+            self.build_catalog(options['rows'])
+            queryset = Course.objects.filter(is_published=True)
+            self.stdout.write(f'{options["rows"]} published courses, page size {page_size}')
+
+            for offset in options['offsets']:
+                offset = min(offset, options['rows'] - page_size)
+                page = offset // page_size + 1
+
+                def page_number():
+                    paginator = PageNumberPagination()
+                    paginator.page_size = page_size
+                    paginator.paginate_queryset(queryset.order_by('-created_at', '-id'), Request(factory.get('/', {'page': page}, HTTP_HOST='localhost')))
+
+                # the cursor a client would hold after reading `offset` rows
+                anchor = queryset.order_by(*CourseKeysetPagination.ordering)[offset - 1] if offset else None
+                cursor = CourseKeysetPagination()
+                cursor.model = Course
+                params = {'cursor': cursor.encode_cursor(anchor)} if anchor else {}
+
+                def keyset():
+                    CourseKeysetPagination().paginate_queryset(queryset, Request(factory.get('/', params, HTTP_HOST='localhost')))
+
+                for name, fn in (('page-number', page_number), ('keyset', keyset)):
+                    best, median = timed(fn, options['repeat'])
+                    self.stdout.write(f'offset={offset:<9} {name:<12} best={best:9.2f}ms median={median:9.2f}ms')
+
+    def build_catalog(self, rows):
+        instructor = synthetic_instructor()
+        category = synthetic_category()
+        now = timezone.now()
+        batch = 10_000
+
+        for start in range(0, rows, batch):
+            courses = Course.objects.bulk_create([
+                Course(title=f'Course {i}', slug=f'bench-course-{i}', description='Synthetic', instructor=instructor,
+                       category=category, is_published=True)
+                for i in range(start, min(start + batch, rows))
+            ])
+            # auto_now_add stamps every inserted row with the same time, so spread
+            # them out afterwards (three rows per second, to exercise the id tiebreak)
+            for i, course in enumerate(courses, start):
+                course.created_at = now - timezone.timedelta(seconds=i // 3)
+            Course.objects.bulk_update(courses, ['created_at'], batch_size=1000)
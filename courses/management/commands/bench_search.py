@@ -0,0 +1,73 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from courses.models import Course, CourseModule, Lesson
+from courses.search import FTS5Backend, InMemoryBackend, fts5_available, tokenize
+from ._bench import rolled_back, percentile, synthetic_instructor, synthetic_category
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'su', 'ta', 'ro', 'vi', 'de', 'po', 'ga', 'lu', 'she', 'tor', 'ban', 'qui']
+
+class Command(BaseCommand):
+    help = 'Measure course search latency (p50/p95) on a synthetic catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=100_000)
+        parser.add_argument('--lessons', type=int, default=50, help='Lessons per course')
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--vocabulary', type=int, default=20_000)
+        parser.add_argument('--in-memory', action='store_true', help='Also measure the pure-Python index')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        # Zipf-distributed vocabulary, so term frequencies look like real text
+        self.words = sorted({''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(options['vocabulary'])})
+        rng.shuffle(self.words)
+        self.weights = [1 / rank for rank in range(1, len(self.words) + 1)]
+
+        with rolled_back():
+            self.build_catalog(rng, options['courses'], options['lessons'])
+            self.stdout.write(f'{options["courses"]} courses, {options["courses"] * options["lessons"]} lessons')
+
+            backends = []
+            if fts5_available():
+                backends.append(FTS5Backend())
+            if options['in_memory'] or not backends:
+                backends.append(InMemoryBackend())
+
+            # the last term is often cut short, as when typing into a search box
+            queries = [rng.choices(self.words[10:2000], k=rng.randint(1, 2)) for _ in range(options['queries'])]
+            queries = [' '.join(words[:-1] + [words[-1][:rng.randint(3, len(words[-1]))]]) for words in queries]
+
+            for backend in backends:
+                start = time.perf_counter()
+                backend.rebuild()
+                self.stdout.write(f'{type(backend).__name__:<16} build={time.perf_counter() - start:8.2f}s')
+
+                samples = []
+                for query in queries:
+                    start = time.perf_counter()
+                    backend.search(tokenize(query), limit=20)
+                    samples.append((time.perf_counter() - start) * 1000)
+
+                self.stdout.write(f'{type(backend).__name__:<16} p50={percentile(samples, 50):8.2f}ms p95={percentile(samples, 95):8.2f}ms')
+
+    def build_catalog(self, rng, course_count, lesson_count):
+        instructor = synthetic_instructor()
+        category = synthetic_category()
+        levels = [level for level, _ in Course.LEVEL_CHOICES]
+        batch = 1_000
+
+        def text(words):
+            return ' '.join(rng.choices(self.words, weights=self.weights, k=words))
+
+        for start in range(0, course_count, batch):
+            courses = Course.objects.bulk_create([
+                Course(title=text(4), slug=f'bench-search-{i}', description=text(30), instructor=instructor,
+                       category=category, level=rng.choice(levels), is_published=True)
+                for i in range(start, min(start + batch, course_count))
+            ])
+            modules = CourseModule.objects.bulk_create([CourseModule(course=course, title='Module', order=1) for course in courses])
+            Lesson.objects.bulk_create([
+                Lesson(module=module, title=text(3), content=text(20), order=order)
+                for module in modules for order in range(lesson_count)
+            ], batch_size=5_000)
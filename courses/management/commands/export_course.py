@@ -0,0 +1,44 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from courses.archive import CourseExport
+from courses.models import Course
+
+class Command(BaseCommand):
+    help = 'Export a course with its modules, lessons and files as a streamed archive (NDJSON manifest + media)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course', type=int)
+        parser.add_argument('--output', help='Archive path, - for stdout (default: <slug>.tar.gz)')
+        parser.add_argument('--no-compress', action='store_false', dest='compress', help='Write a plain tar')
+
+    def handle(self, *args, **options):
+        export = CourseExport(options['course'])
+        try:
+            course = export.write_manifest()
+        except Course.DoesNotExist:
+            raise CommandError(f'Course {options["course"]} does not exist')
+
+        for name in export.missing:
+            self.stderr.write(f'missing from storage, exported without it: {name}')
+
+        path = options['output'] or f'{course.slug}.tar{".gz" if options["compress"] else ""}'
+        try:
+            output = sys.stdout.buffer if path == '-' else open(path, 'wb')
+        except OSError as e:
+            raise CommandError(e)
+
+        size = 0
+        try:
+            for chunk in export.stream(options['compress']):
+                output.write(chunk)
+                size += len(chunk)
+        finally:
+            if path == '-':
+                output.flush()
+            else:
+                output.close()
+
+        if path != '-':
+            self.stdout.write(self.style.SUCCESS(
+                f'Exported "{course.title}" ({len(export.media)} media files) to {path}, {size} bytes'
+            ))
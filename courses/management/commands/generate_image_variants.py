@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from courses.imaging import render_variants
+from courses.variants import IMAGE_FIELDS, get_executor, needs_variants, save_variants, variant_settings
+
+class Command(BaseCommand):
+    help = 'Render missing thumbnail and profile picture variants, e.g. for images uploaded before variants existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Re-render images that already have variants')
+
+    def handle(self, *args, **options):
+        config = variant_settings()
+        executor = get_executor()
+        rendered = failed = 0
+
+        for model, (field, variants_field) in IMAGE_FIELDS.items():
+            rows = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).only('id', field, variants_field)
+            storage = model._meta.get_field(field).storage
+            pending = []
+
+            for row in rows.iterator():
+                if options['force'] or needs_variants(row):
+                    name = getattr(row, field).name
+                    with storage.open(name, 'rb') as source:
+                        data = source.read()
+                    pending.append((row.pk, name, executor.submit(render_variants, data, config['WIDTHS'], config['FORMATS'], config['QUALITY'])))
+
+                    if len(pending) >= config['WORKERS'] * 4:
+                        rendered, failed = self.save(model, pending, rendered, failed)
+
+            rendered, failed = self.save(model, pending, rendered, failed)
+
+        self.stdout.write(self.style.SUCCESS(f'Rendered variants for {rendered} images ({failed} failed)'))
+
+    def save(self, model, pending, rendered, failed):
+        for pk, name, future in pending:
+            try:
+                save_variants(model, pk, name, future.result())
+                rendered += 1
+            except Exception as e:
+                self.stderr.write(f'{model.__name__} {pk} ({name}): {e}')
+                failed += 1
+
+        pending.clear()
+        return rendered, failed
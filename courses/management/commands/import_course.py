@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+from courses.archive import import_course
+from courses.models import CustomUser
+
+class Command(BaseCommand):
+    help = 'Import a course archive written by export_course as a new course of the given instructor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--instructor', required=True, help='Email of the instructor who will own the course')
+        parser.add_argument('--slug', help="Slug for the new course (default: the archive's, made unique)")
+
+    def handle(self, *args, **options):
+        instructor = CustomUser.objects.filter(email=options['instructor'], role='INSTRUCTOR').first()
+        if instructor is None:
+            raise CommandError(f'No instructor with email {options["instructor"]}')
+
+        try:
+            binary = open(options['path'], 'rb')
+        except OSError as e:
+            raise CommandError(e)
+
+        with binary:
+            try:
+                course = import_course(binary, instructor.pk, options['slug'], create_categories=True)
+            except ValidationError as e:
+                raise CommandError(e.detail)
+
+        # lesson_count was raised with an F() update
+        course.refresh_from_db(fields=['lesson_count'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported "{course.title}" as course {course.pk} ({course.slug}), {course.lesson_count} lessons'
+        ))
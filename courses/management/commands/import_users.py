@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from courses.user_import import import_users, guess_format, text_stream, BATCH_SIZE
+
+class Command(BaseCommand):
+    help = 'Import users from a CSV or JSONL file (email, username, first_name, last_name, role, password)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--workers', type=int, help='Password hashing processes (default: CPU count, at most USER_IMPORT_POOL MAX_WORKERS)')
+
+    def handle(self, *args, **options):
+        try:
+            binary = open(options['path'], 'rb')
+        except OSError as e:
+            raise CommandError(e)
+
+        with binary:
+            report = import_users(text_stream(binary), options['format'] or guess_format(options['path']),
+                                  batch_size=options['batch_size'], workers=options['workers'])
+
+        for error in report['errors']:
+            details = '; '.join(f'{field}: {message}' for field, message in error['errors'].items())
+            self.stderr.write(f'line {error["line"]}: {details}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {report["created"]} of {report["processed"]} users ({report["failed"]} failed)'
+        ))
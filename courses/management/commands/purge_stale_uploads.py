@@ -0,0 +1,16 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from courses.uploads import purge_stale_uploads
+
+class Command(BaseCommand):
+    help = 'Delete unfinished chunked uploads that have not received a chunk recently, and their partial files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=settings.CHUNKED_UPLOAD_EXPIRY_HOURS,
+                            help='Idle time after which an upload is abandoned')
+
+    def handle(self, *args, **options):
+        count = purge_stale_uploads(timezone.now() - timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f'Removed {count} abandoned uploads'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from courses.search import get_search_backend
+
+class Command(BaseCommand):
+    help = 'Rebuild the course search index from the database'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt course search index ({type(backend).__name__})'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from courses.models import Course
+from courses.progress import recompute_progress
+
+class Command(BaseCommand):
+    help = 'Recount lessons per course and recompute enrollment progress, e.g. after course structure changes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses', help='Only these course ids (repeatable)')
+
+    def handle(self, *args, **options):
+        courses = Course.objects.all()
+        if options['courses']:
+            courses = courses.filter(pk__in=options['courses'])
+
+        with transaction.atomic():
+            updated = recompute_progress(courses)
+
+        self.stdout.write(self.style.SUCCESS(f'Recomputed progress for {updated} enrollments'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from courses.models import Course
+from courses.stats import reconcile_course_stats
+
+class Command(BaseCommand):
+    help = 'Recompute materialized course stats and fix any drift; run periodically (e.g. hourly from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses', help='Only these course ids (repeatable)')
+
+    def handle(self, *args, **options):
+        courses = Course.objects.all()
+        if options['courses']:
+            courses = courses.filter(pk__in=options['courses'])
+
+        with transaction.atomic():
+            checked, drifted = reconcile_course_stats(courses)
+
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} course stats rows, fixed {drifted}'))
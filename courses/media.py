@@ -0,0 +1,136 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+from .conditional import make_etag, not_modified, add_validators
+
+# Serving protected lesson files.
+#
+# Access is decided by the view; this module only ships the bytes. In the
+# default 'django' mode the file is streamed with FileResponse, which lets the
+# WSGI server use sendfile() where it can, and a single HTTP Range is honoured
+# (If-Range included) so PDF viewers can load pages on demand. The 'nginx' and
+# 'sendfile' modes hand the file to the front server with X-Accel-Redirect or
+# X-Sendfile instead, and the Python worker never reads it.
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def serve_mode():
+    return getattr(settings, 'PROTECTED_MEDIA_SERVE', 'django')
+
+class RangeFile:
+    # file-like view of [start, start + length) of an open file; keeps fileno()
+    # so servers that sendfile() from the current offset still can
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+def parse_range(header, size):
+    # (start, end) inclusive for a single satisfiable range, None to send the
+    # whole file (no or unsupported header), or False if unsatisfiable
+    match = RANGE_RE.match(header.strip()) if header else None
+
+    if match is None:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+def if_range_matches(request, etag, modified):
+    value = request.META.get('HTTP_IF_RANGE')
+
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        return value == etag
+    return parse_http_date_safe(value) == int(modified)
+
+def protected_file_url(field_file, view_name, request=None):
+    # where clients fetch a protected file: the authorizing endpoint, never MEDIA_URL
+    url = reverse(view_name, args=[field_file.instance.pk])
+    return request.build_absolute_uri(url) if request is not None else url
+
+def protected_file_response(request, field_file, filename=None):
+    storage = field_file.storage
+    name = field_file.name
+    filename = filename or os.path.basename(name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    mode = serve_mode()
+
+    if mode in ('nginx', 'sendfile'):
+        response = HttpResponse(content_type=content_type)
+        if mode == 'nginx':
+            prefix = getattr(settings, 'PROTECTED_MEDIA_ACCEL_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = prefix + quote(name)
+        else:
+            response['X-Sendfile'] = storage.path(name)
+        response['Content-Disposition'] = f"inline; filename*=UTF-8''{quote(filename)}"
+        response['Cache-Control'] = 'private'
+        return response
+
+    size = storage.size(name)
+    modified = storage.get_modified_time(name).timestamp()
+    etag = make_etag(name, size, modified)
+
+    response = not_modified(request, etag, modified)
+    if response is not None:
+        return response
+
+    byte_range = parse_range(request.META.get('HTTP_RANGE'), size) if if_range_matches(request, etag, modified) else None
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    file = storage.open(name, 'rb')
+
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type, filename=filename)
+        add_validators(response, etag, modified)
+    else:
+        start, end = byte_range
+        response = FileResponse(RangeFile(file, start, end - start + 1), status=206, content_type=content_type, filename=filename)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(int(modified))
+        patch_vary_headers(response, ['Authorization'])
+
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = 'private'
+    return response
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0004_alter_course_thumbnail_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-created_at', '-id'], name='course_published_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['instructor', '-created_at', '-id'], name='course_instructor_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['-enrolled_at', '-id'], name='enrollment_enrolled_idx'),
+        ),
+    ]
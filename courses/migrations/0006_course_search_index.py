@@ -0,0 +1,51 @@
+from django.db import migrations
+
+# FTS5 index backing courses.search on sqlite. Other databases use the
+# in-process index, so this migration is a no-op there.
+
+CREATE_SQL = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS course_search USING fts5(
+    title, description, lessons,
+    category_id UNINDEXED, level UNINDEXED, is_published UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+'''
+
+POPULATE_SQL = '''
+INSERT INTO course_search (rowid, title, description, lessons, category_id, level, is_published)
+SELECT c.id, c.title, c.description,
+       (SELECT group_concat(l.title || ' ' || coalesce(l.content, ''), char(10))
+          FROM courses_lesson l JOIN courses_coursemodule m ON l.module_id = m.id
+         WHERE m.course_id = c.id),
+       c.category_id, c.level, c.is_published
+  FROM courses_course c
+'''
+
+def fts5_supported(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return False
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return any(option == 'ENABLE_FTS5' for (option,) in cursor.fetchall())
+
+def create_search_index(apps, schema_editor):
+    if fts5_supported(schema_editor):
+        schema_editor.execute(CREATE_SQL)
+        schema_editor.execute(POPULATE_SQL)
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS course_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0005_course_enrollment_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_lessons(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    Lesson = apps.get_model('courses', 'Lesson')
+
+    lessons = Lesson.objects.filter(module__course=OuterRef('pk')).order_by().values('module__course').annotate(total=Count('id')).values('total')
+    Course.objects.update(lesson_count=Coalesce(Subquery(lessons), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_course_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='lesson_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Maintained by lesson signals'),
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='completed_lessons',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='LessonCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_at', models.DateTimeField(auto_now_add=True)),
+                ('enrollment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completions', to='courses.enrollment')),
+                ('lesson', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completions', to='courses.lesson')),
+            ],
+            options={
+                'verbose_name': 'Lesson Completion',
+                'verbose_name_plural': 'Lesson Completions',
+                'unique_together': {('enrollment', 'lesson')},
+            },
+        ),
+        migrations.RunPython(count_lessons, migrations.RunPython.noop),
+    ]
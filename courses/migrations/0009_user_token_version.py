@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_lesson_completion_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='token_version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Bumped to revoke issued tokens'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def drop_empty_profiles(apps, schema_editor):
+    # profiles are now created on first write; rows still holding only the
+    # defaults carry no information
+    UserProfile = apps.get_model('courses', 'UserProfile')
+    UserProfile.objects.filter(phone_number='', date_of_birth__isnull=True, expertise='').delete()
+
+
+def restore_profiles(apps, schema_editor):
+    CustomUser = apps.get_model('courses', 'CustomUser')
+    UserProfile = apps.get_model('courses', 'UserProfile')
+
+    missing = CustomUser.objects.filter(profile__isnull=True).values_list('id', flat=True)
+    UserProfile.objects.bulk_create([UserProfile(user_id=user_id) for user_id in missing.iterator()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_user_token_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_empty_profiles, restore_profiles),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:14
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_drop_empty_profiles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('target', models.CharField(choices=[('lesson.document_file', 'Lesson document'), ('course.thumbnail', 'Course thumbnail'), ('user.profile_picture', 'Profile picture')], max_length=30)),
+                ('object_id', models.PositiveBigIntegerField(help_text='Lesson, course or user the file is attached to')),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField(help_text='Declared total size in bytes')),
+                ('received', models.PositiveBigIntegerField(default=0, help_text='Bytes stored so far; the next chunk starts here')),
+                ('status', models.CharField(choices=[('UPLOADING', 'Uploading'), ('COMPLETE', 'Complete')], default='UPLOADING', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Chunked Upload',
+                'verbose_name_plural': 'Chunked Uploads',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_chunked_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='thumbnail_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies (courses/variants.py)'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='profile_picture_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies (courses/variants.py)'),
+        ),
+    ]
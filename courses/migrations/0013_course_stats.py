@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_course_stats(apps, schema_editor):
+    # same figures as courses.stats.reconcile_course_stats, on the historical models
+    Course = apps.get_model('courses', 'Course')
+    CourseModule = apps.get_model('courses', 'CourseModule')
+    CourseStats = apps.get_model('courses', 'CourseStats')
+    Enrollment = apps.get_model('courses', 'Enrollment')
+    Lesson = apps.get_model('courses', 'Lesson')
+
+    CourseStats.objects.bulk_create([CourseStats(course_id=pk) for pk in Course.objects.values_list('pk', flat=True).iterator()],
+                                    batch_size=1000)
+
+    modules = CourseModule.objects.filter(course=OuterRef('course_id')).order_by().values('course')
+    lessons = Lesson.objects.filter(module__course=OuterRef('course_id')).order_by().values('module__course')
+    enrollments = Enrollment.objects.filter(course=OuterRef('course_id')).order_by().values('course')
+
+    CourseStats.objects.update(
+        module_count=Coalesce(Subquery(modules.annotate(total=Count('id')).values('total')), 0),
+        total_duration=Coalesce(Subquery(lessons.annotate(total=Sum('duration')).values('total')), 0),
+        enrollment_count=Coalesce(Subquery(enrollments.annotate(total=Count('id')).values('total')), 0),
+        completed_count=Coalesce(Subquery(enrollments.annotate(total=Count('id', filter=Q(is_completed=True))).values('total')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0012_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseStats',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='courses.course')),
+                ('module_count', models.PositiveIntegerField(default=0)),
+                ('total_duration', models.IntegerField(default=0, help_text='Sum of lesson durations in minutes')),
+                ('enrollment_count', models.PositiveIntegerField(default=0)),
+                ('completed_count', models.PositiveIntegerField(default=0, help_text='Enrollments with is_completed')),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Course Stats',
+                'verbose_name_plural': 'Course Stats',
+            },
+        ),
+        migrations.RunPython(fill_course_stats, migrations.RunPython.noop),
+    ]
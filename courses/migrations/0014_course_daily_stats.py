@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0013_course_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('enrollments', models.PositiveIntegerField(default=0)),
+                ('started', models.PositiveIntegerField(default=0, help_text='Enrollments whose first lesson was completed that day')),
+                ('completions', models.PositiveIntegerField(default=0, help_text='Enrollments completed that day')),
+                ('lessons_completed', models.PositiveIntegerField(default=0)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='courses.course')),
+            ],
+            options={
+                'verbose_name': 'Course Daily Stats',
+                'verbose_name_plural': 'Course Daily Stats',
+                'unique_together': {('course', 'date')},
+            },
+        ),
+    ]
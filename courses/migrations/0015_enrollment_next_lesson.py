@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef, Subquery
+
+
+def point_enrollments(apps, schema_editor):
+    # same as courses.progress.repoint_enrollments, on the historical models
+    Enrollment = apps.get_model('courses', 'Enrollment')
+    Lesson = apps.get_model('courses', 'Lesson')
+    LessonCompletion = apps.get_model('courses', 'LessonCompletion')
+
+    completions = LessonCompletion.objects.filter(enrollment=OuterRef(OuterRef('pk')), lesson=OuterRef('pk'))
+    remaining = (Lesson.objects.filter(module__course_id=OuterRef('course_id')).filter(~Exists(completions))
+                 .order_by('module__order', 'order', 'id').values('pk')[:1])
+    Enrollment.objects.filter(is_completed=False).update(next_lesson=Subquery(remaining))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0014_course_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrollment',
+            name='next_lesson',
+            field=models.ForeignKey(blank=True, editable=False, help_text='Where to continue; moved forward as lessons are completed (courses/progress.py)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='courses.lesson'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['student', '-enrolled_at', '-id'], name='enrollment_student_feed_idx'),
+        ),
+        migrations.RunPython(point_enrollments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:07
+
+import courses.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0015_enrollment_next_lesson'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='lease_until',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Set while a chunk request writes at the current offset', null=True),
+        ),
+        migrations.AlterField(
+            model_name='course',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='courses/thumbnails/', validators=[courses.validators.validate_image_size, courses.validators.validate_image_file]),
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='profile_picture',
+            field=models.ImageField(blank=True, help_text='Profile picture', null=True, upload_to='profiles/', validators=[courses.validators.validate_image_size, courses.validators.validate_image_file]),
+        ),
+        migrations.AlterField(
+            model_name='lesson',
+            name='document_file',
+            field=models.FileField(blank=True, help_text='PDF, DOCX, etc.', null=True, upload_to='lessons/documents/', validators=[courses.validators.validate_document_size, courses.validators.validate_document_file]),
+        ),
+    ]
@@ -1,6 +1,23 @@
+import uuid
 from django.db import models
+from django.db.models.functions import Lower
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
-from .validators import validate_file_size, validate_image_file, validate_video_url, validate_document_file
+from .validators import validate_image_size, validate_document_size, validate_image_file, validate_video_url, validate_document_file
+
+class CounterFieldsMixin:
+    # Fields maintained with atomic F() updates. A plain save() of an instance that
+    # was loaded earlier would write back stale values, so they are skipped unless
+    # named in update_fields.
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and self.counter_fields:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
 
 class CustomUser(AbstractUser):
     ROLE_CHOICES = (
@@ -12,21 +29,70 @@ class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='STUDENT')
     bio = models.TextField(blank=True, null=True, help_text='Short bio about yourself')
-    profile_picture = models.ImageField(upload_to='profiles/', blank=True, null=True, help_text='Profile picture', validators=[validate_file_size, validate_image_file])
+    profile_picture = models.ImageField(upload_to='profiles/', blank=True, null=True, help_text='Profile picture', validators=[validate_image_size, validate_image_file])
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False, help_text='Resized copies (courses/variants.py)')
+    token_version = models.PositiveIntegerField(default=0, editable=False, help_text='Bumped to revoke issued tokens')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
 
+    # carried as token claims (see courses.authentication); changing one revokes issued tokens
+    AUTH_STATE_FIELDS = ('role', 'is_active', 'is_staff', 'is_superuser')
+    # shown as the instructor in course trees and catalog rows (courses.encoders)
+    PUBLIC_FIELDS = ('email', 'username', 'first_name', 'last_name', 'role', 'bio', 'profile_picture')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._auth_state = instance.auth_state()
+        instance._public_state = instance.public_state()
+        return instance
+
+    def auth_state(self):
+        # read __dict__ so deferred fields are not loaded just to compare them
+        return tuple(self.__dict__.get(field) for field in self.AUTH_STATE_FIELDS)
+
+    def public_state(self):
+        # file names, not FieldFiles, which are changed in place by save()
+        return tuple(getattr(value, 'name', value) for value in (self.__dict__.get(field) for field in self.PUBLIC_FIELDS))
+
+    def save(self, *args, **kwargs):
+        loaded_state = getattr(self, '_auth_state', None)
+        self._auth_changed = loaded_state is not None and loaded_state != self.auth_state()
+        loaded_public = getattr(self, '_public_state', None)
+        self._public_changed = loaded_public is None or loaded_public != self.public_state()
+
+        if self._auth_changed:
+            self.token_version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'token_version'}
+
+        super().save(*args, **kwargs)
+        self._auth_state = self.auth_state()
+        self._public_state = self.public_state()
+
     def __str__(self):
         return self.email
     
     def get_fullname(self):
         return f'{self.first_name} {self.last_name}'
+
+    def get_profile(self):
+        # profiles are created on first write; until then an unsaved one with
+        # default values stands in (no query when loaded with select_related)
+        try:
+            return self.profile
+        except UserProfile.DoesNotExist:
+            return UserProfile(user=self)
     
     class Meta:
         db_table = 'users'
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+        indexes = [
+            # case-insensitive email lookups (courses.enrollment)
+            models.Index(Lower('email'), name='user_email_lower_idx'),
+        ]
     
 class UserProfile(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='profile')
@@ -54,7 +120,7 @@ class Category(models.Model):
     def __str__(self):
         return self.name
     
-class Course(models.Model):
+class Course(CounterFieldsMixin, models.Model):
     LEVEL_CHOICES = (
         ('BEGINNER', 'Beginner'),
         ('INTERMEDIATE', 'Intermediate'),
@@ -64,7 +130,8 @@ class Course(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True, max_length=200)
     description = models.TextField()
-    thumbnail = models.ImageField(upload_to='courses/thumbnails/', blank=True, null=True, validators=[validate_file_size, validate_image_file])
+    thumbnail = models.ImageField(upload_to='courses/thumbnails/', blank=True, null=True, validators=[validate_image_size, validate_image_file])
+    thumbnail_variants = models.JSONField(default=dict, blank=True, editable=False, help_text='Resized copies (courses/variants.py)')
 
     instructor = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='courses')
     category = models.ForeignKey(Category, on_delete=models.PROTECT, related_name='courses')
@@ -73,15 +140,48 @@ class Course(models.Model):
     level = models.CharField(max_length=20, choices=LEVEL_CHOICES, default='BEGINNER')
     duration = models.IntegerField(blank=True, null=True, help_text='Duration in minutes')
     is_published = models.BooleanField(default=False)
+    lesson_count = models.PositiveIntegerField(default=0, editable=False, help_text='Maintained by lesson signals')
+
+    counter_fields = ('lesson_count',)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # keyset pagination: (filter, -created_at, -id); the published catalog uses a
+            # partial index since sqlite cannot seek on a bare boolean column
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(is_published=True), name='course_published_created_idx'),
+            models.Index(fields=['instructor', '-created_at', '-id'], name='course_instructor_created_idx'),
+            # catalog filters and the (category, level) facet aggregate
+            models.Index(fields=['category', 'level'], condition=models.Q(is_published=True), name='course_published_facet_idx'),
+            models.Index(fields=['level', 'price'], condition=models.Q(is_published=True), name='course_published_level_idx'),
+            models.Index(fields=['price'], condition=models.Q(is_published=True), name='course_published_price_idx'),
+            models.Index(fields=['duration'], condition=models.Q(is_published=True), name='course_published_duration_idx'),
+        ]
         verbose_name = 'Course'
         verbose_name_plural = 'Courses'
 
+    # the category list's published counts depend on these (courses.categories)
+    LISTING_FIELDS = ('category_id', 'is_published')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._listing_state = instance.listing_state()
+        return instance
+
+    def listing_state(self):
+        return tuple(self.__dict__.get(field) for field in self.LISTING_FIELDS)
+
+    def save(self, *args, **kwargs):
+        loaded_state = getattr(self, '_listing_state', None)
+        self._listing_changed = loaded_state is None or loaded_state != self.listing_state()
+
+        super().save(*args, **kwargs)
+        self._listing_state = self.listing_state()
+
     def __str__(self):
         return self.title
     
@@ -114,7 +214,7 @@ class Lesson(models.Model):
     order = models.IntegerField()
     
     video_url = models.URLField(blank=True, null=True, help_text='YouTube or Vimeo URL', validators=[validate_video_url])
-    document_file = models.FileField(upload_to='lessons/documents/',blank=True, null=True, help_text='PDF, DOCX, etc.', validators=[validate_file_size, validate_document_file])
+    document_file = models.FileField(upload_to='lessons/documents/',blank=True, null=True, help_text='PDF, DOCX, etc.', validators=[validate_document_size, validate_document_file])
 
     duration = models.IntegerField(blank=True, null=True, help_text='Duration in minutes')
     is_preview = models.BooleanField(default=False, help_text='Can non-enrolled students view this lesson?')
@@ -125,20 +225,57 @@ class Lesson(models.Model):
         verbose_name = 'Lesson'
         verbose_name_plural = 'Lessons'
 
+    # CourseStats.total_duration follows these (courses.stats)
+    STATS_FIELDS = ('module_id', 'duration')
+    # the course's search document is built from these (courses.search)
+    SEARCH_FIELDS = ('module_id', 'order', 'title', 'content')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stats_state = instance.stats_state()
+        instance._search_state = instance.search_state()
+        return instance
+
+    def stats_state(self):
+        return tuple(self.__dict__.get(field) for field in self.STATS_FIELDS)
+
+    def search_state(self):
+        return tuple(self.__dict__.get(field) for field in self.SEARCH_FIELDS)
+
+    def save(self, *args, **kwargs):
+        # (module_id, duration) as last saved, or None for new and hand-built instances
+        self._saved_stats_state = getattr(self, '_stats_state', None)
+        loaded_search = getattr(self, '_search_state', None)
+        self._search_changed = loaded_search is None or loaded_search != self.search_state()
+        super().save(*args, **kwargs)
+        self._stats_state = self.stats_state()
+        self._search_state = self.search_state()
+
     def __str__(self):
         return f'{self.module.title} - {self.title}'
     
-class Enrollment(models.Model):
+class Enrollment(CounterFieldsMixin, models.Model):
     student = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='enrollments', limit_choices_to={'role': 'STUDENT'})
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='enrollments')
     enrolled_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(blank=True, null=True)
     progress_percentage = models.FloatField(default=0.0)
     is_completed = models.BooleanField(default=False)
+    completed_lessons = models.PositiveIntegerField(default=0, editable=False)
+    next_lesson = models.ForeignKey('Lesson', on_delete=models.SET_NULL, blank=True, null=True, editable=False, related_name='+',
+                                    help_text='Where to continue; moved forward as lessons are completed (courses/progress.py)')
+
+    counter_fields = ('completed_lessons', 'progress_percentage', 'is_completed', 'completed_at', 'next_lesson')
 
     class Meta:
         ordering = ['-enrolled_at']
         unique_together = ['student', 'course']
+        indexes = [
+            models.Index(fields=['-enrolled_at', '-id'], name='enrollment_enrolled_idx'),
+            # a student's own feed, newest first (/api/me/enrollments/)
+            models.Index(fields=['student', '-enrolled_at', '-id'], name='enrollment_student_feed_idx'),
+        ]
         verbose_name = 'Enrollment'
         verbose_name_plural = 'Enrollments'
 
@@ -146,4 +283,102 @@ class Enrollment(models.Model):
         return f"{self.student.get_full_name()} enrolled in {self.course.title}"
     
     def calculate_progress(self):
-        pass
\ No newline at end of file
+        # full recount, for repairs; lesson completions go through courses.progress
+        total = Lesson.objects.filter(module__course_id=self.course_id).count()
+        self.completed_lessons = self.completions.count()
+        self.progress_percentage = min(self.completed_lessons * 100.0 / total, 100.0) if total else 0.0
+
+        was_completed = self.is_completed
+        self.is_completed = total > 0 and self.completed_lessons >= total
+
+        if self.is_completed and not was_completed:
+            self.completed_at = timezone.now()
+        elif not self.is_completed:
+            self.completed_at = None
+
+        return self.progress_percentage
+
+class LessonCompletion(models.Model):
+    enrollment = models.ForeignKey(Enrollment, on_delete=models.CASCADE, related_name='completions')
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='completions')
+    completed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['enrollment', 'lesson']
+        verbose_name = 'Lesson Completion'
+        verbose_name_plural = 'Lesson Completions'
+
+    def __str__(self):
+        return f'{self.enrollment} - {self.lesson.title}'
+
+class ChunkedUpload(models.Model):
+    TARGET_CHOICES = (
+        ('lesson.document_file', 'Lesson document'),
+        ('course.thumbnail', 'Course thumbnail'),
+        ('user.profile_picture', 'Profile picture'),
+    )
+
+    STATUS_CHOICES = (
+        ('UPLOADING', 'Uploading'),
+        ('COMPLETE', 'Complete'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='uploads')
+    target = models.CharField(max_length=30, choices=TARGET_CHOICES)
+    object_id = models.PositiveBigIntegerField(help_text='Lesson, course or user the file is attached to')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField(help_text='Declared total size in bytes')
+    received = models.PositiveBigIntegerField(default=0, help_text='Bytes stored so far; the next chunk starts here')
+    lease_until = models.DateTimeField(blank=True, null=True, editable=False, help_text='Set while a chunk request writes at the current offset')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='UPLOADING')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Chunked Upload'
+        verbose_name_plural = 'Chunked Uploads'
+
+    def __str__(self):
+        return f'{self.filename} ({self.received}/{self.size})'
+
+class CourseStats(models.Model):
+    # Denormalized per-course aggregates for list pages. Kept current with F()
+    # updates from signals (courses/stats.py); reconcile_course_stats repairs drift.
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    module_count = models.PositiveIntegerField(default=0)
+    total_duration = models.IntegerField(default=0, help_text='Sum of lesson durations in minutes')
+    enrollment_count = models.PositiveIntegerField(default=0)
+    completed_count = models.PositiveIntegerField(default=0, help_text='Enrollments with is_completed')
+    reconciled_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'Course Stats'
+        verbose_name_plural = 'Course Stats'
+
+    def __str__(self):
+        return f'Stats for course {self.course_id}'
+
+    @property
+    def completion_rate(self):
+        return round(self.completed_count / self.enrollment_count, 4) if self.enrollment_count else 0.0
+
+class CourseDailyStats(models.Model):
+    # Per-course, per-day counts behind the instructor dashboard (courses/analytics.py).
+    # Updated incrementally as enrollments happen and, through a buffer flushed
+    # every few seconds, as lessons are completed; the backfill_course_analytics
+    # command rebuilds them from history.
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    enrollments = models.PositiveIntegerField(default=0)
+    started = models.PositiveIntegerField(default=0, help_text='Enrollments whose first lesson was completed that day')
+    completions = models.PositiveIntegerField(default=0, help_text='Enrollments completed that day')
+    lessons_completed = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['course', 'date']
+        verbose_name = 'Course Daily Stats'
+        verbose_name_plural = 'Course Daily Stats'
+
+    def __str__(self):
+        return f'Stats for course {self.course_id} on {self.date}'
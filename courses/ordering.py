@@ -0,0 +1,76 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from rest_framework.exceptions import ValidationError
+
+# Bulk reordering for modules and lessons.
+#
+# Both models are unique on (parent, order), and the database checks that per
+# row while an UPDATE runs, so rewriting orders in place collides.
+# reorder_siblings() applies a whole new ordering in two UPDATEs whatever the
+# number of rows: first every sibling is parked on a distinct value below
+# anything in use, then each is moved to its final position. Positions are
+# spaced ORDER_GAP apart, which lets move_sibling() place a single row between
+# two neighbours by touching only that row; only when a gap is used up are the
+# siblings spread out again.
+
+ORDER_GAP = 1024
+
+def reorder_siblings(siblings, ids):
+    # siblings: every row sharing the parent; ids: their pks in the new order
+    with transaction.atomic():
+        current = dict(siblings.values_list('pk', 'order'))
+
+        if len(set(ids)) != len(ids):
+            raise ValidationError({'ids': 'Each id may only appear once.'})
+        if set(ids) != set(current):
+            raise ValidationError({'ids': 'Must list every item exactly once: '
+                                          f'missing {sorted(set(current) - set(ids))}, unknown {sorted(set(ids) - set(current))}.'})
+
+        if ids:
+            renumber(siblings, ids, min(current.values()))
+
+    return {pk: (position + 1) * ORDER_GAP for position, pk in enumerate(ids)}
+
+def renumber(siblings, ids, lowest):
+    # parked values are all negative and below the lowest order in use, final
+    # ones all positive, so no statement ever produces a duplicate mid-way
+    base = min(lowest, 0) - len(ids) - 1
+    siblings.update(order=Case(*[When(pk=pk, then=Value(base + position)) for position, pk in enumerate(ids, 1)],
+                               output_field=IntegerField()))
+    siblings.update(order=(F('order') - base) * ORDER_GAP)
+
+def move_sibling(siblings, pk, after=None):
+    # put pk right after the sibling `after` (first when None); returns its new order
+    with transaction.atomic():
+        others = siblings.exclude(pk=pk)
+
+        if after is None:
+            lower = None
+            upper = others.order_by('order').values_list('order', flat=True).first()
+        else:
+            lower = others.filter(pk=after).values_list('order', flat=True).first()
+            if lower is None:
+                raise ValidationError({'after': f'{after} is not a sibling of {pk}.'})
+            upper = others.filter(order__gt=lower).order_by('order').values_list('order', flat=True).first()
+
+        if lower is None and upper is None:
+            return siblings.filter(pk=pk).values_list('order', flat=True).first()
+        if lower is None:
+            order = upper - ORDER_GAP
+        elif upper is None:
+            order = lower + ORDER_GAP
+        elif upper - lower > 1:
+            order = (lower + upper) // 2
+        else:
+            # no room left between the neighbours: spread every sibling out again
+            ids = list(others.order_by('order').values_list('pk', flat=True))
+            ids.insert(ids.index(after) + 1, pk)
+            return reorder_siblings(siblings, ids)[pk]
+
+        try:
+            with transaction.atomic():
+                siblings.filter(pk=pk).update(order=order)
+        except IntegrityError:
+            # another move took the same slot first
+            raise ValidationError({'after': 'The ordering changed while moving; reload and try again.'})
+        return order
@@ -0,0 +1,205 @@
+import base64
+import json
+from collections import OrderedDict
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+# Keyset (seek) pagination.
+#
+# Pages are addressed by the ordering values of the last row seen instead of an
+# OFFSET, so page N costs the same index seek as page 1 and no COUNT(*) is run.
+# The ordering always ends in a unique column (id) to break ties, and each
+# viewset picks the subclass whose ordering matches one of its composite indexes.
+
+class KeysetPagination(BasePagination):
+    ordering = ('-id',)
+    page_size = api_settings.PAGE_SIZE or 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    approximate_count_limit = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset, page = self.page_queryset(queryset, request)
+        self.count = self.get_count(queryset, request)
+        return self.page_rows(list(page))
+
+    def page_queryset(self, queryset, request):
+        # (ordered queryset, sliced page query past the cursor)
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+
+        self.cursor = self.decode_cursor(request)
+        self.reverse = bool(self.cursor and self.cursor.get('r'))
+        ordering = self.reversed_ordering() if self.reverse else self.ordering
+
+        queryset = queryset.order_by(*ordering)
+        page = queryset
+
+        if self.cursor:
+            page = page.filter(self.seek_filter(ordering, self.cursor['v']))
+
+        return queryset, page[:self.page_size + 1]
+
+    def page_rows(self, rows):
+        self.has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if self.reverse:
+            rows.reverse()
+
+        self.has_next = self.has_more if not self.reverse else True
+        self.has_previous = bool(self.cursor) if not self.reverse else self.has_more
+        self.rows = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        payload = [('next', self.get_next_link()), ('previous', self.get_previous_link())]
+
+        if self.count is not None:
+            payload.append(('count', self.count))
+        payload.append(('results', data))
+
+        return Response(OrderedDict(payload))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'object', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        return max(1, min(size, self.max_page_size))
+
+    # ordering
+
+    def field_names(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def reversed_ordering(self):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering)
+
+    def seek_filter(self, ordering, values):
+        # (a, b, id) > (x, y, z) expanded for mixed directions:
+        # a >= x AND (a > x OR (a = x AND b > y) OR (a = x AND b = y AND id > z))
+        # the redundant leading bound is what lets the database seek the index
+        condition = Q()
+        equal = {}
+
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+
+        first = ordering[0]
+        return Q(**{f'{first.lstrip("-")}__{"lte" if first.startswith("-") else "gte"}': values[0]}) & condition
+
+    # cursors
+
+    def encode_cursor(self, row, reverse=False):
+        values = []
+
+        for name in self.field_names():
+            value = getattr(row, self.model._meta.get_field(name).attname)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+
+        payload = {'v': values}
+        if reverse:
+            payload['r'] = 1
+
+        return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+
+        if not encoded:
+            return None
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            names = self.field_names()
+
+            if not isinstance(payload['v'], list) or len(payload['v']) != len(names):
+                raise ValueError
+            # seek values are plain scalars; None would reach the keyset filter
+            if not all(isinstance(value, (str, int, float)) for value in payload['v']):
+                raise ValueError
+
+            payload['v'] = [self.model._meta.get_field(name).to_python(value) for name, value in zip(names, payload['v'])]
+            if None in payload['v']:
+                raise ValueError
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return payload
+
+    def get_next_link(self):
+        if not self.has_next or not self.rows:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.rows[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.rows:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.rows[0], reverse=True))
+
+    # counts
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+
+        if mode == 'exact':
+            return {'value': queryset.count(), 'exact': True}
+        if mode == 'approx':
+            return approximate_count(queryset, self.approximate_count_limit)
+        return None
+
+def approximate_count(queryset, limit=1000):
+    # PostgreSQL: the planner's row estimate, no scan at all.
+    # Elsewhere: count at most `limit` rows and report whether the count is exact.
+    connection = connections[queryset.db]
+
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return {'value': int(plan[0]['Plan']['Plan Rows']), 'exact': False}
+
+    value = queryset.order_by()[:limit + 1].count()
+    return {'value': min(value, limit), 'exact': value <= limit}
+
+class CourseKeysetPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+class LessonKeysetPagination(KeysetPagination):
+    ordering = ('module_id', 'order', 'id')
+
+class EnrollmentKeysetPagination(KeysetPagination):
+    ordering = ('-enrolled_at', '-id')
@@ -11,4 +11,4 @@ class IsInstructorOrReadOnly(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
         
-        return obj.instructor == request.user
\ No newline at end of file
+        return obj.instructor_id == request.user.pk
\ No newline at end of file
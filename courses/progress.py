@@ -0,0 +1,134 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, Exists, F, FloatField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Least
+from django.utils import timezone
+from .models import Course, Enrollment, Lesson, LessonCompletion
+from .stats import adjust_course_stats, reconcile_course_stats
+from .analytics import buffer_activity
+
+# Incremental progress tracking.
+#
+# Completing a lesson is one INSERT into LessonCompletion plus one UPDATE of the
+# enrollment using F() expressions against the course's cached lesson_count, so the
+# cost does not depend on course size and concurrent completions cannot lose
+# increments. When the course structure changes, recompute_progress() brings the
+# counters back in line with set-based UPDATEs.
+#
+# The same UPDATE moves Enrollment.next_lesson, the "continue where you left
+# off" pointer, to the next unfinished lesson after the one just completed, so
+# the student feed reads it with a join instead of searching each course for
+# unfinished lessons. Deleting lessons repoints a course's enrollments once, when
+# the delete commits.
+
+PROGRESS_FIELDS = ['completed_lessons', 'progress_percentage', 'is_completed', 'completed_at']
+
+LESSON_ORDER = ('module__order', 'order', 'id')
+
+def course_lessons():
+    # lessons of the outer enrollment's course, in course order
+    return Lesson.objects.filter(module__course_id=OuterRef('course_id')).order_by(*LESSON_ORDER)
+
+def remaining_lessons():
+    # course_lessons() the outer enrollment has not completed
+    completions = LessonCompletion.objects.filter(enrollment=OuterRef(OuterRef('pk')), lesson=OuterRef('pk'))
+    return course_lessons().filter(~Exists(completions))
+
+def first_remaining_lesson():
+    return Subquery(remaining_lessons().values('pk')[:1])
+
+def lesson_after(lesson_id):
+    # an index seek from the lesson's position to the next unfinished one; only
+    # after the last lesson is the course searched for one the enrollment skipped
+    current = Lesson.objects.filter(pk=lesson_id)
+    module_order = Subquery(current.values('module__order')[:1])
+    order = Subquery(current.values('order')[:1])
+
+    following = remaining_lessons().filter(Q(module__order__gt=module_order) | Q(module__order=module_order, order__gt=order))
+    return Coalesce(Subquery(following.values('pk')[:1]), first_remaining_lesson())
+
+def repoint_enrollments(enrollments):
+    # new enrollments, and those whose next lesson was deleted, continue from
+    # their first unfinished lesson
+    return enrollments.filter(next_lesson__isnull=True, is_completed=False).update(next_lesson=first_remaining_lesson())
+
+def repoint_course_on_commit(course_id):
+    # once per course and transaction, however many of its lessons are deleted
+    connection = transaction.get_connection()
+    pending = connection.__dict__.setdefault('pending_repoints', {})
+    callback = pending.get(course_id)
+
+    # a callback dropped by a rollback no longer counts
+    if callback is not None and any(func is callback for _, func, _ in connection.run_on_commit):
+        return
+
+    def callback():
+        pending.pop(course_id, None)
+        repoint_enrollments(Enrollment.objects.filter(course_id=course_id))
+
+    pending[course_id] = callback
+    transaction.on_commit(callback)
+
+def complete_lesson(enrollment, lesson_id, lesson_count):
+    try:
+        with transaction.atomic():
+            LessonCompletion.objects.create(enrollment=enrollment, lesson_id=lesson_id)
+    except IntegrityError:
+        # already completed
+        return False
+
+    was_completed = enrollment.is_completed
+    was_started = enrollment.completed_lessons > 0
+    completed = F('completed_lessons') + 1
+    finished = Q(completed_lessons__gte=lesson_count - 1) if lesson_count else Q(pk__in=[])
+
+    Enrollment.objects.filter(pk=enrollment.pk).update(
+        completed_lessons=completed,
+        progress_percentage=Least(completed * 100.0 / max(lesson_count, 1), Value(100.0), output_field=FloatField()),
+        is_completed=Case(When(finished, then=Value(True)), default=F('is_completed')),
+        completed_at=Case(When(finished & Q(completed_at__isnull=True), then=Value(timezone.now())), default=F('completed_at')),
+        next_lesson=Case(When(finished, then=Value(None)), default=lesson_after(lesson_id)),
+    )
+    enrollment.refresh_from_db(fields=PROGRESS_FIELDS)
+
+    finished_now = enrollment.is_completed and not was_completed
+    if finished_now:
+        adjust_course_stats(enrollment.course_id, completed_count=1)
+    buffer_activity(enrollment.course_id, lessons_completed=1, started=int(not was_started), completions=int(finished_now))
+    return True
+
+def recompute_lesson_counts(courses=None):
+    courses = Course.objects.all() if courses is None else courses
+    lessons = Lesson.objects.filter(module__course=OuterRef('pk')).order_by().values('module__course').annotate(total=Count('id')).values('total')
+    return courses.update(lesson_count=Coalesce(Subquery(lessons), 0))
+
+def recompute_progress(courses=None):
+    # Set-based UPDATEs only: lesson counts per course, then every enrollment's
+    # counters from its completions. No per-row Python work.
+    courses = Course.objects.all() if courses is None else courses
+    recompute_lesson_counts(courses)
+
+    completions = LessonCompletion.objects.filter(enrollment=OuterRef('pk')).order_by().values('enrollment').annotate(total=Count('id')).values('total')
+    enrollments = Enrollment.objects.filter(course__in=courses.values('pk'))
+    enrollments.update(completed_lessons=Coalesce(Subquery(completions), 0))
+
+    # joined columns cannot be referenced in UPDATE ... SET, hence the subquery
+    lesson_count = Subquery(Course.objects.filter(pk=OuterRef('course_id')).values('lesson_count')[:1])
+    finished = Q(completed_lessons__gte=lesson_count) & Q(completed_lessons__gt=0)
+
+    updated = enrollments.update(
+        progress_percentage=Case(
+            When(completed_lessons=0, then=Value(0.0)),
+            default=Least(F('completed_lessons') * 100.0 / lesson_count, Value(100.0), output_field=FloatField()),
+            output_field=FloatField(),
+        ),
+        is_completed=Case(When(finished, then=Value(True)), default=Value(False)),
+        completed_at=Case(
+            When(finished & Q(completed_at__isnull=True), then=Value(timezone.now())),
+            When(finished, then=F('completed_at')),
+            default=Value(None),
+        ),
+    )
+    # completion flags may have moved in bulk; the daily rollups are left to
+    # backfill_course_analytics
+    reconcile_course_stats(courses)
+    return updated
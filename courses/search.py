@@ -0,0 +1,385 @@
+import bisect
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.html import escape
+from .models import Course, Lesson
+
+# Course search.
+#
+# Each course is indexed as one document made of its title, description and the
+# titles and text of all its lessons. On sqlite the index is an FTS5 virtual table
+# living next to the data (created by migration 0006), so course-level index
+# writes share the caller's transaction; lesson and module changes reindex once
+# per course after the commit (index_course_on_commit). Anywhere else an in-process inverted index is used, built
+# lazily from the database and kept current by the model signals.
+#
+# Both backends rank with BM25 (title > description > lessons), treat the last
+# query term as a prefix, and return facet counts and highlighted snippets.
+# Snippets are HTML: the course text is escaped and only the <mark> tags around
+# matched terms are markup.
+#
+# The in-process index belongs to one worker process: other processes only see a
+# change after they rebuild (e.g. restart), since each updates its own index from
+# its own commits. Use it for development and single-process deployments only;
+# multi-worker servers need the database-backed FTS5 index.
+
+FIELD_WEIGHTS = {'title': 10.0, 'description': 3.0, 'lessons': 1.0}
+HIGHLIGHT = ('<mark>', '</mark>')
+# FTS5 marks matches with these control characters, which escape() leaves alone
+FTS_MARKERS = ('\x02', '\x03')
+SNIPPET_TOKENS = 16
+
+TOKEN_RE = re.compile(r'\w+')
+
+def tokenize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return TOKEN_RE.findall(text.lower())
+
+DOCUMENT_FIELDS = ('id', 'title', 'description', 'category_id', 'level', 'is_published')
+
+def course_documents(course_ids=None):
+    courses = Course.objects.all()
+    lessons = Lesson.objects.order_by('module__course_id', 'module__order', 'order')
+
+    if course_ids is not None:
+        courses = courses.filter(pk__in=course_ids)
+        lessons = lessons.filter(module__course_id__in=course_ids)
+
+    documents = {course['id']: {**course, 'lessons': []} for course in courses.values(*DOCUMENT_FIELDS)}
+
+    for course_id, title, content in lessons.values_list('module__course_id', 'title', 'content').iterator():
+        documents[course_id]['lessons'].append(f'{title} {content or ""}')
+
+    for document in documents.values():
+        document['lessons'] = '\n'.join(document['lessons'])
+    return list(documents.values())
+
+def course_document(course_id):
+    documents = course_documents([course_id])
+    return documents[0] if documents else None
+
+def highlight_markers(text):
+    text = escape(text or '').replace(FTS_MARKERS[0], HIGHLIGHT[0])
+    return text.replace(FTS_MARKERS[1], HIGHLIGHT[1])
+
+class SearchResult:
+    def __init__(self, total, hits, facets):
+        self.total = total
+        # [(course_id, score, snippet)], best first
+        self.hits = hits
+        self.facets = facets
+
+class FTS5Backend:
+    table = 'course_search'
+
+    def index_course(self, course_id):
+        document = course_document(course_id)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [course_id])
+
+            if document is not None:
+                cursor.execute(
+                    f'INSERT INTO {self.table} (rowid, title, description, lessons, category_id, level, is_published) '
+                    'VALUES (%s, %s, %s, %s, %s, %s, %s)',
+                    [document['id'], document['title'], document['description'], document['lessons'],
+                     document['category_id'], document['level'], int(document['is_published'])],
+                )
+
+    def update_course(self, course):
+        # course-level edits leave the lesson text alone, so skip re-reading it
+        values = [course.title, course.description, course.category_id, course.level, int(course.is_published)]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {self.table} SET title = %s, description = %s, category_id = %s, level = %s, is_published = %s WHERE rowid = %s',
+                [*values, course.pk],
+            )
+            if cursor.rowcount == 0:
+                cursor.execute(
+                    f'INSERT INTO {self.table} (rowid, title, description, lessons, category_id, level, is_published) '
+                    "VALUES (%s, %s, %s, '', %s, %s, %s)",
+                    [course.pk, *values],
+                )
+
+    def remove_course(self, course_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [course_id])
+
+    def rebuild(self):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(REBUILD_FTS_SQL)
+
+    def match_expression(self, terms):
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def search(self, terms, category=None, level=None, limit=20, offset=0):
+        match = self.match_expression(terms)
+        where = f'{self.table} MATCH %s AND is_published = 1'
+        params = [match]
+
+        with connection.cursor() as cursor:
+            # both facets from one grouped scan of the matches
+            facets = {'category_id': Counter(), 'level': Counter()}
+            cursor.execute(f'SELECT category_id, level, COUNT(*) FROM {self.table} WHERE {where} GROUP BY category_id, level', params)
+            for category_id, course_level, count in cursor.fetchall():
+                facets['category_id'][category_id] += count
+                facets['level'][course_level] += count
+
+            filters = ''
+            filter_params = []
+            if category is not None:
+                filters += ' AND category_id = %s'
+                filter_params.append(category)
+            if level is not None:
+                filters += ' AND level = %s'
+                filter_params.append(level)
+
+            weights = ', '.join(str(weight) for weight in FIELD_WEIGHTS.values())
+            cursor.execute(
+                f'SELECT rowid, -bm25({self.table}, {weights}) AS score, '
+                f'snippet({self.table}, -1, %s, %s, %s, {SNIPPET_TOKENS}) '
+                f'FROM {self.table} WHERE {where}{filters} ORDER BY score DESC LIMIT %s OFFSET %s',
+                [*FTS_MARKERS, '…', *params, *filter_params, limit, offset],
+            )
+            hits = [(row[0], row[1], highlight_markers(row[2])) for row in cursor.fetchall()]
+
+            if category is None and level is None:
+                total = sum(facets['category_id'].values())
+            else:
+                cursor.execute(f'SELECT COUNT(*) FROM {self.table} WHERE {where}{filters}', [*params, *filter_params])
+                total = cursor.fetchone()[0]
+
+        return SearchResult(total, hits, {'category': dict(facets['category_id']), 'level': dict(facets['level'])})
+
+class InMemoryBackend:
+    # per process, see the module comment
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self.postings = defaultdict(dict)  # term -> {course_id: (tf per field)}
+        self.documents = {}  # course_id -> document dict with per-field tokens
+        self.field_totals = Counter()
+        self._sorted_terms = None
+
+    def ensure_loaded(self):
+        if self._loaded:
+            return
+
+        with self._lock:
+            if not self._loaded:
+                for document in course_documents():
+                    self._add(document)
+                self._loaded = True
+
+    def index_course(self, course_id):
+        transaction.on_commit(lambda: self._reindex(course_id))
+
+    def update_course(self, course):
+        self.index_course(course.pk)
+
+    def remove_course(self, course_id):
+        transaction.on_commit(lambda: self._reindex(course_id))
+
+    def rebuild(self):
+        with self._lock:
+            self.postings.clear()
+            self.documents.clear()
+            self.field_totals.clear()
+            self._sorted_terms = None
+            self._loaded = False
+        self.ensure_loaded()
+
+    def _reindex(self, course_id):
+        if not self._loaded:
+            return
+
+        with self._lock:
+            self._remove(course_id)
+            document = course_document(course_id)
+            if document is not None:
+                self._add(document)
+
+    def _add(self, document):
+        tokens = {field: tokenize(document[field]) for field in FIELD_WEIGHTS}
+        document['tokens'] = tokens
+
+        counts = defaultdict(lambda: [0] * len(FIELD_WEIGHTS))
+        for position, field in enumerate(FIELD_WEIGHTS):
+            self.field_totals[field] += len(tokens[field])
+            for token in tokens[field]:
+                counts[token][position] += 1
+
+        for term, frequencies in counts.items():
+            self.postings[term][document['id']] = tuple(frequencies)
+
+        self.documents[document['id']] = document
+        self._sorted_terms = None
+
+    def _remove(self, course_id):
+        document = self.documents.pop(course_id, None)
+
+        if document is None:
+            return
+
+        for field, tokens in document['tokens'].items():
+            self.field_totals[field] -= len(tokens)
+            for term in set(tokens):
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(course_id, None)
+                    if not postings:
+                        del self.postings[term]
+
+        self._sorted_terms = None
+
+    def expand(self, prefix):
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self.postings)
+
+        start = bisect.bisect_left(self._sorted_terms, prefix)
+        end = bisect.bisect_left(self._sorted_terms, prefix + '￿')
+        return self._sorted_terms[start:end]
+
+    def search(self, terms, category=None, level=None, limit=20, offset=0):
+        self.ensure_loaded()
+
+        with self._lock:
+            groups = [[term] for term in terms[:-1]] + [self.expand(terms[-1])]
+            total_docs = max(len(self.documents), 1)
+            averages = [max(self.field_totals[field] / total_docs, 1) for field in FIELD_WEIGHTS]
+
+            scores = None
+            for group in groups:
+                group_scores = defaultdict(float)
+                for term in group:
+                    postings = self.postings.get(term, {})
+                    idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+
+                    for course_id, frequencies in postings.items():
+                        if self.documents[course_id]['is_published']:
+                            group_scores[course_id] += idf * self.term_weight(course_id, frequencies, averages)
+
+                if scores is None:
+                    scores = group_scores
+                else:
+                    scores = {course_id: score + group_scores[course_id] for course_id, score in scores.items() if course_id in group_scores}
+
+            scores = scores or {}
+            facets = {'category': Counter(), 'level': Counter()}
+            matches = []
+
+            for course_id, score in scores.items():
+                document = self.documents[course_id]
+                facets['category'][document['category_id']] += 1
+                facets['level'][document['level']] += 1
+
+                if (category is None or document['category_id'] == category) and (level is None or document['level'] == level):
+                    matches.append((course_id, score))
+
+            matches.sort(key=lambda match: (-match[1], match[0]))
+            hits = [(course_id, score, self.snippet(course_id, groups)) for course_id, score in matches[offset:offset + limit]]
+
+        return SearchResult(len(matches), hits, {name: dict(counts) for name, counts in facets.items()})
+
+    def term_weight(self, course_id, frequencies, averages):
+        document = self.documents[course_id]
+        weight = 0.0
+
+        for position, (field, field_weight) in enumerate(FIELD_WEIGHTS.items()):
+            tf = frequencies[position]
+            if tf:
+                norm = 1 - self.b + self.b * len(document['tokens'][field]) / averages[position]
+                weight += field_weight * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        return weight
+
+    def snippet(self, course_id, groups):
+        matched = {term for group in groups for term in group}
+        document = self.documents[course_id]
+
+        for field in FIELD_WEIGHTS:
+            words = (document[field] or '').split()
+            for index, word in enumerate(words):
+                if any(token in matched for token in tokenize(word)):
+                    start = max(0, index - SNIPPET_TOKENS // 4)
+                    window = words[start:start + SNIPPET_TOKENS]
+                    text = ' '.join(
+                        f'{HIGHLIGHT[0]}{escape(w)}{HIGHLIGHT[1]}' if any(token in matched for token in tokenize(w)) else escape(w)
+                        for w in window
+                    )
+                    prefix = '…' if start > 0 else ''
+                    suffix = '…' if start + SNIPPET_TOKENS < len(words) else ''
+                    return f'{prefix}{text}{suffix}'
+        return ''
+
+REBUILD_FTS_SQL = '''
+INSERT INTO course_search (rowid, title, description, lessons, category_id, level, is_published)
+SELECT c.id, c.title, c.description,
+       (SELECT group_concat(l.title || ' ' || coalesce(l.content, ''), char(10))
+          FROM courses_lesson l JOIN courses_coursemodule m ON l.module_id = m.id
+         WHERE m.course_id = c.id),
+       c.category_id, c.level, c.is_published
+  FROM courses_course c
+'''
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def fts5_available():
+    if connection.vendor != 'sqlite':
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS5Backend.table])
+        return cursor.fetchone() is not None
+
+def get_search_backend():
+    global _backend
+
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                choice = getattr(settings, 'COURSE_SEARCH_BACKEND', 'auto')
+                if choice == 'fts5' or (choice == 'auto' and fts5_available()):
+                    _backend = FTS5Backend()
+                else:
+                    _backend = InMemoryBackend()
+    return _backend
+
+def index_course_on_commit(course_id):
+    # lessons and modules are saved many at a time (imports, reorders), and each
+    # save would rebuild the whole course document: do it once per course and
+    # transaction, after the commit
+    connection = transaction.get_connection()
+    pending = connection.__dict__.setdefault('pending_reindexes', {})
+    callback = pending.get(course_id)
+
+    # a callback dropped by a rollback no longer counts
+    if callback is not None and any(func is callback for _, func, _ in connection.run_on_commit):
+        return
+
+    def callback():
+        pending.pop(course_id, None)
+        get_search_backend().index_course(course_id)
+
+    pending[course_id] = callback
+    transaction.on_commit(callback)
+
+def search_courses(query, category=None, level=None, limit=20, offset=0):
+    terms = tokenize(query)
+
+    if not terms:
+        return SearchResult(0, [], {'category': {}, 'level': {}})
+    return get_search_backend().search(terms, category=category, level=level, limit=limit, offset=offset)
@@ -1,6 +1,9 @@
 from rest_framework import serializers
-from .models import CustomUser, UserProfile, Category, Course, CourseModule, Lesson, Enrollment
-from django.contrib.auth import authenticate
+from .models import CustomUser, UserProfile, Category, Course, CourseModule, Lesson, Enrollment, ChunkedUpload, CourseStats
+from .uploads import TARGETS
+from .variants import variant_urls
+from .media import protected_file_url
+from .validators import file_type_for_name, validate_document_size, validate_document_file
 
 class UserRegisterationSerializer(serializers.ModelSerializer):
     password2 = serializers.CharField(write_only=True) # show this only when creating/updating, dont show it when reading
@@ -26,9 +29,9 @@ class UserRegisterationSerializer(serializers.ModelSerializer):
         validated_data.pop('password2')
 
         password = validated_data.pop('password')
-        user = CustomUser.objects.create(**validated_data)
+        user = CustomUser(**validated_data)
         user.set_password(password) # will hash the password
-        user.save()
+        user.save() # one INSERT with the hash already set
 
         return user
     
@@ -36,41 +39,40 @@ class UserLoginSerializer(serializers.Serializer):
     email = serializers.EmailField()
     password = serializers.CharField(write_only=True)
 
-    def validate(self, data):
-        user = authenticate(email=data['email'], password=data['password'])
-
-        if user is None:
-            raise serializers.ValidationError('Invalid credentials')
-        
-        if not user.is_active:
-            raise serializers.ValidationError('User account is disabled')
-
-        data['user'] = user
-        return data
-    
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
         fields = ['phone_number', 'date_of_birth', 'expertise']
 
+class ImageVariantsField(serializers.ReadOnlyField):
+    # URLs for the stored variant names, built without touching storage
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        storage = self.parent.Meta.model._meta.get_field(self.image_field).storage
+        return variant_urls(value, storage, self.context.get('request'))
+
 class UserSerializer(serializers.ModelSerializer):
-    profile = UserProfileSerializer()
+    profile = UserProfileSerializer(source='get_profile', required=False)
+    profile_picture_variants = ImageVariantsField('profile_picture')
 
     class Meta:
         model = CustomUser
         fields = ['id', 'email', 'username', 'first_name', 'last_name', 
-                  'role', 'bio', 'profile_picture', 'profile', 'date_joined']
+                  'role', 'bio', 'profile_picture', 'profile_picture_variants', 'profile', 'date_joined']
         read_only_fields = ['id', 'email', 'date_joined']
 
     def update(self, instance, validated_data):
-        profile_data = validated_data.pop('profile', None)
+        profile_data = validated_data.pop('get_profile', None)
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
 
         if profile_data:
-            profile = instance.profile
+            profile = instance.get_profile()
             for attr, value in profile_data.items():
                 setattr(profile, attr, value)
             profile.save()
@@ -83,7 +85,25 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = '__all__'
         # read_only_fields = ['id', 'name', 'slug', 'description']
 
+class CategoryListSerializer(CategorySerializer):
+    # annotated by categories.category_queryset()
+    course_count = serializers.IntegerField(read_only=True)
+
+class ProtectedFileField(serializers.FileField):
+    # writes like a FileField, reads as the URL of the view that checks access
+    def __init__(self, view_name, **kwargs):
+        self.view_name = view_name
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        return protected_file_url(value, self.view_name, self.context.get('request'))
+
 class LessonSerializer(serializers.ModelSerializer):
+    document_file = ProtectedFileField('lesson-document', required=False, allow_null=True,
+                                       validators=[validate_document_size, validate_document_file])
+
     class Meta:
         model = Lesson
         exclude = ['module']
@@ -95,24 +115,104 @@ class ModuleSerializer(serializers.ModelSerializer):
         model = CourseModule
         fields = ['id', 'title', 'description', 'order', 'lessons']
 
+class LessonTreeSerializer(LessonSerializer):
+    # documents are attached afterwards through /api/uploads/
+    document_file = None
+
+    class Meta:
+        model = Lesson
+        fields = ['title', 'content', 'lesson_type', 'order', 'video_url', 'duration', 'is_preview']
+
+class BatchLessonSerializer(LessonTreeSerializer):
+    module = serializers.IntegerField(min_value=1)
+
+    class Meta(LessonTreeSerializer.Meta):
+        fields = ['module', *LessonTreeSerializer.Meta.fields]
+
+def unique_orders(items, message):
+    orders = [(item.get('module'), item['order']) for item in items]
+    if len(set(orders)) != len(orders):
+        raise serializers.ValidationError(message)
+    return items
+
+class ModuleTreeSerializer(serializers.ModelSerializer):
+    lessons = LessonTreeSerializer(many=True, required=False, default=list)
+
+    class Meta:
+        model = CourseModule
+        fields = ['title', 'description', 'order', 'lessons']
+
+    def validate_lessons(self, lessons):
+        return unique_orders(lessons, 'Lesson orders must be unique within a module')
+
+class CourseBatchSerializer(serializers.Serializer):
+    modules = ModuleTreeSerializer(many=True, required=False, default=list, max_length=1000)
+    lessons = BatchLessonSerializer(many=True, required=False, default=list, max_length=10_000)
+
+    def validate_modules(self, modules):
+        return unique_orders(modules, 'Module orders must be unique within a course')
+
+    def validate_lessons(self, lessons):
+        return unique_orders(lessons, 'Lesson orders must be unique within a module')
+
+    def validate(self, data):
+        if not data['modules'] and not data['lessons']:
+            raise serializers.ValidationError('Provide modules or lessons to add')
+        return data
+
 class CourseListSerializer(serializers.ModelSerializer):
     instructor_name = serializers.SerializerMethodField()
     category_name = serializers.SerializerMethodField()
+    thumbnail_variants = ImageVariantsField('thumbnail')
+    stats = serializers.SerializerMethodField()
     
     class Meta:
         model = Course
-        fields = ['id', 'title', 'slug', 'thumbnail', 'instructor_name', 'category_name', 'price', 'level', 'is_published', 'created_at']
+        fields = ['id', 'title', 'slug', 'thumbnail', 'thumbnail_variants', 'instructor_name', 'category_name', 'price', 'level', 'is_published', 'created_at', 'stats']
 
     def get_instructor_name(self, obj):
         return f'{obj.instructor.first_name} {obj.instructor.last_name}'
     
     def get_category_name(self, obj):
         return obj.category.name
+
+    def get_stats(self, obj):
+        # joined by the list querysets; courses not reconciled yet read as zeros
+        try:
+            stats = obj.stats
+        except CourseStats.DoesNotExist:
+            stats = CourseStats()
+
+        return {
+            'lesson_count': obj.lesson_count,
+            'module_count': stats.module_count,
+            'total_duration': stats.total_duration,
+            'enrollment_count': stats.enrollment_count,
+            'completion_rate': stats.completion_rate,
+        }
     
+class CourseTreeSerializer(serializers.ModelSerializer):
+    modules = ModuleTreeSerializer(many=True, required=False, default=list, max_length=1000)
+
+    class Meta:
+        model = Course
+        fields = ['title', 'slug', 'description', 'category', 'price', 'level', 'duration', 'is_published', 'modules']
+
+    def validate_modules(self, modules):
+        return unique_orders(modules, 'Module orders must be unique within a course')
+
+class CourseSearchSerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    category = serializers.IntegerField(required=False)
+    level = serializers.ChoiceField(choices=Course.LEVEL_CHOICES, required=False)
+    limit = serializers.IntegerField(required=False, default=20, min_value=1, max_value=100)
+    offset = serializers.IntegerField(required=False, default=0, min_value=0)
+
 class CourseDetailSerializer(serializers.ModelSerializer):
     modules = ModuleSerializer(many=True, read_only=True)
     instructor = UserSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
+    thumbnail_variants = ImageVariantsField('thumbnail')
 
     class Meta:
         model = Course
@@ -120,24 +220,97 @@ class CourseDetailSerializer(serializers.ModelSerializer):
 
 class EnrollmentSerializer(serializers.ModelSerializer):
     student_name = serializers.CharField(source='student.get_fullname', read_only=True)
-    student_email = serializers.EmailField(source='course.email', read_only=True)
+    student_email = serializers.EmailField(source='student.email', read_only=True)
     course_title = serializers.CharField(source='course.title', read_only=True)
     course_thumbnail = serializers.ImageField(source='course.thumbnail', read_only=True)
 
     class Meta:
         model = Enrollment
         fields = '__all__'
-        read_only_fields = ['student', 'enrolled_at', 'completed_at', 'progress_percentage', 'is_completed']
+        read_only_fields = ['student', 'enrolled_at', 'completed_at', 'progress_percentage', 'is_completed', 'completed_lessons']
+
+    def validate_course(self, course):
+        if not course.is_published:
+            raise serializers.ValidationError('Course is not published')
+        return course
+
+class EnrolledCourseSerializer(CourseListSerializer):
+    class Meta(CourseListSerializer.Meta):
+        fields = ['id', 'title', 'slug', 'thumbnail', 'thumbnail_variants', 'instructor_name', 'category_name', 'level', 'lesson_count']
+
+class NextLessonSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Lesson
+        fields = ['id', 'title', 'module', 'duration']
+
+class MyEnrollmentSerializer(serializers.ModelSerializer):
+    course = EnrolledCourseSerializer(read_only=True)
+    next_lesson = NextLessonSerializer(read_only=True)
+
+    class Meta:
+        model = Enrollment
+        fields = ['id', 'course', 'enrolled_at', 'completed_lessons', 'progress_percentage', 'is_completed', 'completed_at', 'next_lesson']
+        read_only_fields = fields
+
+class BulkEnrollmentSerializer(serializers.Serializer):
+    course = serializers.PrimaryKeyRelatedField(queryset=Course.objects.only('id', 'instructor_id'))
+    students = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, default=list, max_length=100_000)
+    emails = serializers.ListField(child=serializers.EmailField(), required=False, default=list, max_length=100_000)
 
     def validate(self, data):
-        request = self.context.get('request')
+        if not data['students'] and not data['emails']:
+            raise serializers.ValidationError('Provide students or emails to enroll')
+        return data
+
+class ReorderSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), max_length=10_000)
 
-        if request and request.user:
-            student = request.user
-            course = data.get('course')
+class MoveSerializer(serializers.Serializer):
+    after = serializers.IntegerField(min_value=1, allow_null=True, required=False, default=None)
+
+class AnalyticsQuerySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    course = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, data):
+        if data.get('start') and data.get('end') and data['start'] > data['end']:
+            raise serializers.ValidationError('start must not be after end')
+        return data
+
+class CourseImportSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    slug = serializers.SlugField(max_length=200, required=False)
+
+class CourseExportQuerySerializer(serializers.Serializer):
+    compress = serializers.BooleanField(required=False, default=True)
+
+class UserImportSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=['csv', 'jsonl'], required=False)
+
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChunkedUpload
+        fields = ['id', 'target', 'object_id', 'filename', 'size', 'received', 'status', 'created_at']
+        read_only_fields = ['id', 'received', 'status', 'created_at']
+
+    def validate(self, data):
+        target = TARGETS[data['target']]
+
+        if file_type_for_name(data['filename']) not in target.file_types:
+            raise serializers.ValidationError({'filename': f'Invalid file type. Allowed: {" ".join(sorted(target.file_types))}'})
+
+        if not 0 < data['size'] <= target.max_size():
+            raise serializers.ValidationError({'size': f'File size must be between 1 byte and {target.max_size() // (1024 * 1024)}MB!'})
+
+        if not target.owned(self.context['request'].user).filter(pk=data['object_id']).exists():
+            raise serializers.ValidationError({'object_id': 'You can only upload files to your own content!'})
 
-            if Enrollment.objects.filter(student=student, course=course).exists():
-                raise serializers.ValidationError('Student already enrolled in this course')
-            
         return data
 
+class EnrollmentProgressSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Enrollment
+        fields = ['id', 'course', 'completed_lessons', 'progress_percentage', 'is_completed', 'completed_at']
+        read_only_fields = fields
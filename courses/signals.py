@@ -1,8 +1,188 @@
-from django.db.models.signals import post_save
+from django.db.models import F
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from .models import CustomUser, UserProfile
+from .models import CustomUser, UserProfile, Category, Course, CourseModule, Lesson, Enrollment, CourseStats
+from .cache import course_tree_cache, bump_catalog_version
+from .search import get_search_backend, index_course_on_commit
+from .progress import recompute_lesson_counts, repoint_enrollments, repoint_course_on_commit
+from .authentication import user_state_cache
+from .variants import schedule_variants
+from .categories import category_snapshot
+from .stats import adjust_course_stats, adjust_module_course_stats
+from .db import tune_sqlite
+from .analytics import record_activity, forget_enrollment
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    tune_sqlite(connection)
 
 @receiver(post_save, sender=CustomUser)
-def create_user_profile(sender, instance, created, **kwargs):
+def refresh_user_state(sender, instance, **kwargs):
+    if getattr(instance, '_auth_changed', False):
+        user_state_cache.set(instance)
+
+@receiver(post_delete, sender=CustomUser)
+def forget_user_state(sender, instance, **kwargs):
+    user_state_cache.invalidate(instance.pk)
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_course_tree(sender, instance, **kwargs):
+    course_tree_cache.bump(instance.pk)
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_catalog(sender, instance, **kwargs):
+    bump_catalog_version()
+
+@receiver(post_save, sender=CourseModule)
+@receiver(post_delete, sender=CourseModule)
+def invalidate_module_course_tree(sender, instance, **kwargs):
+    course_tree_cache.bump(instance.course_id)
+    index_course_on_commit(instance.course_id)
+
+@receiver(post_save, sender=Course)
+def index_course(sender, instance, **kwargs):
+    get_search_backend().update_course(instance)
+
+@receiver(post_delete, sender=Course)
+def unindex_course(sender, instance, **kwargs):
+    get_search_backend().remove_course(instance.pk)
+
+def lesson_course_id(lesson):
+    # None when the module is already gone, i.e. lessons cascade-deleted with it;
+    # the module's own post_delete covers the course then
+    return CourseModule.objects.filter(pk=lesson.module_id).values_list('course_id', flat=True).first()
+
+@receiver(post_save, sender=Lesson)
+def count_created_lesson(sender, instance, created, **kwargs):
     if created:
-        UserProfile.objects.create(user=instance)
\ No newline at end of file
+        Course.objects.filter(modules=instance.module_id).update(lesson_count=F('lesson_count') + 1)
+        # lesson_count is on the course list too
+        bump_catalog_version()
+
+@receiver(post_delete, sender=Lesson)
+def count_deleted_lesson(sender, instance, **kwargs):
+    if Course.objects.filter(modules=instance.module_id, lesson_count__gt=0).update(lesson_count=F('lesson_count') - 1):
+        bump_catalog_version()
+
+@receiver(post_delete, sender=CourseModule)
+def recount_module_lessons(sender, instance, **kwargs):
+    # lessons cascade-deleted with their module may not have been counted down
+    recompute_lesson_counts(Course.objects.filter(pk=instance.course_id))
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def invalidate_lesson_course_tree(sender, instance, signal, **kwargs):
+    course_id = lesson_course_id(instance)
+
+    if course_id is not None:
+        course_tree_cache.bump(course_id)
+        # saves that leave the indexed fields alone (duration, preview flag, ...) keep the document
+        if signal is post_delete or getattr(instance, '_search_changed', True):
+            index_course_on_commit(course_id)
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Course)
+def invalidate_category_snapshot(sender, instance, **kwargs):
+    category_snapshot.invalidate()
+
+@receiver(post_save, sender=Course)
+def invalidate_category_counts(sender, instance, **kwargs):
+    # published counts only move when a course is created, (un)published or recategorised
+    if instance._listing_changed:
+        category_snapshot.invalidate()
+
+@receiver(post_save, sender=Category)
+def invalidate_category_course_trees(sender, instance, created, **kwargs):
+    if not created:
+        bump_catalog_version()
+        course_tree_cache.bump_many(list(instance.courses.values_list('id', flat=True)))
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_instructor_course_trees(sender, instance, created, **kwargs):
+    # logins, password rehashes and token revocations don't change what trees show
+    if created or not instance._public_changed:
+        return
+
+    course_ids = list(Course.objects.filter(instructor=instance).values_list('id', flat=True))
+
+    if course_ids:
+        bump_catalog_version()
+    course_tree_cache.bump_many(course_ids)
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_profile_course_trees(sender, instance, **kwargs):
+    # profiles are created lazily, so the first save replaces the defaults too
+    for course_id in Course.objects.filter(instructor_id=instance.user_id).values_list('id', flat=True):
+        course_tree_cache.bump(course_id)
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=CustomUser)
+def generate_image_variants(sender, instance, update_fields=None, **kwargs):
+    schedule_variants(instance, update_fields)
+
+@receiver(post_save, sender=Course)
+def create_course_stats(sender, instance, created, **kwargs):
+    if created:
+        CourseStats.objects.create(course=instance)
+
+@receiver(post_save, sender=CourseModule)
+def count_created_module(sender, instance, created, **kwargs):
+    if created:
+        adjust_course_stats(instance.course_id, module_count=1)
+
+@receiver(post_delete, sender=CourseModule)
+def count_deleted_module(sender, instance, **kwargs):
+    adjust_course_stats(instance.course_id, module_count=-1)
+
+@receiver(post_save, sender=Lesson)
+def track_lesson_duration(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_saved_stats_state', None)
+
+    if created:
+        adjust_module_course_stats(instance.module_id, total_duration=instance.duration or 0)
+    elif previous is not None and previous != instance.stats_state():
+        module_id, duration = previous
+        adjust_module_course_stats(module_id, total_duration=-(duration or 0))
+        adjust_module_course_stats(instance.module_id, total_duration=instance.duration or 0)
+
+@receiver(post_delete, sender=Lesson)
+def untrack_lesson_duration(sender, instance, **kwargs):
+    adjust_module_course_stats(instance.module_id, total_duration=-(instance.duration or 0))
+
+@receiver(post_save, sender=Enrollment)
+def count_created_enrollment(sender, instance, created, **kwargs):
+    if created:
+        adjust_course_stats(instance.course_id, enrollment_count=1, completed_count=int(instance.is_completed))
+
+@receiver(post_delete, sender=Enrollment)
+def count_deleted_enrollment(sender, instance, **kwargs):
+    adjust_course_stats(instance.course_id, enrollment_count=-1, completed_count=-int(instance.is_completed))
+
+@receiver(post_save, sender=Enrollment)
+def record_enrollment(sender, instance, created, **kwargs):
+    if created:
+        record_activity(instance.course_id, instance.enrolled_at.date(), enrollments=1)
+
+@receiver(pre_delete, sender=Enrollment)
+def unrecord_enrollment(sender, instance, origin=None, **kwargs):
+    # rollups of a course being deleted go with it
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model is not Course:
+        forget_enrollment(instance)
+
+@receiver(post_save, sender=Enrollment)
+def point_to_first_lesson(sender, instance, created, **kwargs):
+    if created:
+        repoint_enrollments(Enrollment.objects.filter(pk=instance.pk))
+
+@receiver(post_delete, sender=Lesson)
+def repoint_lesson_enrollments(sender, instance, **kwargs):
+    # deleting a lesson nulls the pointers that named it
+    course_id = lesson_course_id(instance)
+    if course_id is not None:
+        repoint_course_on_commit(course_id)
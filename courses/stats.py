@@ -0,0 +1,79 @@
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from .cache import bump_catalog_version, catalog_stats_changed
+from .models import Course, CourseModule, CourseStats, Enrollment, Lesson
+
+# Materialized course statistics.
+#
+# CourseStats holds one row per course with its module count, summed lesson
+# duration and enrollment/completion totals, so list pages read them through a
+# join instead of aggregating per row. Signals adjust the row with F() updates
+# as modules, lessons and enrollments change; bulk paths that skip signals call
+# adjust_course_stats() themselves. reconcile_course_stats() recomputes every
+# figure with set-based UPDATEs and is meant to run periodically to fix drift.
+
+COUNT_FIELDS = ('module_count', 'enrollment_count', 'completed_count')
+# course list validators move with these at once, with the enrollment figures on
+# the coarser CATALOG_STATS_INTERVAL
+CATALOG_FIELDS = ('module_count', 'total_duration')
+ENROLLMENT_FIELDS = ('enrollment_count', 'completed_count')
+
+def adjust_course_stats(course_id, **deltas):
+    if course_id is not None:
+        adjust_stats(CourseStats.objects.filter(course_id=course_id), deltas)
+
+def adjust_module_course_stats(module_id, **deltas):
+    # one UPDATE joined through the module, no lookup of its course first
+    adjust_stats(CourseStats.objects.filter(course__modules=module_id), deltas)
+
+def adjust_stats(rows, deltas):
+    updates = {}
+
+    for field, delta in deltas.items():
+        if not delta:
+            continue
+        value = F(field) + delta
+        # counters never go below zero, even if a decrement races a reconcile
+        updates[field] = Greatest(value, Value(0)) if field in COUNT_FIELDS and delta < 0 else value
+
+    if updates:
+        rows.update(**updates)
+    if updates.keys() & set(CATALOG_FIELDS):
+        bump_catalog_version()
+    elif updates.keys() & set(ENROLLMENT_FIELDS):
+        catalog_stats_changed()
+
+def actual_stats():
+    # Subquery expressions for the true figures of the row's course
+    modules = CourseModule.objects.filter(course=OuterRef('course_id')).order_by().values('course')
+    lessons = Lesson.objects.filter(module__course=OuterRef('course_id')).order_by().values('module__course')
+    enrollments = Enrollment.objects.filter(course=OuterRef('course_id')).order_by().values('course')
+
+    return {
+        'module_count': Coalesce(Subquery(modules.annotate(total=Count('id')).values('total')), 0),
+        'total_duration': Coalesce(Subquery(lessons.annotate(total=Sum('duration')).values('total')), 0),
+        'enrollment_count': Coalesce(Subquery(enrollments.annotate(total=Count('id')).values('total')), 0),
+        'completed_count': Coalesce(Subquery(enrollments.annotate(total=Count('id', filter=Q(is_completed=True))).values('total')), 0),
+    }
+
+def reconcile_course_stats(courses=None):
+    # returns (rows checked, rows that had drifted)
+    courses = Course.objects.all() if courses is None else courses
+
+    missing = courses.filter(stats__isnull=True).values_list('pk', flat=True)
+    CourseStats.objects.bulk_create([CourseStats(course_id=pk) for pk in missing.iterator()], batch_size=1000, ignore_conflicts=True)
+
+    rows = CourseStats.objects.filter(course__in=courses.values('pk'))
+    actual = actual_stats()
+    drifted = rows.annotate(**{f'actual_{field}': value for field, value in actual.items()}).exclude(
+        **{field: F(f'actual_{field}') for field in actual}
+    )
+    drifted_ids = list(drifted.values_list('pk', flat=True))
+
+    checked = rows.update(reconciled_at=timezone.now())
+    for start in range(0, len(drifted_ids), 1000):
+        CourseStats.objects.filter(pk__in=drifted_ids[start:start + 1000]).update(**actual)
+
+    bump_catalog_version()
+    return checked, len(drifted_ids)
@@ -1,3 +1,2060 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.http import HttpResponse
+from django.db import connection, transaction
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.test import APIClient
+from PIL import Image
+from .models import CustomUser, UserProfile, Category, Course, CourseModule, Lesson, Enrollment, ChunkedUpload, CourseStats, CourseDailyStats, LessonCompletion
+from .serializers import CourseDetailSerializer
+from .encoders import encode_course_tree, with_course_tree
+from .cache import LRUBackend, course_tree_cache
+from .pagination import CourseKeysetPagination, approximate_count
+from .search import InMemoryBackend, get_search_backend, tokenize
+from .progress import recompute_progress, complete_lesson
+from .enrollment import bulk_enroll
+from .stats import reconcile_course_stats
+from .hashers import HashPoolBusy, password_pool
+from .throttling import LoginRateThrottle, TokenBucketStore
+from .user_import import HashProcessPool, import_users, text_stream
+from .variants import save_variants
+from .authentication import tokens_for_user
+from .async_views import async_reads, course_list, course_detail, category_list, profile
+from .categories import category_snapshot
+from .ordering import ORDER_GAP, reorder_siblings
+from .analytics import activity_buffer, backfill_rollups
+from .checks import check_shared_caches
+from .db import RoutingState, ReplicaRouter, routing, pin_key, read_from_replica, primary_while_recent, using_primary
 
-# Create your tests here.
+
+def clear_caches():
+    # version stamps and auth state live in 'shared', the rest in 'default'
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+def make_user(email, role='STUDENT', password=None, **kwargs):
+    # no password by default: hashing one per user dominates the suite's runtime
+    username = email.split('@')[0]
+    return CustomUser.objects.create_user(username=username, email=email, password=password,
+                                          first_name='Test', last_name=username.title(), role=role, **kwargs)
+
+
+def make_course(instructor, category, index, is_published=True, modules=0, lessons=0):
+    course = Course.objects.create(title=f'Course {index}', slug=f'course-{index}', description='Description',
+                                   instructor=instructor, category=category, is_published=is_published)
+
+    for module_order in range(modules):
+        module = CourseModule.objects.create(course=course, title=f'Module {module_order}', order=module_order)
+        Lesson.objects.bulk_create([
+            Lesson(module=module, title=f'Lesson {lesson_order}', order=lesson_order, duration=10)
+            for lesson_order in range(lessons)
+        ])
+
+    return course
+
+
+class CourseViewSetQueryBudgetTests(TestCase):
+    # one joined keyset SELECT, no COUNT
+    LIST_BUDGET = 1
+    # course (joined with instructor, profile, category) + modules + lessons
+    RETRIEVE_BUDGET = 3
+
+    def setUp(self):
+        self.client = APIClient()
+        self.instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        self.student = make_user('student@example.com')
+        self.categories = [Category.objects.create(name=f'Category {i}', slug=f'category-{i}') for i in range(3)]
+
+    def create_courses(self, count, start=0, **kwargs):
+        return [make_course(self.instructor, self.categories[i % 3], i, **kwargs) for i in range(start, start + count)]
+
+    def assert_list_budget(self, user):
+        self.client.force_authenticate(user)
+
+        for total in (5, 25):
+            self.create_courses(total - Course.objects.count(), start=Course.objects.count())
+
+            with self.assertNumQueries(self.LIST_BUDGET):
+                response = self.client.get(reverse('course-list'))
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), min(total, 10))
+
+    def test_list_query_budget_for_anonymous(self):
+        self.assert_list_budget(None)
+
+    def test_list_query_budget_for_student(self):
+        self.assert_list_budget(self.student)
+
+    def test_list_query_budget_for_instructor(self):
+        self.assert_list_budget(self.instructor)
+
+    def test_list_payload(self):
+        self.create_courses(1)
+
+        response = self.client.get(reverse('course-list'))
+        row = response.data['results'][0]
+
+        self.assertEqual(row['instructor_name'], 'Test Instructor')
+        self.assertEqual(row['category_name'], 'Category 0')
+
+    def test_retrieve_query_budget(self):
+        small = make_course(self.instructor, self.categories[0], 1, modules=1, lessons=1)
+        large = make_course(self.instructor, self.categories[0], 2, modules=5, lessons=8)
+
+        for course in (small, large):
+            with self.assertNumQueries(self.RETRIEVE_BUDGET):
+                response = self.client.get(reverse('course-detail', args=[course.id]))
+
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(len(response.json()['modules']), 5)
+        self.assertEqual(len(response.json()['modules'][0]['lessons']), 8)
+
+    def test_update_query_budget(self):
+        course = self.create_courses(1)[0]
+        self.client.force_authenticate(self.instructor)
+
+        # joined fetch + UPDATE + search index UPDATE
+        with self.assertNumQueries(3):
+            response = self.client.patch(reverse('course-detail', args=[course.id]), {'title': 'Renamed'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['instructor_name'], 'Test Instructor')
+
+
+class CourseTreeEncoderTests(TestCase):
+    def test_matches_course_detail_serializer(self):
+        instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        category = Category.objects.create(name='Category', slug='category')
+        course = make_course(instructor, category, 1, modules=3, lessons=4)
+        course.price = '19.90'
+        course.save()
+
+        response = APIClient().get(reverse('course-detail', args=[course.id]))
+        request = response.wsgi_request
+
+        expected = CourseDetailSerializer(Course.objects.get(pk=course.pk), context={'request': request}).data
+        self.assertEqual(response.json(), json.loads(json.dumps(expected, cls=DjangoJSONEncoder)))
+        self.assertEqual(list(response.json()), list(expected))
+
+    def test_missing_profile_encodes_defaults(self):
+        instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        course = make_course(instructor, Category.objects.create(name='Category', slug='category'), 1)
+        course = with_course_tree(Course.objects.all()).get(pk=course.pk)
+
+        data = encode_course_tree(course)
+        self.assertEqual(data['instructor']['profile'], {'phone_number': '', 'date_of_birth': None, 'expertise': ''})
+        self.assertEqual(data['instructor'], CourseDetailSerializer(course).data['instructor'])
+
+
+class CourseTreeCacheTests(TestCase):
+    def setUp(self):
+        course_tree_cache.clear()
+        self.client = APIClient()
+        self.instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        self.category = Category.objects.create(name='Category', slug='category')
+        self.course = make_course(self.instructor, self.category, 1, modules=2, lessons=2)
+        self.url = reverse('course-detail', args=[self.course.id])
+
+    def test_second_read_is_served_from_cache(self):
+        first = self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(course_tree_cache.stats(), {'hits': 1, 'misses': 1, 'evictions': 0})
+
+    def test_lesson_change_invalidates(self):
+        self.client.get(self.url)
+
+        lesson = Lesson.objects.filter(module__course=self.course).first()
+        lesson.title = 'Updated lesson'
+        lesson.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn(b'Updated lesson', response.content)
+
+    def test_versions_move_again_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            lesson = Lesson.objects.filter(module__course=self.course).first()
+            lesson.title = 'Updated lesson'
+            lesson.save()
+            # a miss during the transaction still reads the old rows
+            self.client.get(self.url)
+            in_transaction = course_tree_cache.version(self.course.id)
+
+        for callback in callbacks:
+            callback()
+
+        self.assertGreater(course_tree_cache.version(self.course.id), in_transaction)
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+
+    def test_only_shown_instructor_fields_invalidate(self):
+        version = course_tree_cache.version(self.course.id)
+        instructor = CustomUser.objects.get(pk=self.instructor.pk)
+        instructor.set_password('rehashed')
+        instructor.save()
+        instructor.is_active = False
+        instructor.save(update_fields=['is_active'])
+        self.assertEqual(course_tree_cache.version(self.course.id), version)
+
+        instructor.first_name = 'Renamed'
+        instructor.save(update_fields=['first_name'])
+        self.assertGreater(course_tree_cache.version(self.course.id), version)
+
+    def test_category_change_bumps_its_courses_together(self):
+        other = make_course(self.instructor, self.category, 2)
+        versions = [course_tree_cache.version(course.id) for course in (self.course, other)]
+
+        self.category.name = 'Renamed'
+        with mock.patch.object(course_tree_cache.stamps, 'bump', wraps=course_tree_cache.stamps.bump) as bump:
+            self.category.save()
+        # no tree is bumped on its own; they move in one get_many/set_many
+        self.assertFalse([call for call in bump.call_args_list if call.args[0].startswith('course-tree:')])
+        self.assertEqual([course_tree_cache.version(course.id) for course in (self.course, other)],
+                         [version + 1 for version in versions])
+
+    def test_unpublishing_hides_cached_course(self):
+        self.client.get(self.url)
+
+        self.course.is_published = False
+        self.course.save()
+
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_instructor_reads_bypass_cache(self):
+        self.client.force_authenticate(self.instructor)
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(course_tree_cache.stats()['misses'], 0)
+
+    def test_lru_backend_evicts_by_count_and_size(self):
+        backend = LRUBackend(max_entries=2, max_bytes=10)
+        backend.set('a', b'1234')
+        backend.set('b', b'1234')
+        backend.get('a')
+        backend.set('c', b'1234')
+
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('a'), b'1234')
+
+        backend.set('d', b'12345678')
+        self.assertEqual(backend.evictions, 3)
+        self.assertEqual(backend.size, 8)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        course_tree_cache.clear()
+        self.client = APIClient()
+        self.instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        self.category = Category.objects.create(name='Category', slug='category')
+        self.course = make_course(self.instructor, self.category, 1)
+
+    def test_catalog_not_modified(self):
+        response = self.client.get(reverse('course-list'))
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(reverse('course-list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        cached = self.client.get(reverse('course-list'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_catalog_etag_changes_on_writes(self):
+        etag = self.client.get(reverse('course-list'))['ETag']
+
+        self.category.name = 'Renamed'
+        self.category.save()
+
+        response = self.client.get(reverse('course-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['category_name'], 'Renamed')
+
+    def test_catalog_etag_is_scoped_by_query(self):
+        etag = self.client.get(reverse('course-list'))['ETag']
+        response = self.client.get(reverse('course-list') + '?page_size=5', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_course_not_modified_without_queries(self):
+        url = reverse('course-detail', args=[self.course.id])
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        CourseModule.objects.create(course=self.course, title='New module', order=1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_course_etag_is_scoped_by_user(self):
+        url = reverse('course-detail', args=[self.course.id])
+        etag = self.client.get(url)['ETag']
+
+        self.client.force_authenticate(self.instructor)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        category = Category.objects.create(name='Category', slug='category')
+        self.courses = [make_course(instructor, category, i) for i in range(7)]
+
+        # identical timestamps force the id tie-break
+        Course.objects.filter(id__in=[c.id for c in self.courses[2:5]]).update(created_at=self.courses[2].created_at)
+
+    def collect(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_walks_every_row_once_in_order(self):
+        expected = list(Course.objects.order_by(*CourseKeysetPagination.ordering).values_list('id', flat=True))
+        self.assertEqual(self.collect(reverse('course-list') + '?page_size=2'), expected)
+
+    def test_previous_link_returns_previous_page(self):
+        first = self.client.get(reverse('course-list') + '?page_size=3')
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+
+        self.assertIsNone(first.data['previous'])
+        self.assertEqual([r['id'] for r in back.data['results']], [r['id'] for r in first.data['results']])
+
+    def test_counts_are_opt_in(self):
+        response = self.client.get(reverse('course-list'))
+        self.assertNotIn('count', response.data)
+
+        response = self.client.get(reverse('course-list') + '?count=exact')
+        self.assertEqual(response.data['count'], {'value': 7, 'exact': True})
+
+        response = self.client.get(reverse('course-list') + '?count=approx')
+        self.assertEqual(response.data['count'], {'value': 7, 'exact': True})
+
+    def test_approximate_count_is_capped(self):
+        self.assertEqual(approximate_count(Course.objects.all(), limit=5), {'value': 5, 'exact': False})
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('course-list') + '?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+        for values in ([None, None], ['2024-01-01T00:00:00', [1]], ['', 1], {'a': 1, 'b': 2}):
+            cursor = base64.urlsafe_b64encode(json.dumps({'v': values}).encode()).decode()
+            self.assertEqual(self.client.get(reverse('course-list'), {'cursor': cursor}).status_code, 404, values)
+
+
+class CourseSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        self.web = Category.objects.create(name='Web', slug='web')
+        self.data = Category.objects.create(name='Data', slug='data')
+
+        self.django = Course.objects.create(title='Django for beginners', slug='django', description='Build web apps',
+                                            instructor=instructor, category=self.web, is_published=True)
+        self.pandas = Course.objects.create(title='Pandas in depth', slug='pandas', description='Dataframes and django exports',
+                                            instructor=instructor, category=self.data, level='ADVANCED', is_published=True)
+        self.draft = Course.objects.create(title='Django drafts', slug='draft', description='Unpublished',
+                                           instructor=instructor, category=self.web, is_published=False)
+
+        # lessons and modules are reindexed once the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            module = CourseModule.objects.create(course=self.pandas, title='Intro', order=1)
+            self.lesson = Lesson.objects.create(module=module, title='Reading files', content='Load a CSV with read_csv', order=1)
+
+    def search(self, **params):
+        response = self.client.get(reverse('course-search'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_ranks_title_matches_first_and_hides_drafts(self):
+        data = self.search(q='django')
+
+        self.assertEqual([row['id'] for row in data['results']], [self.django.id, self.pandas.id])
+        self.assertIn('<mark>Django</mark>', data['results'][0]['highlight'])
+        self.assertEqual(data['results'][0]['instructor_name'], 'Test Instructor')
+
+    def test_prefix_matching_and_lesson_content(self):
+        self.assertEqual([row['id'] for row in self.search(q='djan')['results']], [self.django.id, self.pandas.id])
+        self.assertEqual([row['id'] for row in self.search(q='csv')['results']], [self.pandas.id])
+
+    def test_facets_and_filters(self):
+        data = self.search(q='django', level='ADVANCED')
+
+        self.assertEqual(data['count'], 1)
+        self.assertEqual([row['id'] for row in data['results']], [self.pandas.id])
+        self.assertCountEqual(data['facets']['category'], [
+            {'id': self.web.id, 'name': 'Web', 'count': 1},
+            {'id': self.data.id, 'name': 'Data', 'count': 1},
+        ])
+        self.assertCountEqual(data['facets']['level'], [{'level': 'BEGINNER', 'count': 1}, {'level': 'ADVANCED', 'count': 1}])
+
+    def test_index_follows_lesson_and_course_changes(self):
+        self.lesson.content = 'Parquet files'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lesson.save()
+        self.assertEqual(self.search(q='csv')['results'], [])
+        self.assertEqual(len(self.search(q='parquet')['results']), 1)
+
+        self.django.delete()
+        self.assertEqual([row['id'] for row in self.search(q='django')['results']], [self.pandas.id])
+
+    def test_lesson_saves_reindex_once_per_course(self):
+        with mock.patch.object(type(get_search_backend()), 'index_course') as index_course:
+            with self.captureOnCommitCallbacks(execute=True):
+                for order in range(2, 5):
+                    Lesson.objects.create(module=self.lesson.module, title=f'Lesson {order}', order=order)
+                self.lesson.title = 'Reading CSV files'
+                self.lesson.save()
+            index_course.assert_called_once_with(self.pandas.id)
+
+            # nothing indexed changed
+            self.lesson.duration = 5
+            with self.captureOnCommitCallbacks(execute=True):
+                self.lesson.save()
+            self.assertEqual(index_course.call_count, 1)
+
+    def test_query_is_required(self):
+        self.assertEqual(self.client.get(reverse('course-search')).status_code, 400)
+
+    def test_highlights_escape_course_text(self):
+        self.django.title = 'Django <img src=x onerror=alert(1)>'
+        self.django.save()
+
+        for highlight in (self.search(q='django')['results'][0]['highlight'],
+                          InMemoryBackend().search(tokenize('django')).hits[0][2]):
+            self.assertIn('<mark>Django</mark>', highlight)
+            self.assertNotIn('<img', highlight)
+            self.assertIn('&lt;img', highlight)
+
+    def test_in_memory_backend_matches(self):
+        backend = InMemoryBackend()
+        result = backend.search(tokenize('djan'))
+
+        self.assertEqual([hit[0] for hit in result.hits], [self.django.id, self.pandas.id])
+        self.assertEqual(result.facets['category'], {self.web.id: 1, self.data.id: 1})
+        self.assertIn('<mark>Django</mark>', result.hits[0][2])
+
+        self.lesson.content = 'Parquet files'
+        self.lesson.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            backend.index_course(self.pandas.id)
+
+        self.assertEqual(backend.search(tokenize('csv')).hits, [])
+        self.assertEqual(backend.search(tokenize('parq'), level='ADVANCED').total, 1)
+
+
+class CourseFilterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        other = make_user('other@example.com', role='INSTRUCTOR')
+        self.web = Category.objects.create(name='Web', slug='web')
+        self.data = Category.objects.create(name='Data', slug='data')
+
+        specs = [
+            (self.instructor, self.web, 'BEGINNER', 10, 60),
+            (self.instructor, self.web, 'ADVANCED', 50, 300),
+            (other, self.data, 'BEGINNER', 20, 120),
+            (other, self.data, 'INTERMEDIATE', 80, 600),
+        ]
+        self.courses = []
+        for index, (instructor, category, level, price, duration) in enumerate(specs):
+            course = make_course(instructor, category, index)
+            Course.objects.filter(pk=course.pk).update(level=level, price=price, duration=duration)
+            self.courses.append(course)
+
+    def ids(self, **params):
+        response = self.client.get(reverse('course-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(row['id'] for row in response.data['results'])
+
+    def test_filters(self):
+        c = [course.id for course in self.courses]
+
+        self.assertEqual(self.ids(category=self.web.id), [c[0], c[1]])
+        self.assertEqual(self.ids(category=f'{self.web.id},{self.data.id}', level='BEGINNER'), [c[0], c[2]])
+        self.assertEqual(self.ids(level='BEGINNER,ADVANCED'), [c[0], c[1], c[2]])
+        self.assertEqual(self.ids(price_min=20, price_max=50), [c[1], c[2]])
+        self.assertEqual(self.ids(duration_min=120, duration_max=300), [c[1], c[2]])
+        self.assertEqual(self.ids(instructor=self.instructor.id), [c[0], c[1]])
+
+    def test_facets_in_one_query(self):
+        # keyset page + facet aggregate
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('course-list'), {'facets': 'true', 'level': 'BEGINNER', 'price_max': 50})
+
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['facets']['category'], [
+            {'id': self.data.id, 'name': 'Data', 'count': 1},
+            {'id': self.web.id, 'name': 'Web', 'count': 1},
+        ])
+        # the level facet ignores the level selection but honours price_max
+        self.assertEqual(response.data['facets']['level'], [
+            {'level': 'BEGINNER', 'count': 2},
+            {'level': 'ADVANCED', 'count': 1},
+        ])
+
+    def test_facets_are_opt_in(self):
+        self.assertNotIn('facets', self.client.get(reverse('course-list')).data)
+
+
+class LessonProgressTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        self.student = make_user('student@example.com')
+        self.course = make_course(self.instructor, Category.objects.create(name='Category', slug='category'), 1)
+
+        module = CourseModule.objects.create(course=self.course, title='Module', order=1)
+        self.lessons = [Lesson.objects.create(module=module, title=f'Lesson {i}', order=i) for i in range(4)]
+        self.enrollment = Enrollment.objects.create(student=self.student, course=self.course)
+        self.client.force_authenticate(self.student)
+
+    def complete(self, lesson):
+        return self.client.post(reverse('lesson-complete', args=[lesson.id]))
+
+    def test_lesson_count_is_maintained(self):
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.lesson_count, 4)
+
+        self.lessons[0].delete()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.lesson_count, 3)
+
+        self.lessons[1].module.delete()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.lesson_count, 0)
+
+    def test_stale_course_save_keeps_lesson_count(self):
+        stale = Course.objects.get(pk=self.course.pk)
+        Lesson.objects.create(module=self.lessons[0].module, title='Extra', order=10)
+
+        stale.title = 'Renamed'
+        stale.save()
+
+        self.assertEqual(Course.objects.get(pk=self.course.pk).lesson_count, 5)
+
+    def test_completion_is_constant_work(self):
+        # enrollment lookup, savepoint + INSERT + release, UPDATE, refresh; the rollup is buffered
+        with self.assertNumQueries(6):
+            response = self.complete(self.lessons[0])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['completed_lessons'], 1)
+        self.assertEqual(response.data['progress_percentage'], 25.0)
+        self.assertFalse(response.data['is_completed'])
+
+    def test_completing_every_lesson_completes_the_enrollment(self):
+        for lesson in self.lessons:
+            self.complete(lesson)
+
+        response = self.complete(self.lessons[0])
+        self.assertEqual(response.status_code, 200)
+
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.completed_lessons, 4)
+        self.assertEqual(self.enrollment.progress_percentage, 100.0)
+        self.assertTrue(self.enrollment.is_completed)
+        self.assertIsNotNone(self.enrollment.completed_at)
+
+    def test_requires_enrollment(self):
+        self.client.force_authenticate(make_user('other@example.com'))
+        self.assertEqual(self.complete(self.lessons[0]).status_code, 403)
+        self.assertEqual(self.client.post(reverse('lesson-complete', args=[9999])).status_code, 404)
+
+    def test_non_numeric_ids_are_not_found(self):
+        self.client.force_authenticate(self.instructor)
+        for url in ('/api/lessons/abc/complete/', '/api/lessons/abc/move/', '/api/modules/abc/move/'):
+            self.assertEqual(self.client.post(url, {'order': 1}).status_code, 404)
+
+    def test_recompute_after_structure_change(self):
+        for lesson in self.lessons:
+            self.complete(lesson)
+
+        Lesson.objects.create(module=self.lessons[0].module, title='New lesson', order=10)
+        recompute_progress()
+
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.progress_percentage, 80.0)
+        self.assertFalse(self.enrollment.is_completed)
+        self.assertIsNone(self.enrollment.completed_at)
+        self.assertEqual(self.enrollment.calculate_progress(), 80.0)
+
+
+class EnrollmentApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        self.student = make_user('student@example.com')
+        self.course = make_course(self.instructor, Category.objects.create(name='Category', slug='category'), 1)
+
+    def test_enroll_once(self):
+        self.client.force_authenticate(self.student)
+
+        response = self.client.post(reverse('enrollment-list'), {'course': self.course.id})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['student_email'], 'student@example.com')
+
+        response = self.client.post(reverse('enrollment-list'), {'course': self.course.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Enrollment.objects.count(), 1)
+
+    def test_unpublished_course_and_non_students(self):
+        draft = make_course(self.instructor, self.course.category, 2, is_published=False)
+
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.client.post(reverse('enrollment-list'), {'course': draft.id}).status_code, 400)
+
+        self.client.force_authenticate(self.instructor)
+        self.assertEqual(self.client.post(reverse('enrollment-list'), {'course': self.course.id}).status_code, 403)
+
+    def test_lists_are_scoped(self):
+        Enrollment.objects.create(student=self.student, course=self.course)
+        other = make_user('other@example.com')
+
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(reverse('enrollment-list')).data['results'], [])
+
+        self.client.force_authenticate(self.instructor)
+        self.assertEqual(len(self.client.get(reverse('enrollment-list')).data['results']), 1)
+
+    def test_bulk_enroll(self):
+        students = [make_user(f'cohort{i}@example.com') for i in range(5)]
+        Enrollment.objects.create(student=students[0], course=self.course)
+        self.client.force_authenticate(self.instructor)
+
+        response = self.client.post(reverse('enrollment-bulk'), {
+            'course': self.course.id,
+            'students': [s.id for s in students[:3]] + [self.instructor.id],
+            'emails': ['COHORT3@example.com', 'cohort4@example.com', 'missing@example.com'],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 4)
+        self.assertEqual(response.data['already_enrolled'], 1)
+        self.assertEqual(response.data['invalid'], [self.instructor.id, 'missing@example.com'])
+        self.assertEqual(Enrollment.objects.filter(course=self.course).count(), 5)
+
+    def test_bulk_enroll_matches_stored_mixed_case_emails(self):
+        student = make_user('Alice@Example.com')
+
+        result = bulk_enroll(self.course, emails=['alice@example.com'])
+
+        self.assertEqual((result['created'], result['invalid']), (1, []))
+        self.assertTrue(Enrollment.objects.filter(student=student, course=self.course).exists())
+
+    def test_bulk_enroll_reports_emails_matching_several_students(self):
+        make_user('Bob@example.com')
+        make_user('bob@example.com')
+
+        result = bulk_enroll(self.course, emails=['BOB@example.com'])
+
+        self.assertEqual((result['created'], result['invalid'], result['ambiguous']), (0, [], ['bob@example.com']))
+        self.assertFalse(Enrollment.objects.filter(course=self.course).exists())
+
+    def test_bulk_enroll_counts_only_rows_it_inserted(self):
+        students = [make_user(f'cohort{i}@example.com') for i in range(3)]
+        Enrollment.objects.create(student=students[0], course=self.course)
+
+        result = bulk_enroll(self.course, student_ids=[student.pk for student in students])
+
+        self.assertEqual((result['created'], result['already_enrolled']), (2, 1))
+        self.course.stats.refresh_from_db()
+        self.assertEqual(self.course.stats.enrollment_count, 3)
+
+    def test_bulk_enroll_requires_course_owner(self):
+        self.client.force_authenticate(make_user('rival@example.com', role='INSTRUCTOR'))
+        response = self.client.post(reverse('enrollment-bulk'), {'course': self.course.id, 'students': [self.student.id]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        LoginRateThrottle.reset()
+        self.client = APIClient()
+        self.instructor = make_user('instructor@example.com', role='INSTRUCTOR', password='password123')
+        make_course(self.instructor, Category.objects.create(name='Category', slug='category'), 1, is_published=False)
+
+        response = self.client.post(reverse('login'), {'email': 'instructor@example.com', 'password': 'password123'})
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.json()["access_token"]}')
+
+    def test_catalog_reads_skip_the_user_lookup(self):
+        self.client.get(reverse('course-list'))
+
+        # only the keyset page itself, filtered by the role/id claims
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('course-list'))
+
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_role_change_revokes_token(self):
+        user = CustomUser.objects.get(pk=self.instructor.pk)
+        user.role = 'STUDENT'
+        user.save()
+
+        self.assertEqual(self.client.get(reverse('course-list')).status_code, 401)
+
+    def test_deactivation_revokes_token(self):
+        self.client.get(reverse('course-list'))
+        user = CustomUser.objects.get(pk=self.instructor.pk)
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+
+        self.assertEqual(self.client.get(reverse('course-list')).status_code, 401)
+
+    def test_unrelated_saves_keep_token(self):
+        user = CustomUser.objects.get(pk=self.instructor.pk)
+        user.bio = 'Hello'
+        user.save()
+
+        self.assertEqual(self.client.get(reverse('course-list')).status_code, 200)
+
+    def test_profile_and_writes_work_with_claims_user(self):
+        self.assertEqual(self.client.get(reverse('profile')).data['email'], 'instructor@example.com')
+
+        course = Course.objects.get()
+        response = self.client.patch(reverse('course-detail', args=[course.id]), {'title': 'Renamed'})
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000)
+class LoginThroughputTests(TestCase):
+    def setUp(self):
+        LoginRateThrottle.reset()
+        self.client = APIClient()
+        self.user = make_user('student@example.com', password='password123')
+
+    def login(self, email='student@example.com', password='password123', **extra):
+        return self.client.post(reverse('login'), {'email': email, 'password': password}, **extra)
+
+    def test_failed_login_hashes_once_with_one_lookup(self):
+        with mock.patch.object(password_pool, 'arun', wraps=password_pool.arun) as run, self.assertNumQueries(1):
+            response = self.login(password='wrong')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(run.call_count, 1)
+
+    def test_unknown_email_still_hashes(self):
+        with mock.patch.object(password_pool, 'arun', wraps=password_pool.arun) as run:
+            self.assertEqual(self.login(email='nobody@example.com').status_code, 400)
+
+        self.assertEqual(run.call_count, 1)
+
+    def test_outdated_hash_is_upgraded_on_login(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(password=make_password('password123', hasher='pbkdf2_sha1'))
+        token_version = CustomUser.objects.get(pk=self.user.pk).token_version
+
+        self.assertEqual(self.login().status_code, 200)
+
+        user = CustomUser.objects.get(pk=self.user.pk)
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$1000$'))
+        self.assertEqual(user.token_version, token_version)
+
+        with override_settings(PASSWORD_HASH_ITERATIONS=2000):
+            self.assertEqual(self.login().status_code, 200)
+        self.assertTrue(CustomUser.objects.get(pk=self.user.pk).password.startswith('pbkdf2_sha256$2000$'))
+
+    def test_current_hash_is_not_rewritten(self):
+        password = CustomUser.objects.get(pk=self.user.pk).password
+
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(CustomUser.objects.get(pk=self.user.pk).password, password)
+
+    def test_email_is_throttled_across_addresses(self):
+        for i in range(5):
+            self.assertEqual(self.login(password='wrong', REMOTE_ADDR=f'10.0.0.{i}').status_code, 400)
+
+        response = self.login(REMOTE_ADDR='10.0.0.99')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_many_users_behind_one_address_are_not_throttled(self):
+        for i in range(30):
+            self.assertEqual(self.login(email=f'user{i}@example.com', password='wrong').status_code, 400)
+
+    def test_busy_hash_pool_answers_503(self):
+        with mock.patch.object(password_pool, 'arun', side_effect=HashPoolBusy):
+            response = self.login()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_busy_hash_pool_fails_other_authenticate_callers(self):
+        with mock.patch.object(password_pool, 'run', side_effect=HashPoolBusy):
+            self.assertIsNone(authenticate(email='student@example.com', password='password123'))
+
+    def test_inactive_users_cannot_log_in(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.login()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'non_field_errors': ['Invalid credentials']})
+
+    def test_non_object_bodies_are_rejected(self):
+        response = self.client.post(reverse('login'), ['student@example.com'], format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_login_returns_tokens(self):
+        response = self.login(format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['email'], 'student@example.com')
+        self.assertEqual(self.client.get(reverse('login')).status_code, 405)
+
+    def test_token_bucket_refills(self):
+        buckets = TokenBucketStore(rate=10, burst=2)
+
+        self.assertEqual(buckets.consume('key'), 0)
+        self.assertEqual(buckets.consume('key'), 0)
+        self.assertGreater(buckets.consume('key'), 0)
+
+        with mock.patch('courses.throttling.time.monotonic', return_value=10**9):
+            self.assertEqual(buckets.consume('key'), 0)
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000)
+class UserImportTests(TestCase):
+    CSV = (
+        'email,username,first_name,last_name,role,password\n'
+        'ada@example.com,ada,Ada,Lovelace,student,velvet-harbor-42\n'
+        'not-an-email,bad,Bad,Row,STUDENT,velvet-harbor-42\n'
+        'grace@example.com,grace,Grace,Hopper,INSTRUCTOR,\n'
+        'ADA@example.com,ada2,Ada,Again,STUDENT,velvet-harbor-42\n'
+        'taken@example.com,taken2,Taken,User,STUDENT,velvet-harbor-42\n'
+        'short@example.com,short,Short,Password,STUDENT,abc\n'
+    )
+
+    def setUp(self):
+        make_user('taken@example.com')
+
+    def test_csv_import_reports_rows_and_keeps_going(self):
+        # two duplicate lookups, the INSERT and the batch savepoint
+        with self.assertNumQueries(5):
+            report = import_users(io.StringIO(self.CSV), 'csv', workers=1)
+
+        self.assertEqual((report['processed'], report['created'], report['failed']), (6, 2, 4))
+        self.assertEqual([error['line'] for error in report['errors']], [3, 5, 7, 6])
+        self.assertIn('email', report['errors'][0]['errors'])
+
+        ada = CustomUser.objects.get(email='ada@example.com')
+        self.assertTrue(ada.check_password('velvet-harbor-42'))
+        self.assertFalse(CustomUser.objects.get(email='grace@example.com').has_usable_password())
+
+    def test_jsonl_import_in_process_pool(self):
+        rows = [json.dumps({'email': f'user{i}@example.com', 'username': f'user{i}', 'password': 'velvet-harbor-42'}) for i in range(5)]
+        rows.append(json.dumps({'email': 'hashed@example.com', 'username': 'hashed', 'password_hash': make_password('secret123')}))
+        rows.append('[1, 2]')
+        report = import_users(io.StringIO('\n'.join(rows)), 'jsonl', batch_size=2, workers=2)
+
+        self.assertEqual((report['created'], report['failed']), (6, 1))
+        self.assertEqual(report['errors'][0]['line'], 7)
+        self.assertTrue(CustomUser.objects.get(email='user4@example.com').check_password('velvet-harbor-42'))
+        self.assertTrue(CustomUser.objects.get(email='hashed@example.com').check_password('secret123'))
+
+    def test_passwords_go_through_the_validators(self):
+        rows = (
+            'email,username,first_name,last_name,role,password\n'
+            'common@example.com,common,Common,User,STUDENT,password123\n'
+            'numeric@example.com,numeric,Numeric,User,STUDENT,48151623\n'
+            'similar@example.com,lovelace,Ada,Lovelace,STUDENT,lovelace\n'
+        )
+        report = import_users(io.StringIO(rows), 'csv', workers=1)
+
+        self.assertEqual((report['created'], report['failed']), (0, 3))
+        self.assertEqual([list(error['errors']) for error in report['errors']], [['password']] * 3)
+
+    def test_pooled_imports_share_one_process_pool(self):
+        rows = lambda start: '\n'.join(json.dumps({'email': f'user{i}@example.com', 'username': f'user{i}', 'password': 'velvet-harbor-42'})
+                                       for i in range(start, start + 2))
+        pool = HashProcessPool(max_workers=2, idle_seconds=3600)
+        with mock.patch('courses.user_import.hash_processes', pool), \
+                mock.patch('courses.user_import.ProcessPoolExecutor', wraps=ProcessPoolExecutor) as executor:
+            import_users(io.StringIO(rows(0)), 'jsonl', workers=8)
+            import_users(io.StringIO(rows(2)), 'jsonl', workers=8)
+
+        executor.assert_called_once()
+        self.assertEqual(executor.call_args.args[0], 2)
+        self.assertEqual(CustomUser.objects.filter(email__startswith='user').count(), 4)
+
+        # idle processes are shut down
+        pool.shutdown_idle()
+        self.assertIsNone(pool._executor)
+        pool._idle_timer.cancel()
+
+    def test_undecodable_and_malformed_rows_are_reported(self):
+        rows = (
+            b'email,username,first_name,last_name,role,password\n'
+            b'ada@example.com,ada,Ada,Lovelace,STUDENT,velvet-harbor-42\n'
+            b'bad@example.com,b\xe9ad,Bad,Bytes,STUDENT,velvet-harbor-42\n'
+            b'grace@example.com,grace,Grace,Hopper,STUDENT,velvet-harbor-42\n'
+        )
+        report = import_users(text_stream(io.BytesIO(rows)), 'csv', workers=1)
+
+        self.assertEqual((report['created'], report['failed']), (2, 1))
+        self.assertEqual(report['errors'], [{'line': 3, 'errors': {'row': 'Not valid UTF-8'}}])
+
+        self.addCleanup(csv.field_size_limit, csv.field_size_limit(100))
+        rows = rows.replace(b'ada', b'ida').replace(b'grace', b'grete').replace(b'Bytes', b'B' * 200)
+        report = import_users(text_stream(io.BytesIO(rows)), 'csv', workers=1)
+        self.assertEqual((report['created'], report['failed']), (2, 1))
+        self.assertEqual(report['errors'][0]['line'], 3)
+        self.assertIn('Malformed CSV', report['errors'][0]['errors']['row'])
+
+    def test_api_is_admin_only(self):
+        client = APIClient()
+        upload = lambda: io.BytesIO(self.CSV.encode())
+
+        client.force_authenticate(make_user('student@example.com'))
+        self.assertEqual(client.post(reverse('user-import'), {'file': upload()}, format='multipart').status_code, 403)
+
+        client.force_authenticate(make_user('admin@example.com', is_staff=True))
+        response = client.post(reverse('user-import'), {'file': upload(), 'format': 'csv'}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+
+
+class LazyProfileTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_registration_is_one_insert(self):
+        data = {'username': 'new', 'email': 'new@example.com', 'first_name': 'New', 'last_name': 'User',
+                'role': 'STUDENT', 'password': 'password123', 'password2': 'password123'}
+
+        with self.assertNumQueries(3):  # unique email and username checks, then the INSERT
+            response = self.client.post(reverse('register'), data)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(UserProfile.objects.exists())
+
+    def test_profile_read_is_one_select_with_defaults(self):
+        self.client.force_authenticate(make_user('student@example.com'))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('profile'))
+
+        self.assertEqual(response.data['profile'], {'phone_number': '', 'date_of_birth': None, 'expertise': ''})
+
+    def test_profile_created_on_first_write(self):
+        user = make_user('student@example.com')
+        self.client.force_authenticate(user)
+
+        response = self.client.patch(reverse('profile'), {'profile': {'expertise': 'Databases'}}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['profile']['expertise'], 'Databases')
+
+        self.client.patch(reverse('profile'), {'profile': {'phone_number': '123'}}, format='json')
+        profile = UserProfile.objects.get(user=user)
+        self.assertEqual((profile.expertise, profile.phone_number), ('Databases', '123'))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse('profile')).data['profile']['phone_number'], '123')
+
+
+class ChunkedUploadTests(TestCase):
+    PDF = b'%PDF-1.7\n' + b'x' * 200_000
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media, CHUNKED_UPLOAD_DIR=os.path.join(self.media, 'partial'))
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.addCleanup(shutil.rmtree, self.media)
+
+        self.client = APIClient()
+        self.instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        course = make_course(self.instructor, Category.objects.create(name='Category', slug='category'), 1, modules=1, lessons=1)
+        self.lesson = Lesson.objects.get(module__course=course)
+        self.client.force_authenticate(self.instructor)
+
+    def start(self, filename='notes.pdf', size=None, object_id=None):
+        return self.client.post(reverse('upload-list'), {
+            'target': 'lesson.document_file', 'object_id': object_id or self.lesson.pk,
+            'filename': filename, 'size': len(self.PDF) if size is None else size,
+        })
+
+    def send(self, upload_id, data, offset):
+        return self.client.post(f'{reverse("upload-chunk", args=[upload_id])}?offset={offset}',
+                                {'chunk': io.BytesIO(data)}, format='multipart')
+
+    def test_resumable_upload_attaches_file(self):
+        upload_id = self.start().data['id']
+
+        self.assertEqual(self.send(upload_id, self.PDF[:100_000], 0).data['received'], 100_000)
+        # a retried or out of order chunk is refused with the offset to resume from
+        response = self.send(upload_id, self.PDF[50_000:], 50_000)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('upload-detail', args=[upload_id])).data['received'], 100_000)
+
+        self.assertEqual(self.send(upload_id, self.PDF[100_000:], 100_000).data['received'], len(self.PDF))
+        response = self.client.post(reverse('upload-complete', args=[upload_id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.lesson.refresh_from_db()
+        with self.lesson.document_file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.PDF)
+        self.assertFalse(os.listdir(os.path.join(self.media, 'partial')))
+
+    def test_complete_runs_once(self):
+        upload_id = self.start().data['id']
+        self.send(upload_id, self.PDF, 0)
+
+        self.assertEqual(self.client.post(reverse('upload-complete', args=[upload_id])).status_code, 200)
+        response = self.client.post(reverse('upload-complete', args=[upload_id]))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('status', response.data)
+
+    def test_content_must_match_extension(self):
+        upload_id = self.start(size=1000).data['id']
+
+        response = self.send(upload_id, b'MZ\x90\x00' + b'\x00' * 996, 0)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ChunkedUpload.objects.get(pk=upload_id).received, 0)
+
+    def test_chunks_cannot_exceed_declared_size(self):
+        upload_id = self.start(size=100).data['id']
+
+        self.assertEqual(self.send(upload_id, self.PDF[:200], 0).status_code, 400)
+
+    def test_complete_requires_all_bytes(self):
+        upload_id = self.start().data['id']
+        self.send(upload_id, self.PDF[:1000], 0)
+
+        self.assertEqual(self.client.post(reverse('upload-complete', args=[upload_id])).status_code, 400)
+
+    def test_a_claimed_offset_is_not_written_twice(self):
+        upload_id = self.start().data['id']
+        # another request is writing at offset 0
+        ChunkedUpload.objects.filter(pk=upload_id).update(lease_until=timezone.now() + timedelta(minutes=1))
+
+        self.assertEqual(self.send(upload_id, self.PDF[:1000], 0).status_code, 400)
+        self.assertFalse(os.path.exists(os.path.join(self.media, 'partial', str(upload_id))))
+
+        # an expired lease is taken over
+        ChunkedUpload.objects.filter(pk=upload_id).update(lease_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.send(upload_id, self.PDF[:1000], 0).data['received'], 1000)
+        self.assertIsNone(ChunkedUpload.objects.get(pk=upload_id).lease_until)
+
+    def test_model_validators_accept_what_chunked_uploads_accept(self):
+        document = ContentFile(b'%PDF-1.7\n', name='big.pdf')
+        document.size = 100 * 1024 * 1024
+        Lesson._meta.get_field('document_file').run_validators(document)
+
+        document.size = 501 * 1024 * 1024
+        with self.assertRaises(DjangoValidationError):
+            Lesson._meta.get_field('document_file').run_validators(document)
+
+    def test_abandoned_uploads_are_purged(self):
+        upload_id = self.start().data['id']
+        self.send(upload_id, self.PDF[:1000], 0)
+        ChunkedUpload.objects.filter(pk=upload_id).update(updated_at=timezone.now() - timedelta(days=2))
+
+        call_command('purge_stale_uploads', stdout=io.StringIO())
+
+        self.assertFalse(ChunkedUpload.objects.filter(pk=upload_id).exists())
+        self.assertFalse(os.listdir(os.path.join(self.media, 'partial')))
+
+    def test_targets_are_checked(self):
+        other = make_user('other@example.com', role='INSTRUCTOR')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.start().status_code, 400)
+
+        self.client.force_authenticate(self.instructor)
+        self.assertEqual(self.start(filename='notes.exe').status_code, 400)
+        self.assertEqual(self.start(size=10**12).status_code, 400)
+
+        upload_id = self.start().data['id']
+        self.client.force_authenticate(other)
+        self.assertEqual(self.send(upload_id, self.PDF, 0).status_code, 404)
+
+
+def image_file(name, size=(1000, 500), image_format='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buffer, image_format)
+    return ContentFile(buffer.getvalue(), name=name)
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media, IMAGE_VARIANTS={'WIDTHS': (160, 320, 2000), 'BACKGROUND': False})
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.addCleanup(shutil.rmtree, self.media)
+
+        self.instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        self.category = Category.objects.create(name='Category', slug='category')
+
+    def create_course(self, index=1):
+        with self.captureOnCommitCallbacks(execute=True):
+            course = make_course(self.instructor, self.category, index)
+            course.thumbnail = image_file('cover.png')
+            course.save()
+        course.refresh_from_db()
+        return course
+
+    def test_variants_are_rendered_after_upload(self):
+        course = self.create_course()
+        variants = course.thumbnail_variants
+
+        self.assertEqual(variants['source'], course.thumbnail.name)
+        self.assertEqual(sorted(variants['webp']), ['160', '320'])  # never upscaled
+        self.assertTrue(variants['jpeg']['320'].startswith('courses/thumbnails/variants/'))
+        self.assertTrue(variants['jpeg']['320'].endswith('.jpg'))
+
+        # content-hashed: an identical image reuses the stored files
+        self.assertEqual(self.create_course(2).thumbnail_variants['webp'], variants['webp'])
+
+    def test_list_exposes_urls_within_the_query_budget(self):
+        self.create_course()
+
+        with self.assertNumQueries(1):
+            response = APIClient().get(reverse('course-list'))
+
+        urls = response.data['results'][0]['thumbnail_variants']
+        self.assertEqual(set(urls), {'webp', 'jpeg'})
+        self.assertTrue(urls['webp']['160'].startswith('http://testserver/media/courses/thumbnails/variants/'))
+
+    def test_unrelated_saves_do_not_rerender(self):
+        course = self.create_course()
+
+        with mock.patch('courses.variants.generate_variants') as generate, self.captureOnCommitCallbacks(execute=True):
+            course.title = 'Renamed'
+            course.save()
+        generate.assert_not_called()
+
+    def test_stale_render_is_dropped(self):
+        course = self.create_course()
+        save_variants(Course, course.pk, 'courses/thumbnails/old.png', [])
+
+        course.refresh_from_db()
+        self.assertEqual(course.thumbnail_variants['source'], course.thumbnail.name)
+
+    def test_profile_picture_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.instructor.profile_picture = image_file('me.jpg', size=(400, 400), image_format='JPEG')
+            self.instructor.save(update_fields=['profile_picture'])
+
+        client = APIClient()
+        client.force_authenticate(self.instructor)
+        self.assertEqual(sorted(client.get(reverse('profile')).data['profile_picture_variants']['webp']), ['160', '320'])
+
+
+class LessonDocumentTests(TestCase):
+    PDF = b'%PDF-1.7\n' + bytes(range(256)) * 8
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.addCleanup(shutil.rmtree, self.media)
+
+        self.client = APIClient()
+        self.instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        self.student = make_user('student@example.com')
+        course = make_course(self.instructor, Category.objects.create(name='Category', slug='category'), 1, modules=1, lessons=2)
+        self.lesson, self.preview = Lesson.objects.filter(module__course=course).order_by('order')
+        self.preview.is_preview = True
+
+        for lesson in (self.lesson, self.preview):
+            lesson.document_file.save('notes.pdf', ContentFile(self.PDF))
+
+        self.course = course
+        self.url = reverse('lesson-document', args=[self.lesson.pk])
+
+    def get(self, url=None, **headers):
+        response = self.client.get(url or self.url, **headers)
+        if response.streaming:
+            response.content_bytes = b''.join(response.streaming_content)
+            response.close()
+        return response
+
+    def enroll(self):
+        Enrollment.objects.create(student=self.student, course=self.course)
+        self.client.force_authenticate(self.student)
+
+    def test_access_rules(self):
+        self.assertEqual(self.get().status_code, 401)
+        self.assertEqual(self.get(reverse('lesson-document', args=[self.preview.pk])).status_code, 200)
+
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.get().status_code, 403)
+
+        self.client.force_authenticate(self.instructor)
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_draft_course_documents_are_hidden(self):
+        Course.objects.filter(pk=self.course.pk).update(is_published=False)
+        preview_url = reverse('lesson-document', args=[self.preview.pk])
+
+        self.assertEqual(self.get(preview_url).status_code, 404)
+        self.enroll()
+        self.assertEqual(self.get().status_code, 404)
+
+        self.client.force_authenticate(self.instructor)
+        self.assertEqual(self.get(preview_url).status_code, 200)
+
+    def test_enrolled_student_gets_file_in_one_query(self):
+        self.enroll()
+
+        with self.assertNumQueries(1):
+            response = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_bytes, self.PDF)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_range_requests(self):
+        self.enroll()
+        etag = self.get()['ETag']
+
+        response = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content_bytes, self.PDF[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.PDF)}')
+        self.assertEqual(response['Content-Length'], '10')
+
+        self.assertEqual(self.get(HTTP_RANGE='bytes=-5').content_bytes, self.PDF[-5:])
+        self.assertEqual(self.get(HTTP_RANGE='bytes=2000-').content_bytes, self.PDF[2000:])
+        self.assertEqual(self.get(HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE=etag).status_code, 206)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"stale"').status_code, 200)
+
+        response = self.get(HTTP_RANGE=f'bytes={len(self.PDF)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.PDF)}')
+
+    @override_settings(PROTECTED_MEDIA_SERVE='nginx')
+    def test_accel_redirect_mode(self):
+        self.enroll()
+        response = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.lesson.document_file.name}')
+        self.assertEqual(response.content, b'')
+
+    def test_serialized_url_points_at_endpoint(self):
+        response = self.client.get(reverse('lesson-detail', args=[self.lesson.pk]))
+        self.assertEqual(response.data['document_file'], f'http://testserver{self.url}')
+
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.factory = AsyncRequestFactory()
+        self.instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        self.category = Category.objects.create(name='Category', slug='category')
+        self.course = make_course(self.instructor, self.category, 1, modules=2, lessons=2)
+        self.draft = make_course(self.instructor, self.category, 2, is_published=False)
+        self.token = f'Bearer {tokens_for_user(self.instructor).access_token}'
+
+    def sync_view(self, url, **headers):
+        return self.client.get(url, **headers)
+
+    async def async_view(self, handler, url, headers=None, **kwargs):
+        view = async_reads(lambda request, **kw: HttpResponse(status=405), handler)
+        return await view(self.factory.get(url, headers=headers), **kwargs)
+
+    async def test_course_list_matches_sync_view(self):
+        url = reverse('course-list') + '?facets=1&level=BEGINNER'
+        expected = await sync_to_async(self.sync_view)(url)
+        response = await self.async_view(course_list, url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), json.loads(expected.content))
+        self.assertEqual(response['ETag'], expected['ETag'])
+
+        revalidated = await self.async_view(course_list, url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+
+    async def test_instructor_sees_drafts(self):
+        url = reverse('course-list')
+        response = await self.async_view(course_list, url, headers={'Authorization': self.token})
+
+        self.assertEqual({row['id'] for row in json.loads(response.content)['results']}, {self.course.pk, self.draft.pk})
+
+    async def test_course_detail_matches_sync_view_and_is_cached(self):
+        url = reverse('course-detail', args=[self.course.pk])
+        expected = await sync_to_async(self.sync_view)(url)
+        response = await self.async_view(course_detail, url, pk=self.course.pk)
+
+        self.assertEqual(json.loads(response.content), json.loads(expected.content))
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+        missing = await self.async_view(course_detail, url, pk=self.draft.pk)
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_category_list_matches_sync_view(self):
+        url = reverse('category-list')
+        expected = await sync_to_async(self.sync_view)(url)
+        response = await self.async_view(category_list, url)
+
+        self.assertEqual(json.loads(response.content), json.loads(expected.content))
+        self.assertEqual((await self.async_view(category_list, url + '?page=5')).status_code, 404)
+
+    async def test_profile_requires_valid_token(self):
+        url = reverse('profile')
+
+        response = await self.async_view(profile, url, headers={'Authorization': self.token})
+        self.assertEqual(json.loads(response.content)['email'], 'instructor@example.com')
+
+        response = await self.async_view(profile, url)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+
+        response = await self.async_view(profile, url, headers={'Authorization': 'Bearer junk'})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_writes_fall_back_to_sync_view(self):
+        view = async_reads(lambda request: HttpResponse(request.method), profile)
+        response = await view(self.factory.patch(reverse('profile')))
+
+        self.assertEqual(response.content, b'PATCH')
+
+
+class CategorySnapshotTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        category_snapshot.clear()
+        self.client = APIClient()
+        self.instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        self.categories = [Category.objects.create(name=f'Category {i:02}', slug=f'category-{i}') for i in range(12)]
+        self.course = make_course(self.instructor, self.categories[0], 1)
+        make_course(self.instructor, self.categories[0], 2, is_published=False)
+
+    def test_list_is_served_without_queries(self):
+        self.client.get(reverse('category-list'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('category-list'))
+
+        data = response.json()
+        self.assertEqual(data['count'], 12)
+        self.assertEqual(len(data['results']), 10)
+        self.assertEqual(data['results'][0], {'id': self.categories[0].pk, 'name': 'Category 00', 'slug': 'category-0',
+                                              'description': None, 'course_count': 1})
+        self.assertEqual(data['next'], 'http://testserver/api/categories/?page=2')
+
+    def test_pages_match_page_number_pagination(self):
+        data = self.client.get(reverse('category-list'), {'page': 2}).json()
+        self.assertEqual([row['name'] for row in data['results']], ['Category 10', 'Category 11'])
+        self.assertEqual(data['previous'], 'http://testserver/api/categories/')
+        self.assertIsNone(data['next'])
+
+        self.assertEqual(self.client.get(reverse('category-list'), {'page': 3}).status_code, 404)
+        self.assertEqual(self.client.get(reverse('category-list'), {'page': 'last'}).json()['count'], 12)
+
+    def test_retrieve_uses_snapshot(self):
+        self.client.get(reverse('category-list'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('category-detail', args=[self.categories[1].pk]))
+        self.assertEqual(response.json()['course_count'], 0)
+        self.assertEqual(self.client.get(reverse('category-detail', args=[0])).status_code, 404)
+
+    def test_publishing_a_course_rebuilds(self):
+        etag = self.client.get(reverse('category-list'))['ETag']
+        self.assertEqual(self.client.get(reverse('category-list'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        draft = Course.objects.get(slug='course-2')
+        draft.is_published = True
+        draft.save()
+
+        response = self.client.get(reverse('category-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['course_count'], 2)
+
+    def test_unrelated_course_edits_keep_snapshot(self):
+        self.client.get(reverse('category-list'))
+        builds = category_snapshot.builds
+
+        course = Course.objects.get(pk=self.course.pk)
+        course.title = 'Renamed'
+        course.save()
+        self.client.get(reverse('category-list'))
+
+        self.assertEqual(category_snapshot.builds, builds)
+
+    def test_category_changes_rebuild(self):
+        self.client.get(reverse('category-list'))
+        category = self.categories[0]
+        category.name = 'Zzz'
+        category.save()
+
+        results = self.client.get(reverse('category-list'), {'page': 2}).json()['results']
+        self.assertEqual(results[-1]['name'], 'Zzz')
+
+
+class CourseStatsTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        self.students = [make_user(f'student{i}@example.com') for i in range(3)]
+        self.course = make_course(self.instructor, Category.objects.create(name='Category', slug='category'), 1)
+        self.module = CourseModule.objects.create(course=self.course, title='Module', order=1)
+        self.lessons = [Lesson.objects.create(module=self.module, title=f'Lesson {i}', order=i, duration=10) for i in range(2)]
+
+    def stats(self):
+        return CourseStats.objects.get(course=self.course)
+
+    def test_structure_changes_are_counted(self):
+        stats = self.stats()
+        self.assertEqual((stats.module_count, stats.total_duration), (1, 20))
+
+        lesson = Lesson.objects.get(pk=self.lessons[0].pk)
+        lesson.duration = 25
+        lesson.save()
+        self.assertEqual(self.stats().total_duration, 35)
+
+        other = CourseModule.objects.create(course=make_course(self.instructor, self.course.category, 2), title='Other', order=1)
+        lesson.module = other
+        lesson.save()
+        self.assertEqual(self.stats().total_duration, 10)
+        self.assertEqual(CourseStats.objects.get(course=other.course).total_duration, 25)
+
+        self.lessons[1].delete()
+        self.module.delete()
+        stats = self.stats()
+        self.assertEqual((stats.module_count, stats.total_duration), (0, 0))
+
+    def test_enrollments_and_completions_are_counted(self):
+        enrollment = Enrollment.objects.create(student=self.students[0], course=self.course)
+        bulk_enroll(self.course, student_ids=[student.pk for student in self.students])
+        self.assertEqual(self.stats().enrollment_count, 3)
+
+        self.course.refresh_from_db()
+        for lesson in self.lessons:
+            complete_lesson(enrollment, lesson.pk, self.course.lesson_count)
+        self.assertEqual(self.stats().completed_count, 1)
+        self.assertEqual(self.stats().completion_rate, 0.3333)
+
+        Enrollment.objects.get(pk=enrollment.pk).delete()
+        stats = self.stats()
+        self.assertEqual((stats.enrollment_count, stats.completed_count), (2, 0))
+
+    def test_reconcile_fixes_drift(self):
+        # bulk-created lessons send no signals
+        bulk = make_course(self.instructor, self.course.category, 3, modules=2, lessons=3)
+        self.assertEqual(CourseStats.objects.get(course=bulk).total_duration, 0)
+        CourseStats.objects.filter(course=self.course).update(enrollment_count=7)
+        CourseStats.objects.filter(course=bulk).delete()
+
+        self.assertEqual(reconcile_course_stats(), (2, 2))
+
+        stats = CourseStats.objects.get(course=bulk)
+        self.assertEqual((stats.module_count, stats.total_duration), (2, 60))
+        self.assertEqual(self.stats().enrollment_count, 0)
+        self.assertEqual(reconcile_course_stats(), (2, 0))
+
+    def test_list_exposes_stats_in_one_query(self):
+        Enrollment.objects.create(student=self.students[0], course=self.course)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('course-list'))
+
+        self.assertEqual(response.data['results'][0]['stats'], {
+            'lesson_count': 2, 'module_count': 1, 'total_duration': 20, 'enrollment_count': 1, 'completion_rate': 0.0,
+        })
+
+    def test_lesson_changes_move_list_validators(self):
+        etag = self.client.get(reverse('course-list'))['ETag']
+        lesson = Lesson.objects.create(module=self.module, title='Untimed', order=10, duration=0)
+
+        response = self.client.get(reverse('course-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['stats']['lesson_count'], 3)
+
+        lesson.delete()
+        self.assertEqual(self.client.get(reverse('course-list'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_enrollments_move_list_validators_on_an_interval(self):
+        etag = self.client.get(reverse('course-list'))['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.create(student=self.students[0], course=self.course)
+        self.assertEqual(self.client.get(reverse('course-list'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with override_settings(CATALOG_STATS_INTERVAL=0):
+            response = self.client.get(reverse('course-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['stats']['enrollment_count'], 1)
+        self.assertEqual(self.client.get(reverse('course-list'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+class ReorderTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        self.client.force_authenticate(self.instructor)
+        self.course = make_course(self.instructor, Category.objects.create(name='Category', slug='category'), 1, modules=3, lessons=5)
+        self.module = self.course.modules.get(order=0)
+
+    def lesson_ids(self):
+        return list(self.module.lessons.values_list('pk', flat=True))
+
+    def test_full_reorder_costs_the_same_statements_for_any_size(self):
+        ids = self.lesson_ids()[::-1]
+
+        # a savepoint pair, one read and the two updates, however many lessons there are
+        with self.assertNumQueries(5):
+            orders = reorder_siblings(Lesson.objects.filter(module=self.module), ids)
+
+        self.assertEqual(self.lesson_ids(), ids)
+        self.assertEqual(list(orders.values()), [ORDER_GAP * i for i in range(1, 6)])
+
+    def test_reorder_endpoints(self):
+        modules = list(self.course.modules.values_list('pk', flat=True))
+        response = self.client.post(reverse('course-reorder-modules', args=[self.course.pk]), {'ids': modules[::-1]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.course.modules.values_list('pk', flat=True)), modules[::-1])
+
+        ids = self.lesson_ids()
+        ids = ids[1:] + ids[:1]
+        response = self.client.post(reverse('module-reorder-lessons', args=[self.module.pk]), {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.lesson_ids(), ids)
+
+        # the cached course tree follows the new order
+        tree = self.client.get(reverse('course-detail', args=[self.course.pk])).json()
+        self.assertEqual([module['id'] for module in tree['modules']], modules[::-1])
+        self.assertEqual([lesson['id'] for lesson in tree['modules'][-1]['lessons']], ids)
+
+    def test_reorder_rejects_partial_lists_and_other_instructors(self):
+        response = self.client.post(reverse('module-reorder-lessons', args=[self.module.pk]), {'ids': self.lesson_ids()[1:]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        self.client.force_authenticate(make_user('other@example.com', role='INSTRUCTOR'))
+        response = self.client.post(reverse('module-reorder-lessons', args=[self.module.pk]), {'ids': self.lesson_ids()}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_move_touches_one_row_until_the_gap_runs_out(self):
+        reorder_siblings(Lesson.objects.filter(module=self.module), self.lesson_ids())
+        ids = self.lesson_ids()
+        before = dict(self.module.lessons.values_list('pk', 'order'))
+
+        response = self.client.post(reverse('lesson-move', args=[ids[4]]), {'after': ids[0]}, format='json')
+        self.assertEqual(response.data['order'], ORDER_GAP + ORDER_GAP // 2)
+        self.assertEqual(self.lesson_ids(), [ids[0], ids[4], *ids[1:4]])
+        after = dict(self.module.lessons.values_list('pk', 'order'))
+        self.assertEqual({pk for pk in ids if before[pk] != after[pk]}, {ids[4]})
+
+        # dense orders leave no room, so the siblings are spread out again
+        Lesson.objects.filter(pk=ids[2]).update(order=ORDER_GAP * 2 + 1)
+        response = self.client.post(reverse('lesson-move', args=[ids[0]]), {'after': ids[1]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.lesson_ids(), [ids[4], ids[1], ids[0], ids[2], ids[3]])
+        self.assertEqual(list(self.module.lessons.values_list('order', flat=True)), [ORDER_GAP * i for i in range(1, 6)])
+
+        response = self.client.post(reverse('module-move', args=[self.module.pk]), {'after': None}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.course.modules.first(), self.module)
+
+
+class InstructorAnalyticsTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        self.client.force_authenticate(self.instructor)
+        category = Category.objects.create(name='Category', slug='category')
+        self.course = make_course(self.instructor, category, 1, modules=1, lessons=2)
+        Course.objects.filter(pk=self.course.pk).update(price='19.50')
+        self.other = make_course(make_user('other@example.com', role='INSTRUCTOR'), category, 2)
+        self.students = [make_user(f'student{i}@example.com') for i in range(3)]
+        self.lessons = list(Lesson.objects.filter(module__course=self.course))
+        self.addCleanup(activity_buffer.flush)
+
+    def rollups(self):
+        return list(CourseDailyStats.objects.order_by('course_id', 'date').values('course_id', 'date', 'enrollments', 'started',
+                                                                                  'completions', 'lessons_completed'))
+
+    def test_dashboard_reads_rollups_kept_current_incrementally(self):
+        enrollment = Enrollment.objects.create(student=self.students[0], course=self.course)
+        bulk_enroll(self.course, student_ids=[student.pk for student in self.students])
+        Enrollment.objects.create(student=self.students[0], course=self.other)
+        with self.captureOnCommitCallbacks(execute=True):
+            for lesson in self.lessons:
+                complete_lesson(enrollment, lesson.pk, 2)
+
+        # the instructor check, then rollup aggregates only; Enrollment is never read
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('instructor-analytics'))
+        self.assertFalse([query for query in queries if 'courses_enrollment' in query['sql']])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals'], {'enrollments': 3, 'started': 1, 'completions': 1, 'lessons_completed': 2,
+                                                   'revenue': '58.50'})
+        self.assertEqual(response.data['funnel'], {'enrolled': 3, 'started': 1, 'completed': 1})
+        self.assertEqual([course['id'] for course in response.data['courses']], [self.course.pk])
+        self.assertEqual(len(response.data['daily']), 1)
+
+        # unenrolling takes the enrollment's events back out
+        Enrollment.objects.get(pk=enrollment.pk).delete()
+        funnel = self.client.get(reverse('instructor-analytics'), {'course': self.course.pk}).data['funnel']
+        self.assertEqual(funnel, {'enrolled': 2, 'started': 0, 'completed': 0})
+
+    def test_backfill_matches_incremental_rollups(self):
+        enrollment = Enrollment.objects.create(student=self.students[0], course=self.course)
+        Enrollment.objects.create(student=self.students[1], course=self.course)
+        with self.captureOnCommitCallbacks(execute=True):
+            complete_lesson(enrollment, self.lessons[0].pk, 2)
+        activity_buffer.flush()
+        incremental = self.rollups()
+
+        # history from before the rollups existed, spread over two days
+        yesterday = timezone.now() - timedelta(days=1)
+        Enrollment.objects.filter(pk=enrollment.pk).update(enrolled_at=yesterday)
+        LessonCompletion.objects.filter(enrollment=enrollment).update(completed_at=yesterday)
+        CourseDailyStats.objects.all().delete()
+
+        self.assertEqual(backfill_rollups([self.course.pk, self.other.pk]), 2)
+        rows = self.rollups()
+        self.assertEqual([(row['enrollments'], row['started'], row['lessons_completed']) for row in rows], [(1, 1, 1), (1, 0, 0)])
+        self.assertEqual(sum(row['enrollments'] for row in rows), incremental[0]['enrollments'])
+
+    def test_completions_are_buffered_into_one_write(self):
+        enrollment = Enrollment.objects.create(student=self.students[0], course=self.course)
+        with self.captureOnCommitCallbacks(execute=True):
+            for lesson in self.lessons:
+                complete_lesson(enrollment, lesson.pk, 2)
+            # nothing reaches the rollups inside the completion transaction
+            self.assertEqual(self.rollups()[0]['lessons_completed'], 0)
+
+        # both completions land in a single UPDATE of today's row
+        with self.assertNumQueries(1):
+            self.assertEqual(activity_buffer.flush(), 1)
+        self.assertEqual([(row['started'], row['completions'], row['lessons_completed']) for row in self.rollups()], [(1, 1, 2)])
+
+        # rolled back completions are never counted
+        other = Enrollment.objects.create(student=self.students[1], course=self.course)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                complete_lesson(other, self.lessons[0].pk, 2)
+                raise RuntimeError
+        self.assertEqual(activity_buffer.flush(), 0)
+
+    def test_students_and_other_courses_are_refused(self):
+        response = self.client.get(reverse('instructor-analytics'), {'course': self.other.pk})
+        self.assertEqual(response.status_code, 404)
+
+        self.client.force_authenticate(self.students[0])
+        self.assertEqual(self.client.get(reverse('instructor-analytics')).status_code, 403)
+
+
+class MyEnrollmentFeedTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.student = make_user('student@example.com')
+        self.client.force_authenticate(self.student)
+        instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        category = Category.objects.create(name='Category', slug='category')
+        self.courses = [make_course(instructor, category, i, modules=2, lessons=2) for i in range(3)]
+        self.enrollments = [Enrollment.objects.create(student=self.student, course=course) for course in self.courses]
+        Enrollment.objects.create(student=make_user('other@example.com'), course=self.courses[0])
+
+    def lessons(self, course):
+        return list(Lesson.objects.filter(module__course=course).order_by('module__order', 'order').values_list('pk', flat=True))
+
+    def test_feed_is_one_query_per_page_with_cursor(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('my-enrollment-list'), {'page_size': 2})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.data['results']], [self.enrollments[2].pk, self.enrollments[1].pk])
+        first = response.data['results'][0]
+        self.assertEqual(first['course']['title'], 'Course 2')
+        self.assertEqual(first['course']['instructor_name'], 'Test Instructor')
+        self.assertEqual(first['next_lesson']['id'], self.lessons(self.courses[2])[0])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([row['id'] for row in response.data['results']], [self.enrollments[0].pk])
+        self.assertIsNone(response.data['next'])
+
+    def test_next_lesson_follows_completions(self):
+        enrollment = self.enrollments[0]
+        lessons = self.lessons(self.courses[0])
+        next_lesson = lambda: Enrollment.objects.values_list('next_lesson', flat=True).get(pk=enrollment.pk)
+
+        # crossing into the next module, then wrapping back to a skipped lesson
+        complete_lesson(enrollment, lessons[1], 4)
+        self.assertEqual(next_lesson(), lessons[2])
+        complete_lesson(enrollment, lessons[3], 4)
+        self.assertEqual(next_lesson(), lessons[0])
+
+        # deleting the pointed-to lesson moves the pointer to the first unfinished one
+        with self.captureOnCommitCallbacks(execute=True):
+            Lesson.objects.get(pk=lessons[0]).delete()
+        self.assertEqual(next_lesson(), lessons[2])
+
+        complete_lesson(Enrollment.objects.get(pk=enrollment.pk), lessons[2], 3)
+        self.assertIsNone(next_lesson())
+
+    def test_next_lesson_skips_completed_lessons(self):
+        enrollment = self.enrollments[0]
+        lessons = self.lessons(self.courses[0])
+
+        for lesson_id in (lessons[0], lessons[2], lessons[1]):
+            complete_lesson(Enrollment.objects.get(pk=enrollment.pk), lesson_id, 4)
+
+        self.assertEqual(Enrollment.objects.values_list('next_lesson', flat=True).get(pk=enrollment.pk), lessons[3])
+
+    def test_deleting_a_module_repoints_once_per_course(self):
+        module = CourseModule.objects.get(course=self.courses[0], order=0)
+
+        with mock.patch('courses.signals.repoint_enrollments') as repoint, CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                module.delete()
+
+        # a single course-wide UPDATE, after the module and both its lessons are gone
+        repoint.assert_not_called()
+        self.assertEqual(sum('UPDATE "courses_enrollment"' in query['sql'] and 'next_lesson_id" = (SELECT' in query['sql']
+                             for query in queries.captured_queries), 1)
+        lessons = self.lessons(self.courses[0])
+        self.assertEqual(set(Enrollment.objects.filter(course=self.courses[0]).values_list('next_lesson', flat=True)), {lessons[0]})
+
+
+class CourseAuthoringTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        self.client.force_authenticate(self.instructor)
+        self.category = Category.objects.create(name='Category', slug='category')
+
+    def tree(self, modules=2, lessons=250):
+        return {
+            'title': 'Authored', 'slug': 'authored', 'description': 'Whole tree', 'category': self.category.pk,
+            'is_published': True,
+            'modules': [{'title': f'Module {m}', 'order': m,
+                         'lessons': [{'title': f'Lesson {i}', 'order': i, 'duration': 2} for i in range(lessons)]}
+                        for m in range(modules)],
+        }
+
+    def test_a_500_lesson_course_takes_a_handful_of_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('course-create-tree'), self.tree(), format='json')
+
+        self.assertEqual(response.status_code, 201, response.data)
+        # independent of size, apart from one INSERT per bulk_create batch
+        self.assertLess(len(queries), 30)
+        self.assertEqual([len(module['lessons']) for module in response.data['modules']], [250, 250])
+
+        course = Course.objects.get(slug='authored')
+        self.assertEqual(course.lesson_count, 500)
+        stats = CourseStats.objects.get(course=course)
+        self.assertEqual((stats.module_count, stats.total_duration), (2, 1000))
+        self.assertEqual(self.client.get(reverse('course-detail', args=[course.pk])).json()['modules'][1]['lessons'][0]['title'], 'Lesson 0')
+
+    def test_batch_adds_to_an_owned_course_or_nothing(self):
+        course = make_course(self.instructor, self.category, 1, modules=1, lessons=1)
+        module = course.modules.get()
+        enrollment = Enrollment.objects.create(student=make_user('student@example.com'), course=course)
+        # cached before the batch, so a stale tree would show
+        self.client.get(reverse('course-detail', args=[course.pk]))
+
+        batch = {'modules': [{'title': 'New', 'order': 5, 'lessons': [{'title': 'A', 'order': 0}]}],
+                 'lessons': [{'module': module.pk, 'title': 'B', 'order': 1, 'duration': 7}]}
+        response = self.client.post(reverse('course-extend-tree', args=[course.pk]), batch, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['lessons']), 2)
+        # make_course bulk-creates its lesson, so only the batch is counted
+        self.assertEqual(Course.objects.get(pk=course.pk).lesson_count, 2)
+        self.assertEqual(len(self.client.get(reverse('course-detail', args=[course.pk])).json()['modules']), 2)
+        self.assertIsNotNone(Enrollment.objects.get(pk=enrollment.pk).next_lesson_id)
+
+        # an order clash rolls the whole batch back
+        clash = {'modules': [{'title': 'Fine', 'order': 6}], 'lessons': [{'module': module.pk, 'title': 'C', 'order': 1}]}
+        response = self.client.post(reverse('course-extend-tree', args=[course.pk]), clash, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CourseModule.objects.filter(title='Fine').exists())
+
+        other = make_course(make_user('other@example.com', role='INSTRUCTOR'), self.category, 2, modules=1)
+        foreign = {'lessons': [{'module': other.modules.get().pk, 'title': 'D', 'order': 9}]}
+        response = self.client.post(reverse('course-extend-tree', args=[course.pk]), foreign, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post(reverse('course-extend-tree', args=[other.pk]), batch, format='json').status_code, 404)
+
+
+class SharedCacheCheckTests(TestCase):
+    def test_process_local_stamps_need_a_single_worker(self):
+        self.assertEqual(check_shared_caches(None), [])
+
+        with override_settings(WEB_WORKERS=4):
+            errors = check_shared_caches(None)
+        self.assertEqual({error.id for error in errors}, {'courses.E001'})
+        self.assertEqual(len(errors), 3)
+
+        with override_settings(REPLICA_DATABASES=['replica_1'], AUTH_USER_STATE_CACHE='default'), \
+                mock.patch('courses.checks.is_local', lambda cache: cache is caches['shared']):
+            self.assertEqual(len(check_shared_caches(None)), 2)
+
+
+# run in a fresh interpreter, since DATABASES is fixed once Django is set up
+REPLICA_SCRIPT = """
+import json, time, django
+django.setup()
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import Client
+from django.test.utils import setup_test_environment
+from courses.authentication import tokens_for_user
+from courses.models import Category, Course, CustomUser
+
+setup_test_environment()
+for alias in ('default', 'replica_1'):
+    call_command('migrate', database=alias, verbosity=0)
+    instructor = CustomUser.objects.db_manager(alias).create_user(username='teacher', email='teacher@example.com', role='INSTRUCTOR')
+    category = Category.objects.using(alias).create(name='Category', slug='category')
+
+# bulk_create: the post_save handlers would write their rows to the primary
+Course.objects.using('replica_1').bulk_create([Course(title='Only on the replica', slug='replica', description='',
+                                                      instructor=instructor, category=category, is_published=True)])
+draft = Course.objects.create(title='Draft', slug='draft', description='', instructor=instructor, category=category)
+# the catalog last changed a minute ago, so its replicas have caught up
+caches['shared'].set('catalog:version:modified', time.time() - 60, None)
+
+anonymous = Client(HTTP_ACCEPT='application/json')
+teacher = Client(HTTP_ACCEPT='application/json', HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(instructor).access_token}')
+titles = lambda client: [row['title'] for row in client.get('/api/courses/').json()['results']]
+
+before = titles(teacher)
+teacher.patch(f'/api/courses/{draft.pk}/', {'title': 'Written'}, content_type='application/json')
+print(json.dumps({'before': before, 'after': titles(teacher), 'anonymous': titles(anonymous)}))
+"""
+
+
+class CourseArchiveTests(TestCase):
+    PDF = b'%PDF-1.7\n' + bytes(range(256)) * 8
+
+    def setUp(self):
+        clear_caches()
+        self.media = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media, IMAGE_VARIANTS={'WIDTHS': (160,), 'BACKGROUND': False})
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.addCleanup(shutil.rmtree, self.media)
+
+        self.instructor = make_user('instructor@example.com', role='INSTRUCTOR')
+        self.other = make_user('other@example.com', role='INSTRUCTOR')
+        self.course = make_course(self.instructor, Category.objects.create(name='Category', slug='category'), 1, modules=2, lessons=3)
+        self.course.thumbnail = image_file('cover.png')
+        self.course.save()
+        # the same PDF on two lessons under different names
+        for lesson in Lesson.objects.filter(module__course=self.course, order=0):
+            lesson.document_file.save('notes.pdf', ContentFile(self.PDF))
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.instructor)
+
+    def export(self, **params):
+        response = self.client.get(reverse('course-export', args=[self.course.pk]), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def members(self, archive):
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            return [(member.name, tar.extractfile(member).read()) for member in tar]
+
+    def import_archive(self, archive, **data):
+        self.client.force_authenticate(self.other)
+        upload = ContentFile(archive, name='course.tar.gz')
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('course-import'), {'file': upload, **data}, format='multipart')
+
+    def stored_files(self):
+        return sorted(os.path.relpath(os.path.join(root, name), self.media)
+                      for root, _, names in os.walk(self.media) for name in names)
+
+    def test_export_streams_manifest_then_each_file_once(self):
+        members = self.members(self.export())
+
+        self.assertEqual(members[0][0], 'manifest.ndjson')
+        records = [json.loads(line) for line in members[0][1].splitlines()]
+        self.assertEqual([record['type'] for record in records], ['course'] + ['module'] * 2 + ['lesson'] * 6)
+        self.assertEqual(records[0]['category']['slug'], 'category')
+
+        documents = [record['document_file'] for record in records if record['type'] == 'lesson' and record['document_file']]
+        self.assertEqual(len(documents), 2)
+        self.assertEqual(documents[0]['sha256'], documents[1]['sha256'])
+        # thumbnail and one copy of the PDF
+        self.assertEqual(sorted(name for name, _ in members[1:]),
+                         sorted(['media/' + records[0]['thumbnail']['sha256'], 'media/' + documents[0]['sha256']]))
+        self.assertIn(self.PDF, [data for _, data in members])
+
+        self.assertEqual(self.members(self.export(compress='false'))[0][0], 'manifest.ndjson')
+
+    def test_only_the_instructor_can_export(self):
+        self.client.force_authenticate(make_user('student@example.com'))
+        self.assertEqual(self.client.get(reverse('course-export', args=[self.course.pk])).status_code, 403)
+
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(reverse('course-export', args=[self.course.pk])).status_code, 404)
+
+    def test_import_recreates_the_course_and_dedupes_media(self):
+        archive = self.export()
+        response = self.import_archive(archive)
+
+        self.assertEqual(response.status_code, 201, response.data)
+        course = Course.objects.get(pk=response.data['id'])
+        self.assertEqual((course.instructor, course.slug, course.is_published), (self.other, 'course-1-2', True))
+        self.assertEqual(course.lesson_count, 6)
+        self.assertEqual(course.stats.module_count, 2)
+        self.assertEqual([len(module['lessons']) for module in response.data['modules']], [3, 3])
+
+        documents = set(Lesson.objects.filter(module__course=course).exclude(document_file='').values_list('document_file', flat=True))
+        self.assertEqual(len(documents), 1)
+        with course.thumbnail.open() as thumbnail:
+            self.assertEqual(thumbnail.read()[:8], b'\x89PNG\r\n\x1a\n')
+        self.assertEqual(sorted(course.thumbnail_variants['webp']), ['160'])
+
+        # a second import reuses every stored file
+        files = self.stored_files()
+        response = self.import_archive(archive, slug='copy')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['slug'], 'copy')
+        self.assertEqual(self.stored_files(), files)
+
+    def test_a_corrupted_file_leaves_no_course_behind(self):
+        archive = bytearray(gzip.decompress(self.export()))
+        at = archive.index(self.PDF)
+        archive[at + 100] ^= 1
+
+        response = self.import_archive(bytes(archive))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('hash', str(response.data))
+        self.assertFalse(Course.objects.filter(instructor=self.other).exists())
+
+        self.assertEqual(self.import_archive(b'not an archive').status_code, 400)
+
+    def test_only_staff_imports_create_categories(self):
+        archive = self.export()
+        Category.objects.update(name='Renamed', slug='renamed')
+
+        response = self.import_archive(archive)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Unknown category', str(response.data))
+        self.assertEqual(Category.objects.count(), 1)
+
+        self.other.is_staff = True
+        self.other.save()
+        self.assertEqual(self.import_archive(archive).status_code, 201)
+        self.assertTrue(Category.objects.filter(slug='category').exists())
+
+    def test_commands_round_trip(self):
+        path = os.path.join(self.media, 'course.tar.gz')
+        call_command('export_course', self.course.pk, output=path, stdout=io.StringIO())
+        call_command('import_course', path, instructor='other@example.com', slug='cloned', stdout=io.StringIO())
+
+        course = Course.objects.get(slug='cloned')
+        self.assertEqual((course.instructor, course.lesson_count), (self.other, 6))
+
+
+class DatabaseRoutingTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.factory = AsyncRequestFactory()
+        self.state = RoutingState()
+        self.token = routing.set(self.state)
+        self.addCleanup(routing.reset, self.token)
+
+    def request(self, method='get', user=None):
+        request = getattr(self.factory, method)('/api/courses/')
+        request.user = user or mock.Mock(is_authenticated=False)
+        return request
+
+    @override_settings(REPLICA_DATABASES=['replica_1'])
+    def test_catalog_reads_go_to_the_replica_until_a_write(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Course))
+
+        read_from_replica(self.request())
+        self.assertEqual(router.db_for_read(Course), 'replica_1')
+        with using_primary():
+            self.assertIsNone(router.db_for_read(Course))
+        self.assertEqual(router.db_for_read(Course), 'replica_1')
+
+        router.db_for_write(Course)
+        self.assertIsNone(router.db_for_read(Course))
+
+    @override_settings(REPLICA_DATABASES=['replica_1'])
+    def test_recent_writers_and_writes_stay_on_the_primary(self):
+        user = mock.Mock(is_authenticated=True, pk=7)
+        caches['shared'].set(pin_key(7), True)
+        read_from_replica(self.request(user=user))
+        read_from_replica(self.request('post'))
+        self.assertIsNone(self.state.replica)
+
+    @override_settings(REPLICA_DATABASES=['replica_1'])
+    def test_freshly_bumped_versions_are_read_from_the_primary(self):
+        read_from_replica(self.request())
+        primary_while_recent(timezone.now().timestamp() - 60)
+        self.assertEqual(self.state.replica, 'replica_1')
+
+        primary_while_recent(timezone.now().timestamp() - 1)
+        self.assertIsNone(self.state.replica)
+
+    def test_primary_and_replica_files(self):
+        # two SQLite files stand in for a primary and its replica
+        with tempfile.TemporaryDirectory() as directory:
+            env = {**os.environ, 'DB_NAME': os.path.join(directory, 'primary.sqlite3'),
+                   'DB_REPLICAS': os.path.join(directory, 'replica.sqlite3'), 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+            result = subprocess.run([sys.executable, '-c', REPLICA_SCRIPT], env=env, cwd=settings.BASE_DIR,
+                                    capture_output=True, text=True, timeout=120)
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        titles = json.loads(result.stdout.strip().splitlines()[-1])
+        self.assertEqual(titles['before'], ['Only on the replica'])
+        # read-your-writes: the instructor is pinned to the primary after editing a course
+        self.assertEqual(titles['after'], ['Written'])
+        # the edit bumped the catalog version: until the replicas have had time to
+        # catch up, pages tagged with it are read from the primary
+        self.assertEqual(titles['anonymous'], [])
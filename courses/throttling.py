@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+# In-process token buckets for the login endpoint, keyed by client IP and by the
+# email being tried. Buckets refill continuously, so short bursts pass while
+# sustained guessing is slowed to the configured rate. Each worker process keeps
+# its own buckets; the LRU bound keeps memory flat under address scans.
+#
+# The per-email bucket is what stops password guessing. The per-IP one only caps
+# floods, and is much looser, since a whole campus or office can share one NAT
+# address; set LOGIN_THROTTLE['ip'] to None to turn it off.
+
+class TokenBucketStore:
+    def __init__(self, rate, burst, max_keys=100_000):
+        self.rate = rate  # tokens per second
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key):
+        # returns 0 when allowed, otherwise seconds until a token is available
+        now = time.monotonic()
+
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+            if tokens >= 1:
+                wait = 0
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+def bucket_store(name, default_rate, default_burst):
+    # None when the setting turns this bucket off
+    config = getattr(settings, 'LOGIN_THROTTLE', {}).get(name, {})
+    if config is None:
+        return None
+    return TokenBucketStore(config.get('RATE', default_rate), config.get('BURST', default_burst))
+
+class LoginRateThrottle(BaseThrottle):
+    # per IP: 10 logins/s sustained, bursts of 300; per email: 1 every 10s, bursts of 5
+    ip_buckets = bucket_store('ip', 10.0, 300)
+    email_buckets = bucket_store('email', 0.1, 5)
+
+    def allow_request(self, request, view):
+        # a JSON body need not be an object
+        email = str(request.data.get('email', '')).strip().lower() if isinstance(request.data, dict) else ''
+
+        self.wait_time = max(
+            self.ip_buckets.consume(self.get_ident(request)) if self.ip_buckets else 0,
+            self.email_buckets.consume(email) if email and self.email_buckets else 0,
+        )
+        return self.wait_time == 0
+
+    def wait(self):
+        return self.wait_time
+
+    @classmethod
+    def reset(cls):
+        for buckets in (cls.ip_buckets, cls.email_buckets):
+            if buckets is not None:
+                buckets.clear()
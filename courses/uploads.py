@@ -0,0 +1,203 @@
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from .models import ChunkedUpload, CustomUser, Course, Lesson
+from .validators import SIGNATURE_BYTES, file_type_for_name, matches_signature, max_upload_size
+
+# Resumable chunked uploads.
+#
+# A client opens an upload for one file field (lesson document, course thumbnail
+# or profile picture), then sends the file in multipart chunks, each starting at
+# the offset the server has stored so far. ChunkUploadHandler writes chunk data
+# straight into a partial file as Django parses the request, so nothing is kept
+# in worker memory or spooled to a second temp file. The file type is checked
+# against its magic bytes when the first bytes arrive, and the size on every
+# chunk. Once all bytes are in, the partial file is streamed to storage and
+# attached to its target.
+#
+# A chunk request first claims its offset with a lease on the upload row, so a
+# concurrent request for the same offset is refused before it writes anything;
+# a lease left by a crashed worker expires after CHUNKED_UPLOAD_LEASE_SECONDS.
+# Uploads untouched for CHUNKED_UPLOAD_EXPIRY_HOURS are removed, with their
+# partial files, by the purge_stale_uploads command.
+
+class UploadTarget:
+    def __init__(self, model, field, kind, file_types, owned):
+        self.model = model
+        self.field = field
+        self.kind = kind
+        self.file_types = file_types
+        # objects of this target the user may attach files to
+        self.owned = owned
+
+    def max_size(self):
+        # the model field validators use the same limits
+        return max_upload_size(self.kind)
+
+TARGETS = {
+    'lesson.document_file': UploadTarget(Lesson, 'document_file', 'document', {'pdf', 'doc', 'docx', 'txt'},
+                                         lambda user: Lesson.objects.filter(module__course__instructor_id=user.pk)),
+    'course.thumbnail': UploadTarget(Course, 'thumbnail', 'image', {'png', 'jpeg'},
+                                     lambda user: Course.objects.filter(instructor_id=user.pk)),
+    'user.profile_picture': UploadTarget(CustomUser, 'profile_picture', 'image', {'png', 'jpeg'},
+                                         lambda user: CustomUser.objects.filter(pk=user.pk)),
+}
+
+CHUNK_FIELD = 'chunk'
+
+def partial_path(upload):
+    directory = getattr(settings, 'CHUNKED_UPLOAD_DIR', os.path.join(settings.BASE_DIR, 'tmp', 'uploads'))
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, str(upload.pk))
+
+class ChunkUploadHandler(FileUploadHandler):
+    def __init__(self, upload, offset, request=None):
+        super().__init__(request)
+        self.upload = upload
+        self.offset = offset
+        self.position = offset
+        self.file = None
+        self.head = b''
+        self.file_type = file_type_for_name(upload.filename)
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+
+        if field_name != CHUNK_FIELD or self.file is not None:
+            raise SkipFile()
+
+        path = partial_path(self.upload)
+        self.file = open(path, 'r+b' if os.path.exists(path) else 'wb')
+        # drop whatever a failed earlier attempt left past the offset
+        self.file.truncate(self.offset)
+        self.file.seek(self.offset)
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.position + len(raw_data) > self.upload.size:
+            raise ValidationError({'chunk': 'Upload is larger than its declared size'})
+
+        if self.position < SIGNATURE_BYTES:
+            self.check_signature(raw_data)
+
+        self.file.write(raw_data)
+        self.position += len(raw_data)
+
+    def check_signature(self, raw_data):
+        # the first bytes may be split over parser chunks, never over requests
+        # (receive_chunk refuses a first request shorter than SIGNATURE_BYTES)
+        self.head += raw_data
+        if len(self.head) >= SIGNATURE_BYTES or self.position + len(raw_data) == self.upload.size:
+            if not matches_signature(self.file_type, self.head[:1024]):
+                raise ValidationError({'chunk': 'File content does not match its extension'})
+
+    def file_complete(self, file_size):
+        self.close()
+        # keep the chunk out of request.FILES; it is already on disk
+        return None
+
+    def upload_complete(self):
+        self.close()
+
+    def close(self):
+        if self.file is not None and not self.file.closed:
+            self.file.close()
+
+    @property
+    def received(self):
+        return self.position - self.offset if self.file is not None else 0
+
+def receive_chunk(request, upload, offset):
+    # request is a DRF request whose body has not been read yet
+    if upload.status != 'UPLOADING':
+        raise ValidationError({'status': 'Upload is already complete'})
+    if offset != upload.received:
+        raise ValidationError({'offset': f'Expected offset {upload.received}'})
+
+    lease = claim_offset(upload, offset)
+    handler = ChunkUploadHandler(upload, offset, request)
+    request._request.upload_handlers = [handler]
+    rows = ChunkedUpload.objects.filter(pk=upload.pk, received=offset, lease_until=lease)
+
+    try:
+        request.data
+
+        if not handler.received:
+            raise ValidationError({CHUNK_FIELD: 'No chunk data received'})
+        if handler.position < min(SIGNATURE_BYTES, upload.size):
+            raise ValidationError({CHUNK_FIELD: f'The first chunk must hold at least {SIGNATURE_BYTES} bytes'})
+    except BaseException:
+        rows.update(lease_until=None)
+        raise
+    finally:
+        handler.close()
+
+    if not rows.update(received=offset + handler.received, lease_until=None, updated_at=timezone.now()):
+        raise ValidationError({'offset': 'The chunk took longer than its lease; resend it'})
+
+    upload.received = offset + handler.received
+    return upload
+
+def lease_seconds():
+    return getattr(settings, 'CHUNKED_UPLOAD_LEASE_SECONDS', 600)
+
+def claim_offset(upload, offset):
+    # only the request holding the lease writes to the partial file
+    now = timezone.now()
+    lease = now + timedelta(seconds=lease_seconds())
+    claimed = (ChunkedUpload.objects.filter(pk=upload.pk, received=offset, status='UPLOADING')
+               .filter(Q(lease_until__isnull=True) | Q(lease_until__lt=now)).update(lease_until=lease))
+    if not claimed:
+        raise ValidationError({'offset': 'Another chunk is being stored at this offset'})
+    return lease
+
+def complete_upload(upload):
+    target = TARGETS[upload.target]
+    path = partial_path(upload)
+
+    with transaction.atomic():
+        # the row lock makes a second complete wait, then see COMPLETE and stop
+        upload.refresh_from_db(from_queryset=ChunkedUpload.objects.select_for_update())
+        if upload.status != 'UPLOADING':
+            raise ValidationError({'status': 'This upload is already complete'})
+        if upload.received != upload.size:
+            raise ValidationError({'received': f'Only {upload.received} of {upload.size} bytes received'})
+
+        obj = target.owned(upload.owner).select_for_update().filter(pk=upload.object_id).first()
+        if obj is None:
+            raise ValidationError({'object_id': 'Target no longer exists'})
+
+        with open(path, 'rb') as partial:
+            # FieldFile.save streams the file to storage chunk by chunk
+            getattr(obj, target.field).save(upload.filename, File(partial), save=False)
+        obj.save(update_fields=[target.field])
+
+        upload.status = 'COMPLETE'
+        upload.save(update_fields=['status', 'updated_at'])
+
+    os.remove(path)
+    return obj
+
+def discard_upload(upload):
+    try:
+        os.remove(partial_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+def purge_stale_uploads(older_than=None):
+    # unfinished uploads not touched since older_than, and their partial files
+    if older_than is None:
+        older_than = timezone.now() - timedelta(hours=getattr(settings, 'CHUNKED_UPLOAD_EXPIRY_HOURS', 24))
+
+    stale = ChunkedUpload.objects.filter(status='UPLOADING', updated_at__lt=older_than)
+    count = 0
+    for upload in stale.iterator():
+        discard_upload(upload)
+        count += 1
+    return count
@@ -1,13 +1,19 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .async_views import login_view
 from .views import (
     register_view, 
-    login_view, 
     profile_view,
+    import_users_view,
+    analytics_view,
     CategoryViewSet,
     CourseViewSet,
     ModuleViewSet,
-    LessonViewSet
+    LessonViewSet,
+    EnrollmentViewSet,
+    MyEnrollmentViewSet,
+    UploadViewSet
 )
 
 router = DefaultRouter()
@@ -16,10 +22,28 @@ router.register('categories', CategoryViewSet, basename='category')
 router.register('courses', CourseViewSet, basename='course')
 router.register('modules', ModuleViewSet, basename='module')
 router.register('lessons', LessonViewSet, basename='lesson')
+router.register('enrollments', EnrollmentViewSet, basename='enrollment')
+router.register('me/enrollments', MyEnrollmentViewSet, basename='my-enrollment')
+router.register('uploads', UploadViewSet, basename='upload')
 
 urlpatterns = [
     path('auth/register/', register_view, name='register'),
     path('auth/login/', login_view, name='login'),
     path('auth/profile/', profile_view, name='profile'),
+    path('users/import/', import_users_view, name='user-import'),
+    path('analytics/', analytics_view, name='instructor-analytics'),
     path('', include(router.urls)),
-]
\ No newline at end of file
+]
+
+if settings.ASYNC_READ_VIEWS:
+    # under ASGI the hot reads are coroutines; other methods still reach the viewsets
+    from .async_views import async_reads, course_list, course_detail, category_list, profile
+
+    urlpatterns = [
+        path('courses/', async_reads(CourseViewSet.as_view({'get': 'list', 'post': 'create'}), course_list)),
+        path('courses/<int:pk>/', async_reads(CourseViewSet.as_view({
+            'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy',
+        }), course_detail)),
+        path('categories/', async_reads(CategoryViewSet.as_view({'get': 'list'}), category_list)),
+        path('auth/profile/', async_reads(profile_view, profile)),
+    ] + urlpatterns
\ No newline at end of file
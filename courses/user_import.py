@@ -0,0 +1,276 @@
+import csv
+import io
+import json
+import multiprocessing
+import os
+import re
+import secrets
+import threading
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from django.conf import settings
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, identify_hasher, make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from .models import CustomUser
+from .hashers import init_hash_worker
+
+# Bulk user import from CSV or JSONL.
+#
+# Rows are read lazily and handled batch by batch: validated, checked against
+# existing emails/usernames with one query per batch, hashed in a process pool
+# (password hashing is the dominant cost), then written with one bulk INSERT,
+# bypassing per-row save() and signals; profiles are created on first write.
+# Plain passwords go through AUTH_PASSWORD_VALIDATORS like any other password.
+# Rows may carry an already encoded password_hash instead, which skips hashing.
+# The hashing processes are started once per process and shared by every later
+# import, so an API import doesn't pay for spawning and setting up Django; there
+# are at most USER_IMPORT_POOL MAX_WORKERS of them, and they exit once no import
+# has used them for IDLE_SECONDS.
+# Rows that fail are reported with their line number and never stop the rest of
+# the import.
+
+BATCH_SIZE = 1000
+FIELDS = ('email', 'username', 'first_name', 'last_name', 'role', 'password', 'password_hash')
+ROLES = {role for role, _ in CustomUser.ROLE_CHOICES}
+NOT_UTF8 = re.compile('[\udc80-\udcff]')
+
+def read_rows(stream, format):
+    # yields (line number, row dict); stream is a text file object
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                # the reader skips the bad line, but has not counted it yet
+                yield reader.line_num + 1, {'_invalid': f'Malformed CSV: {e}'}
+                continue
+            yield reader.line_num, row
+    elif format == 'jsonl':
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row if isinstance(row, dict) else {'_invalid': 'Not a JSON object'}
+    else:
+        raise ValueError(f'Unsupported format: {format}')
+
+def guess_format(name):
+    return 'jsonl' if name.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+def text_stream(binary):
+    # undecodable bytes become lone surrogates, so clean_row can fail just their row
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', errors='surrogateescape', newline='')
+
+def decodes(value):
+    return not NOT_UTF8.search(value)
+
+def clean_row(row):
+    if '_invalid' in row:
+        return None, {'row': row['_invalid']}
+    if not all(decodes(str(value)) for value in [*row, *row.values()]):
+        return None, {'row': 'Not valid UTF-8'}
+
+    data = {field: str(row.get(field) or '').strip() for field in FIELDS}
+    data['email'] = CustomUser.objects.normalize_email(data['email'])
+    data['role'] = data['role'].upper() or 'STUDENT'
+    errors = {}
+
+    try:
+        validate_email(data['email'])
+    except ValidationError:
+        errors['email'] = 'Enter a valid email address'
+
+    if not data['username']:
+        errors['username'] = 'This field is required'
+    if data['role'] not in ROLES:
+        errors['role'] = f'Must be one of {", ".join(sorted(ROLES))}'
+    if data['password']:
+        user = CustomUser(email=data['email'], username=data['username'], first_name=data['first_name'], last_name=data['last_name'])
+        try:
+            validate_password(data['password'], user)
+        except ValidationError as e:
+            errors['password'] = ' '.join(e.messages)
+    if data['password_hash']:
+        # already hashed elsewhere (e.g. migrating from another Django site); kept as is
+        try:
+            identify_hasher(data['password_hash'])
+        except ValueError:
+            errors['password_hash'] = 'Unknown password hash format'
+
+    return data, errors
+
+def unusable_password():
+    # same shape as make_password(None), without its per-character random.choice
+    return UNUSABLE_PASSWORD_PREFIX + secrets.token_urlsafe(30)
+
+def hash_passwords(rows, executor):
+    # only plain passwords go through the pool; blank ones become unusable
+    hashes = [row['password_hash'] or (None if row['password'] else unusable_password()) for row in rows]
+    pending = [index for index, encoded in enumerate(hashes) if encoded is None]
+    passwords = [rows[index]['password'] for index in pending]
+
+    if executor is None:
+        encoded = map(make_password, passwords)
+    else:
+        encoded = executor.map(make_password, passwords, chunksize=64)
+
+    for index, value in zip(pending, encoded):
+        hashes[index] = value
+    return hashes
+
+class HashProcessPool:
+    def __init__(self, max_workers=4, idle_seconds=60):
+        self.max_workers = max_workers
+        self.idle_seconds = idle_seconds
+        self._executor = None
+        self._users = 0
+        self._idle_timer = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def executor(self, workers):
+        # sized by the first import that needs it, at most max_workers
+        with self._lock:
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+            if self._executor is None:
+                # spawn rather than fork: the parent may be a threaded web worker
+                self._executor = ProcessPoolExecutor(min(workers, self.max_workers), initializer=init_hash_worker,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            executor = self._executor
+            self._users += 1
+
+        try:
+            yield executor
+        except BrokenProcessPool:
+            # a worker died; the next import starts a fresh pool
+            self.discard(executor)
+            raise
+        finally:
+            with self._lock:
+                self._users -= 1
+                if not self._users and self._executor is not None:
+                    self._idle_timer = threading.Timer(self.idle_seconds, self.shutdown_idle)
+                    self._idle_timer.daemon = True
+                    self._idle_timer.start()
+
+    def discard(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def shutdown_idle(self):
+        # no import has used the processes for idle_seconds; let them exit
+        with self._lock:
+            if self._users or self._executor is None:
+                return
+            executor, self._executor = self._executor, None
+        executor.shutdown()
+
+pool_settings = getattr(settings, 'USER_IMPORT_POOL', {})
+hash_processes = HashProcessPool(
+    max_workers=pool_settings.get('MAX_WORKERS', 4),
+    idle_seconds=pool_settings.get('IDLE_SECONDS', 60),
+)
+
+class UserImporter:
+    def __init__(self, batch_size=BATCH_SIZE, workers=None):
+        self.batch_size = batch_size
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.created = 0
+        self.processed = 0
+        self.errors = []
+        self.seen_emails = set()
+        self.seen_usernames = set()
+
+    def run(self, rows):
+        with hash_processes.executor(self.workers) if self.workers > 1 else nullcontext() as executor:
+            rows = iter(rows)
+            while batch := list(islice(rows, self.batch_size)):
+                self.import_batch(batch, executor)
+
+        return self.report()
+
+    def report(self):
+        return {'processed': self.processed, 'created': self.created, 'failed': len(self.errors), 'errors': self.errors}
+
+    def fail(self, line, errors):
+        self.errors.append({'line': line, 'errors': errors})
+
+    def import_batch(self, batch, executor):
+        self.processed += len(batch)
+        valid = []
+
+        for line, row in batch:
+            data, errors = clean_row(row)
+            if not errors:
+                if data['email'].lower() in self.seen_emails:
+                    errors['email'] = 'Duplicate email in import'
+                elif data['username'] in self.seen_usernames:
+                    errors['username'] = 'Duplicate username in import'
+
+            if errors:
+                self.fail(line, errors)
+            else:
+                self.seen_emails.add(data['email'].lower())
+                self.seen_usernames.add(data['username'])
+                valid.append((line, data))
+
+        valid = self.drop_existing(valid)
+        if not valid:
+            return
+
+        hashes = hash_passwords([data for _, data in valid], executor)
+        users = [
+            (line, CustomUser(email=data['email'], username=data['username'], first_name=data['first_name'],
+                              last_name=data['last_name'], role=data['role'], password=encoded))
+            for (line, data), encoded in zip(valid, hashes)
+        ]
+
+        try:
+            with transaction.atomic():
+                self.insert([user for _, user in users])
+        except IntegrityError:
+            # lost a race with another writer; find the offending rows one by one
+            for line, user in users:
+                try:
+                    with transaction.atomic():
+                        self.insert([user])
+                except IntegrityError:
+                    self.fail(line, {'email': 'A user with this email or username already exists'})
+
+    def drop_existing(self, valid):
+        emails = {data['email'] for _, data in valid}
+        usernames = {data['username'] for _, data in valid}
+        taken_emails = set(CustomUser.objects.filter(email__in=emails).values_list('email', flat=True))
+        taken_usernames = set(CustomUser.objects.filter(username__in=usernames).values_list('username', flat=True))
+        remaining = []
+
+        for line, data in valid:
+            if data['email'] in taken_emails:
+                self.fail(line, {'email': 'A user with this email already exists'})
+            elif data['username'] in taken_usernames:
+                self.fail(line, {'username': 'A user with this username already exists'})
+            else:
+                remaining.append((line, data))
+        return remaining
+
+    def insert(self, users):
+        created = CustomUser.objects.bulk_create(users)
+        self.created += len(created)
+
+def import_users(stream, format, batch_size=BATCH_SIZE, workers=None):
+    return UserImporter(batch_size=batch_size, workers=workers).run(read_rows(stream, format))
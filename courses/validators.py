@@ -1,7 +1,70 @@
+from django.conf import settings
 from django.core.exceptions import ValidationError
+import codecs
 import os
 
+# Leading bytes of each accepted file type, so uploads are checked by content
+# and not only by their extension. Plain text has no signature; it is accepted
+# when its first bytes decode as UTF-8 and contain no NUL.
+FILE_SIGNATURES = {
+    'pdf': (b'%PDF-',),
+    'png': (b'\x89PNG\r\n\x1a\n',),
+    'jpeg': (b'\xff\xd8\xff',),
+    'docx': (b'PK\x03\x04',),
+    'doc': (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1',),
+}
+SIGNATURE_BYTES = 8
+
+EXTENSION_TYPES = {
+    '.pdf': 'pdf', '.doc': 'doc', '.docx': 'docx', '.txt': 'txt',
+    '.png': 'png', '.jpg': 'jpeg', '.jpeg': 'jpeg',
+}
+
+def file_type_for_name(name):
+    return EXTENSION_TYPES.get(os.path.splitext(name)[1].lower())
+
+def matches_signature(file_type, head):
+    if file_type == 'txt':
+        try:
+            codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        except UnicodeDecodeError:
+            return False
+        return b'\x00' not in head
+
+    return head.startswith(FILE_SIGNATURES.get(file_type, ()))
+
+def validate_file_signature(file):
+    file_type = file_type_for_name(file.name)
+    position = file.tell() if hasattr(file, 'tell') else 0
+
+    file.seek(0)
+    head = file.read(1024)
+    file.seek(position)
+
+    if file_type is not None and not matches_signature(file_type, head):
+        raise ValidationError('File content does not match its extension!')
+
+# Size limits by kind of file, shared by form and serializer uploads and the
+# chunked upload targets (courses/uploads.py); CHUNKED_UPLOAD_MAX_SIZE overrides.
+DEFAULT_MAX_SIZE = {'document': 500 * 1024 * 1024, 'image': 10 * 1024 * 1024}
+
+def max_upload_size(kind):
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', {}).get(kind, DEFAULT_MAX_SIZE[kind])
+
+def check_file_size(file, kind):
+    max_size_bytes = max_upload_size(kind)
+
+    if file.size > max_size_bytes:
+        raise ValidationError(f'File size must be less than {max_size_bytes // (1024 * 1024)}MB!')
+
+def validate_document_size(file):
+    check_file_size(file, 'document')
+
+def validate_image_size(file):
+    check_file_size(file, 'image')
+
 def validate_file_size(file):
+    # no longer used by the models; referenced by migration 0004
     max_size_mb = 5
     max_size_bytes = max_size_mb * 1024 * 1024
 
@@ -16,6 +79,8 @@ def validate_image_file(file):
     if ext not in valid_extensions:
         raise ValidationError(f'Invalid file type. Allowed: {" ".join(valid_extensions)}')
 
+    validate_file_signature(file)
+
 def validate_video_url(value):
     allowed_url = False
     allowed_domains = ['youtube.com']
@@ -33,4 +98,6 @@ def validate_document_file(file):
     valid_extensions = ['.pdf', '.doc', '.docx', '.txt']
 
     if ext not in valid_extensions:
-        raise ValidationError(f'Invalid file type. Allowed: {" ".join(valid_extensions)}')
\ No newline at end of file
+        raise ValidationError(f'Invalid file type. Allowed: {" ".join(valid_extensions)}')
+
+    validate_file_signature(file)
\ No newline at end of file
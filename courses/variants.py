@@ -0,0 +1,137 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import Q
+from .cache import course_tree_cache, bump_catalog_version
+from .imaging import render_variants
+from .models import Course, CustomUser
+
+# Responsive image variants for course thumbnails and profile pictures.
+#
+# After an upload commits, the source image is resized to fixed widths in WebP
+# and JPEG on a process pool. Variants are stored under their content hash, so
+# their URLs can be cached forever, and their storage names are written to a
+# JSON column on the row. Serializers turn that column into URLs without
+# touching storage (no stat calls per row). The column also records the source
+# name, which tells whether the current image already has variants.
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'WIDTHS': (160, 320, 640),
+    'FORMATS': ('webp', 'jpeg'),
+    'QUALITY': 80,
+    'WORKERS': 2,
+    # False renders in the committing thread instead (tests, management commands)
+    'BACKGROUND': True,
+}
+
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+# model -> (image field, variants field)
+IMAGE_FIELDS = {
+    Course: ('thumbnail', 'thumbnail_variants'),
+    CustomUser: ('profile_picture', 'profile_picture_variants'),
+}
+
+def variant_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'IMAGE_VARIANTS', {})}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn rather than fork: the parent may be a threaded web worker
+                _executor = ProcessPoolExecutor(variant_settings()['WORKERS'], mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+def variant_urls(variants, storage, request=None):
+    # {'webp': {'320': url, ...}, 'jpeg': {...}} from the stored names
+    urls = {}
+
+    for image_format, names in (variants or {}).items():
+        if image_format == 'source':
+            continue
+        urls[image_format] = {
+            width: request.build_absolute_uri(storage.url(name)) if request is not None else storage.url(name)
+            for width, name in names.items()
+        }
+    return urls
+
+def needs_variants(instance):
+    field, variants_field = IMAGE_FIELDS[type(instance)]
+    return (getattr(instance, field).name or '') != (getattr(instance, variants_field) or {}).get('source', '')
+
+def schedule_variants(instance, update_fields=None):
+    model = type(instance)
+
+    if update_fields is not None and IMAGE_FIELDS[model][0] not in update_fields:
+        return
+
+    if needs_variants(instance):
+        name = getattr(instance, IMAGE_FIELDS[model][0]).name or ''
+        transaction.on_commit(lambda: generate_variants(model, instance.pk, name))
+
+def generate_variants(model, pk, name):
+    # runs after commit; a bad image only costs its variants, never the request
+    config = variant_settings()
+
+    try:
+        if not name:
+            save_variants(model, pk, name, [])
+            return
+
+        storage = model._meta.get_field(IMAGE_FIELDS[model][0]).storage
+        with storage.open(name, 'rb') as source:
+            args = (source.read(), config['WIDTHS'], config['FORMATS'], config['QUALITY'])
+
+        if not config['BACKGROUND']:
+            save_variants(model, pk, name, render_variants(*args))
+            return
+    except Exception:
+        logger.exception('Could not generate image variants for %s %s', model.__name__, pk)
+        return
+
+    future = get_executor().submit(render_variants, *args)
+    future.add_done_callback(lambda done: _finish(model, pk, name, done))
+
+def _finish(model, pk, name, future):
+    # runs on the executor's result thread, which has its own connection
+    try:
+        save_variants(model, pk, name, future.result())
+    except Exception:
+        logger.exception('Could not generate image variants for %s %s', model.__name__, pk)
+    finally:
+        connection.close()
+
+def save_variants(model, pk, name, rendered):
+    field, variants_field = IMAGE_FIELDS[model]
+    storage = model._meta.get_field(field).storage
+    directory = os.path.dirname(name)
+    variants = {'source': name} if name else {}
+
+    for image_format, width, digest, content in rendered:
+        path = os.path.join(directory, 'variants', f'{digest}.{EXTENSIONS[image_format]}')
+        if not storage.exists(path):
+            storage.save(path, ContentFile(content))
+        variants.setdefault(image_format, {})[str(width)] = path
+
+    # a newer upload may have replaced the source meanwhile; its own run wins
+    current = Q(**{field: name}) if name else Q(**{field: ''}) | Q(**{f'{field}__isnull': True})
+    if not model.objects.filter(current, pk=pk).update(**{variants_field: variants}):
+        return
+
+    course_ids = [pk] if model is Course else list(Course.objects.filter(instructor_id=pk).values_list('id', flat=True))
+    if course_ids:
+        bump_catalog_version()
+    course_tree_cache.bump_many(course_ids)
@@ -1,12 +1,36 @@
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny, IsAuthenticated, IsAuthenticatedOrReadOnly
+import json
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.decorators import api_view, permission_classes, parser_classes, action
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied
-from rest_framework import status, viewsets
-from rest_framework_simplejwt.tokens import RefreshToken
-from .serializers import UserRegisterationSerializer, UserLoginSerializer, UserSerializer, CategorySerializer, CourseListSerializer, CourseDetailSerializer, ModuleSerializer, LessonSerializer
-from .models import Category, Course, CourseModule, Lesson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.exceptions import PermissionDenied, NotAuthenticated, NotFound, ValidationError
+from rest_framework import status, viewsets, mixins
+from django_filters.rest_framework import DjangoFilterBackend
+from .serializers import UserRegisterationSerializer, UserSerializer, CategoryListSerializer, CourseListSerializer, CourseDetailSerializer, CourseSearchSerializer, ModuleSerializer, LessonSerializer, EnrollmentSerializer, EnrollmentProgressSerializer, MyEnrollmentSerializer, BulkEnrollmentSerializer, ReorderSerializer, MoveSerializer, AnalyticsQuerySerializer, CourseTreeSerializer, CourseBatchSerializer, CourseImportSerializer, CourseExportQuerySerializer, UserImportSerializer, ChunkedUploadSerializer
+from .models import CustomUser, Category, Course, CourseModule, Lesson, Enrollment, ChunkedUpload
 from .permissions import IsInstructorOrReadOnly
+from .encoders import encode_course_tree, with_course_tree
+from .cache import course_tree_cache, catalog_stamp
+from .pagination import CourseKeysetPagination, LessonKeysetPagination, EnrollmentKeysetPagination
+from .conditional import make_etag, not_modified, add_validators
+from .search import search_courses
+from .filters import CourseFilter, course_facets
+from .progress import PROGRESS_FIELDS, complete_lesson
+from .enrollment import bulk_enroll
+from .authentication import tokens_for_user
+from .user_import import import_users, guess_format, text_stream
+from .uploads import TARGETS, receive_chunk, complete_upload, discard_upload
+from .media import protected_file_response
+from .categories import category_snapshot, category_list_response
+from .ordering import reorder_siblings, move_sibling
+from .db import read_from_replica, primary_while_recent, using_primary
+from .analytics import dashboard
+from .authoring import create_course_tree, add_to_course
+from .archive import CourseExport, import_course
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -22,34 +46,33 @@ def register_view(request):
 
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-@api_view(['POST'])
-@permission_classes([AllowAny])
-def login_view(request):
-    serializer = UserLoginSerializer(data=request.data)
-
-    if serializer.is_valid():
-        user = serializer.validated_data['user']
-        refresh = RefreshToken.for_user(user)
+def login_payload(user):
+    # the login response; the view itself is a coroutine (courses.async_views.login_view)
+    refresh = tokens_for_user(user)
+    return {
+        'access_token': str(refresh.access_token),
+        'refresh_token': str(refresh),
+        'user': UserSerializer(user).data
+    }
 
-        user_serializer = UserSerializer(user)
-
-        response_data = {
-            'access_token': str(refresh.access_token),
-            'refresh_token': str(refresh),
-            'user': user_serializer.data
-        }
-
-        return Response(response_data, status=status.HTTP_200_OK)
-    
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+@parser_classes([MultiPartParser])
+def import_users_view(request):
+    serializer = UserImportSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
 
+    upload = serializer.validated_data['file']
+    report = import_users(text_stream(upload.file), serializer.validated_data.get('format') or guess_format(upload.name))
+    return Response(report, status=status.HTTP_200_OK)
 
 @api_view(['GET', 'PUT', 'PATCH'])
 @permission_classes([IsAuthenticated])
 def profile_view(request):
-    if request.method == 'GET':
-        user = request.user
+    # request.user may be a token-backed ClaimsUser, so load the model instance
+    user = CustomUser.objects.select_related('profile').get(pk=request.user.pk)
 
+    if request.method == 'GET':
         serializer = UserSerializer(user)
 
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -57,8 +80,6 @@ def profile_view(request):
     if request.method in ['PUT', 'PATCH']:
         is_partial = request.method == 'PATCH'
 
-        user = request.user
-
         serializer = UserSerializer(user, data=request.data, partial=is_partial)
 
         if serializer.is_valid():
@@ -67,24 +88,262 @@ def profile_view(request):
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def analytics_view(request):
+    # reads the daily rollups only (courses/analytics.py), never Enrollment
+    if request.user.role != 'INSTRUCTOR':
+        raise PermissionDenied('Only instructors have course analytics!')
+
+    serializer = AnalyticsQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    course_id = serializer.validated_data.get('course')
+
+    if course_id is not None and not Course.objects.filter(pk=course_id, instructor_id=request.user.pk).exists():
+        raise NotFound('Course not found!')
+
+    data = dashboard(request.user.pk, serializer.validated_data.get('start'), serializer.validated_data.get('end'), course_id)
+    return Response(data, status=status.HTTP_200_OK)
+
 class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Category.objects.all()
-    serializer_class = CategorySerializer
+    serializer_class = CategoryListSerializer
     permission_classes = [AllowAny]
 
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        read_from_replica(request)
+
+    # both actions read the in-process snapshot; a request makes no query
+    def list(self, request, *args, **kwargs):
+        snapshot = category_snapshot.get()
+
+        if request.accepted_renderer.format != 'json':
+            return Response(snapshot.page_data(snapshot.page_number(request.query_params.get('page') or 1), request))
+        return category_list_response(request, snapshot)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            body = category_snapshot.get().items[int(self.kwargs['pk'])]
+        except (KeyError, ValueError):
+            raise NotFound('No Category matches the given query.')
+
+        if request.accepted_renderer.format != 'json':
+            return Response(json.loads(body))
+        return HttpResponse(body, content_type='application/json')
+
+def course_queryset(user):
+    if user.is_authenticated and user.role == 'INSTRUCTOR':
+        queryset = Course.objects.filter(instructor_id=user.pk)
+    else:
+        queryset = Course.objects.filter(is_published=True)
+
+    # join instructor/category instead of one lazy query per row in the serializer
+    return queryset.select_related('instructor', 'category')
+
+def catalog_scope(user):
+    # instructors see their own drafts; everyone else shares the public validators
+    if user.is_authenticated and user.role == 'INSTRUCTOR':
+        return f'instructor:{user.pk}'
+    return 'public'
+
+def course_list_etag(request, user, version):
+    return make_etag('courses', catalog_scope(user), request.get_full_path(), version)
+
+def course_tree_etag(course_id, user, version):
+    return make_etag('course', course_id, version, catalog_scope(user))
+
 class CourseViewSet(viewsets.ModelViewSet):
     queryset = Course.objects.all()
     serializer_class = CourseListSerializer
     permission_classes = [IsInstructorOrReadOnly]
+    pagination_class = CourseKeysetPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = CourseFilter
+
+    list_only_fields = [
+        'id', 'title', 'slug', 'thumbnail', 'thumbnail_variants', 'price', 'level', 'is_published', 'created_at',
+        'instructor', 'instructor__first_name', 'instructor__last_name',
+        'category', 'category__name', 'lesson_count',
+        'stats__module_count', 'stats__total_duration', 'stats__enrollment_count', 'stats__completed_count',
+    ]
+
+    @classmethod
+    def list_queryset(cls, queryset):
+        # exactly what CourseListSerializer reads, stats included, in one joined query
+        return queryset.select_related('stats').only(*cls.list_only_fields)
 
     def get_queryset(self):
-        user = self.request.user
+        queryset = course_queryset(self.request.user)
+
+        if self.action == 'list':
+            return self.list_queryset(queryset)
+        elif self.action == 'retrieve':
+            return with_course_tree(queryset)
+        # writes answer with CourseListSerializer, which reads the stats
+        return queryset.select_related('stats')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        read_from_replica(request)
+
+    def list(self, request, *args, **kwargs):
+        # validators come from the catalog version stamp, so a 304 never touches the database
+        version, last_modified = catalog_stamp()
+        etag = course_list_etag(request, request.user, version)
+
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        primary_while_recent(last_modified)
+        return add_validators(Response(self.list_page(request)), etag, last_modified)
+
+    def list_page(self, request):
+        # the page body after the 304 check; courses.async_views runs it in a thread
+        data = super().list(request).data
+
+        if request.query_params.get('facets') in ('1', 'true'):
+            data['facets'] = course_facets(self.get_queryset(), request.query_params)
+        return data
+
+    def retrieve(self, request, *args, **kwargs):
+        course_id = str(self.kwargs.get(self.lookup_field, ''))
+
+        if not course_id.isdigit():
+            return Response(self.tree(request))
+
+        version, last_modified = course_tree_cache.stamp(course_id)
+        etag = course_tree_etag(course_id, request.user, version)
+
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        primary_while_recent(last_modified)
+
+        # instructors see their own drafts, so only the published view is cached
+        if catalog_scope(request.user) != 'public' or request.accepted_renderer.format != 'json':
+            return add_validators(Response(self.tree(request)), etag, last_modified)
+
+        body, cache_status = self.cached_tree(request, course_id, version)
+        response = HttpResponse(body, content_type='application/json', headers={'X-Cache': cache_status})
+        return add_validators(response, etag, last_modified)
+
+    def tree(self, request):
+        return encode_course_tree(self.get_object(), request)
+
+    def cached_tree(self, request, course_id, version):
+        # (JSON body of the published tree, 'HIT' or 'MISS')
+        host = request.build_absolute_uri('/')
+        body = course_tree_cache.get(course_id, version, host)
+        if body is not None:
+            return body, 'HIT'
+
+        # the body is shared under this version, so read it from the primary
+        with using_primary():
+            body = JSONRenderer().render(self.tree(request))
+        course_tree_cache.set(course_id, version, host, body)
+        return body, 'MISS'
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        params = CourseSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+
+        result = search_courses(query['q'], category=query.get('category'), level=query.get('level'),
+                                limit=query['limit'], offset=query['offset'])
+
+        ids = [course_id for course_id, _, _ in result.hits]
+        courses = self.list_queryset(Course.objects.filter(pk__in=ids).select_related('instructor', 'category')).in_bulk()
+        category_names = dict(Category.objects.filter(pk__in=result.facets['category']).values_list('id', 'name'))
+
+        results = []
+        for course_id, score, snippet in result.hits:
+            # the index may briefly lead the database inside other transactions
+            if course_id in courses:
+                row = CourseListSerializer(courses[course_id], context=self.get_serializer_context()).data
+                row['score'] = round(score, 4)
+                row['highlight'] = snippet
+                results.append(row)
+
+        return Response({
+            'count': result.total,
+            'results': results,
+            'facets': {
+                'category': [{'id': category_id, 'name': category_names.get(category_id), 'count': count}
+                             for category_id, count in sorted(result.facets['category'].items(), key=lambda item: -item[1])],
+                'level': [{'level': level, 'count': count} for level, count in sorted(result.facets['level'].items(), key=lambda item: -item[1])],
+            },
+        })
+
+    @action(detail=True, methods=['post'], url_path='modules/reorder')
+    def reorder_modules(self, request, pk=None):
+        course = self.get_object()
+        serializer = ReorderSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        orders = reorder_siblings(CourseModule.objects.filter(course=course), serializer.validated_data['ids'])
+        # queryset updates skip the module signals
+        course_tree_cache.bump(course.pk)
+        return Response([{'id': module_id, 'order': order} for module_id, order in orders.items()])
+
+    @action(detail=False, methods=['post'], url_path='tree', url_name='create-tree')
+    def create_tree(self, request):
+        # a course with all its modules and lessons, in one transaction
+        serializer = CourseTreeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        course = create_course_tree(request.user.pk, dict(serializer.validated_data))
+        tree = encode_course_tree(with_course_tree(Course.objects.all()).get(pk=course.pk), request)
+        return Response(tree, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'], url_path='tree', url_name='extend-tree')
+    def extend_tree(self, request, pk=None):
+        # new modules (with their lessons) and lessons for existing modules
+        course = self.get_object()
+        serializer = CourseBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lessons = serializer.validated_data['lessons']
+
+        module_ids = {lesson['module'] for lesson in lessons}
+        if module_ids:
+            found = set(CourseModule.objects.filter(course=course, pk__in=module_ids).values_list('pk', flat=True))
+            if found != module_ids:
+                raise ValidationError({'lessons': f'Modules not in this course: {sorted(module_ids - found)}'})
+
+        modules, lessons = add_to_course(course.pk, serializer.validated_data['modules'], lessons)
+        return Response({'modules': [module.pk for module in modules], 'lessons': [lesson.pk for lesson in lessons]},
+                        status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        # the course with its modules, lessons and files as a streamed archive (courses/archive.py)
+        course = self.get_object()
+        if course.instructor_id != request.user.pk:
+            raise PermissionDenied('Only the course instructor can export it.')
+        params = CourseExportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        compress = params.validated_data['compress']
+
+        # the manifest is written before the response starts, so errors still get a status
+        export = CourseExport(course.pk)
+        export.write_manifest()
+        filename = f'{course.slug}.tar.gz' if compress else f'{course.slug}.tar'
+        return StreamingHttpResponse(export.stream(compress), content_type='application/gzip' if compress else 'application/x-tar',
+                                     headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+    @action(detail=False, methods=['post'], url_path='import', url_name='import', parser_classes=[MultiPartParser])
+    def import_archive(self, request):
+        serializer = CourseImportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # instructors import into existing categories; staff may add new ones
+        course = import_course(serializer.validated_data['file'].file, request.user.pk, serializer.validated_data.get('slug'),
+                               create_categories=request.user.is_staff)
+        tree = encode_course_tree(with_course_tree(Course.objects.all()).get(pk=course.pk), request)
+        return Response(tree, status=status.HTTP_201_CREATED)
 
-        if user.is_authenticated and user.role == 'INSTRUCTOR':
-            return Course.objects.filter(instructor=user)
-        else:
-            return Course.objects.filter(is_published=True)
-        
     def get_serializer_class(self):
         if self.action == 'list':
             return CourseListSerializer
@@ -93,14 +352,17 @@ class CourseViewSet(viewsets.ModelViewSet):
         return CourseListSerializer
     
     def perform_create(self, serializer):
-        serializer.save(instructor=self.request.user)
+        serializer.save(instructor_id=self.request.user.pk)
 
 class ModuleViewSet(viewsets.ModelViewSet):
     queryset = CourseModule.objects.all()
     serializer_class = ModuleSerializer
     permission_classes = [IsInstructorOrReadOnly]
+    # the custom actions filter on pk directly; anything else is a 404 from the router
+    lookup_value_regex = r'\d+'
 
     def get_queryset(self):
+        queryset = CourseModule.objects.all()
         course_id = self.request.query_params.get('course_id')
 
         if course_id:
@@ -115,27 +377,120 @@ class ModuleViewSet(viewsets.ModelViewSet):
             raise ValueError('Course field is required!')
 
         try:
-            course = Course.objects.get(id=course_id)
+            course = Course.objects.only('id', 'instructor_id').get(id=course_id)
         except Course.DoesNotExist:
             raise ValueError('Course not found!')
 
-        if course.instructor != self.request.user:
+        if course.instructor_id != self.request.user.pk:
             raise PermissionDenied('You can only add modules to your own courses!')
         
         serializer.save(course=course)
 
+    def owned_module(self, pk):
+        module = CourseModule.objects.select_related('course').only('id', 'course_id', 'course__instructor_id').filter(pk=pk).first()
+
+        if module is None:
+            raise NotFound('Module not found!')
+        if module.course.instructor_id != self.request.user.pk:
+            raise PermissionDenied('You can only reorder your own courses!')
+
+        return module
+
+    @action(detail=True, methods=['post'], url_path='lessons/reorder')
+    def reorder_lessons(self, request, pk=None):
+        module = self.owned_module(pk)
+        serializer = ReorderSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        orders = reorder_siblings(Lesson.objects.filter(module=module), serializer.validated_data['ids'])
+        course_tree_cache.bump(module.course_id)
+        return Response([{'id': lesson_id, 'order': order} for lesson_id, order in orders.items()])
+
+    @action(detail=True, methods=['post'])
+    def move(self, request, pk=None):
+        module = self.owned_module(pk)
+        serializer = MoveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        order = move_sibling(CourseModule.objects.filter(course_id=module.course_id), module.pk, serializer.validated_data['after'])
+        course_tree_cache.bump(module.course_id)
+        return Response({'id': module.pk, 'order': order})
+
 class LessonViewSet(viewsets.ModelViewSet):
     queryset = Lesson.objects.all()
     serializer_class = LessonSerializer
     permission_classes = [IsInstructorOrReadOnly]
+    lookup_value_regex = r'\d+'
+    pagination_class = LessonKeysetPagination
 
     def get_queryset(self):
+        queryset = Lesson.objects.all()
         module_id = self.request.query_params.get('module_id')
 
         if module_id:
-            queryset = queryset.filter(id=module_id)
+            queryset = queryset.filter(module_id=module_id)
 
         return queryset
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def complete(self, request, pk=None):
+        # the enrollment and the course's lesson count come back in one joined query
+        enrollment = (Enrollment.objects.select_related('course').only('id', 'course__lesson_count', *PROGRESS_FIELDS)
+                      .filter(student_id=request.user.pk, course__modules__lessons=pk).first())
+
+        if enrollment is None:
+            if not Lesson.objects.filter(pk=pk).exists():
+                raise NotFound('Lesson not found!')
+            raise PermissionDenied('You are not enrolled in this course!')
+
+        created = complete_lesson(enrollment, pk, enrollment.course.lesson_count)
+
+        data = EnrollmentProgressSerializer(enrollment).data
+        return Response(data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], permission_classes=[AllowAny])
+    def document(self, request, pk=None):
+        # lesson, course owner and the caller's enrollment in one query; the
+        # enrollment check is a probe of the (student, course) unique index
+        user = request.user
+        lesson = (Lesson.objects.filter(pk=pk)
+                  .annotate(course_instructor_id=F('module__course__instructor_id'),
+                            course_published=F('module__course__is_published'),
+                            enrolled=Exists(Enrollment.objects.filter(student_id=user.pk, course_id=OuterRef('module__course_id'))))
+                  .only('id', 'document_file', 'is_preview').first())
+
+        if lesson is None or not lesson.document_file:
+            raise NotFound('Lesson document not found!')
+
+        owner = user.is_staff or (user.is_authenticated and lesson.course_instructor_id == user.pk)
+        # drafts are visible to their instructor only, like the course itself
+        if not (owner or lesson.course_published):
+            raise NotFound('Lesson document not found!')
+
+        if not (owner or lesson.is_preview or lesson.enrolled):
+            if not user.is_authenticated:
+                raise NotAuthenticated()
+            raise PermissionDenied('You are not enrolled in this course!')
+
+        return protected_file_response(request, lesson.document_file)
+
+    @action(detail=True, methods=['post'])
+    def move(self, request, pk=None):
+        lesson = (Lesson.objects.filter(pk=pk)
+                  .annotate(course_id=F('module__course_id'), course_instructor_id=F('module__course__instructor_id'))
+                  .only('id', 'module_id').first())
+
+        if lesson is None:
+            raise NotFound('Lesson not found!')
+        if lesson.course_instructor_id != request.user.pk:
+            raise PermissionDenied('You can only reorder your own courses!')
+
+        serializer = MoveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        order = move_sibling(Lesson.objects.filter(module_id=lesson.module_id), lesson.pk, serializer.validated_data['after'])
+        course_tree_cache.bump(lesson.course_id)
+        return Response({'id': lesson.pk, 'order': order})
     
     def perform_create(self, serializer):
         module_id = self.request.data.get('module')
@@ -144,11 +499,103 @@ class LessonViewSet(viewsets.ModelViewSet):
             raise ValueError('Module field is required!')
         
         try:
-            module = CourseModule.objects.get(id=module_id)
+            # the owner check reads the course through the same query
+            module = CourseModule.objects.select_related('course').only('id', 'course__instructor_id').get(id=module_id)
         except CourseModule.DoesNotExist:
             raise ValueError('Module not found!')
         
-        if module.course.instructor != self.request.user:
+        if module.course.instructor_id != self.request.user.pk:
             raise PermissionDenied("You can only add lessons to your own courses!")
         
-        serializer.save(module=module)
\ No newline at end of file
+        serializer.save(module=module)
+
+class EnrollmentViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                        mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    serializer_class = EnrollmentSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = EnrollmentKeysetPagination
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = Enrollment.objects.select_related('student', 'course')
+
+        if user.role == 'INSTRUCTOR':
+            return queryset.filter(course__instructor_id=user.pk)
+        return queryset.filter(student_id=user.pk)
+
+    def perform_create(self, serializer):
+        if self.request.user.role != 'STUDENT':
+            raise PermissionDenied('Only students can enroll in courses!')
+
+        # the unique (student, course) constraint decides, no exists() pre-check
+        try:
+            with transaction.atomic():
+                serializer.save(student_id=self.request.user.pk)
+        except IntegrityError:
+            raise ValidationError('Student already enrolled in this course')
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        serializer = BulkEnrollmentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        course = serializer.validated_data['course']
+
+        if course.instructor_id != request.user.pk and not request.user.is_staff:
+            raise PermissionDenied('You can only enroll students in your own courses!')
+
+        result = bulk_enroll(course, serializer.validated_data['students'], serializer.validated_data['emails'])
+        return Response(result, status=status.HTTP_200_OK)
+
+class MyEnrollmentViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    serializer_class = MyEnrollmentSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = EnrollmentKeysetPagination
+
+    feed_only_fields = [
+        'id', 'course', 'enrolled_at', 'next_lesson', *PROGRESS_FIELDS,
+        'course__title', 'course__slug', 'course__thumbnail', 'course__thumbnail_variants', 'course__level', 'course__lesson_count',
+        'course__instructor', 'course__instructor__first_name', 'course__instructor__last_name',
+        'course__category', 'course__category__name',
+        'next_lesson__title', 'next_lesson__module', 'next_lesson__duration',
+    ]
+
+    def get_queryset(self):
+        # one query: a seek on the (student, -enrolled_at, -id) index with the course,
+        # its instructor and category and the stored next lesson joined
+        return (Enrollment.objects.filter(student_id=self.request.user.pk)
+                .select_related('course__instructor', 'course__category', 'next_lesson').only(*self.feed_only_fields))
+
+class UploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    serializer_class = ChunkedUploadSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return ChunkedUpload.objects.filter(owner_id=self.request.user.pk)
+
+    def perform_create(self, serializer):
+        serializer.save(owner_id=self.request.user.pk)
+
+    def perform_destroy(self, instance):
+        discard_upload(instance)
+
+    @action(detail=True, methods=['post'], parser_classes=[MultiPartParser])
+    def chunk(self, request, pk=None):
+        # the offset comes from the query string: the handler needs it before the body is parsed
+        upload = self.get_object()
+
+        try:
+            offset = int(request.query_params.get('offset', upload.received))
+        except ValueError:
+            raise ValidationError({'offset': 'A valid integer is required.'})
+
+        receive_chunk(request, upload, offset)
+        return Response(self.get_serializer(upload).data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        upload = self.get_object()
+        obj = complete_upload(upload)
+
+        data = self.get_serializer(upload).data
+        data['url'] = request.build_absolute_uri(getattr(obj, TARGETS[upload.target].field).url)
+        return Response(data, status=status.HTTP_200_OK)
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'learning_platform.settings')
+# the async read views (courses.async_views) are opt-in with ASYNC_READ_VIEWS=1;
+# bench_asgi still measures them slower than the DRF views, so they are off by default
 
 application = get_asgi_application()
@@ -0,0 +1,52 @@
+# DATABASES from the environment.
+#
+#   DB_ENGINE        sqlite3 (default) or postgresql
+#   DB_NAME          file for SQLite (default BASE_DIR/db.sqlite3), database name otherwise
+#   DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+#                    server databases only
+#   DB_REPLICAS      comma-separated replica hosts (postgresql) or files (sqlite3),
+#                    configured as replica_1, replica_2, ...
+#   DB_CONN_MAX_AGE  seconds a connection is kept for reuse (default 60)
+#   DB_POOL          1 for psycopg's connection pool (needs psycopg[pool]);
+#                    connections are then pooled instead of persistent
+#
+# Replicas mirror the primary under the test runner, and are only read from
+# through courses.db.ReplicaRouter.
+
+def database_settings(environ, base_dir):
+    engine = environ.get('DB_ENGINE', 'sqlite3')
+    conn_max_age = int(environ.get('DB_CONN_MAX_AGE', 60))
+
+    if engine == 'sqlite3':
+        primary = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': environ.get('DB_NAME') or base_dir / 'db.sqlite3',
+            'CONN_MAX_AGE': conn_max_age,
+            # take the write lock at BEGIN, so a reader never fails to upgrade mid-transaction
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        }
+        replica_field = 'NAME'
+    elif engine == 'postgresql':
+        pooled = environ.get('DB_POOL') == '1'
+        primary = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': environ.get('DB_NAME', 'learning_platform'),
+            'USER': environ.get('DB_USER', ''),
+            'PASSWORD': environ.get('DB_PASSWORD', ''),
+            'HOST': environ.get('DB_HOST', ''),
+            'PORT': environ.get('DB_PORT', ''),
+            'CONN_MAX_AGE': 0 if pooled else conn_max_age,
+            'CONN_HEALTH_CHECKS': not pooled,
+            'OPTIONS': {'pool': True} if pooled else {},
+        }
+        replica_field = 'HOST'
+    else:
+        raise ValueError(f'Unsupported DB_ENGINE {engine!r}; use sqlite3 or postgresql')
+
+    databases = {'default': primary}
+    replicas = [value.strip() for value in environ.get('DB_REPLICAS', '').split(',') if value.strip()]
+
+    for index, value in enumerate(replicas, 1):
+        databases[f'replica_{index}'] = {**primary, replica_field: value, 'TEST': {'MIRROR': 'default'}}
+
+    return databases
@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
+from .databases import database_settings
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -49,7 +51,7 @@ INSTALLED_APPS = [
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'courses.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -71,6 +73,11 @@ SIMPLE_JWT = {
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
 }
 
+# How long CachedJWTAuthentication trusts a cached (token_version, is_active) pair.
+# Kept in the 'shared' cache so revocations reach every worker at once.
+AUTH_USER_STATE_CACHE = 'shared'
+AUTH_USER_STATE_TTL = 60
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -104,12 +111,42 @@ WSGI_APPLICATION = 'learning_platform.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+# Configured from DB_* environment variables, see learning_platform/databases.py.
+DATABASES = database_settings(os.environ, BASE_DIR)
+
+# Applied to every SQLite connection as it opens (courses/db.py). WAL lets
+# readers run alongside the writer; NORMAL sync is safe with WAL.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+# Catalog GETs read from a replica when DB_REPLICAS is set. A user who made a
+# write request reads from the primary for REPLICA_PIN_SECONDS afterwards.
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+REPLICA_PIN_SECONDS = 5
+REPLICA_PIN_CACHE = 'shared'
+DATABASE_ROUTERS = ['courses.db.ReplicaRouter']
+
+if REPLICA_DATABASES:
+    MIDDLEWARE.append('courses.db.ReplicaRoutingMiddleware')
+
+# 'shared' holds what every worker must agree on: version stamps, cached auth
+# state and the replica pin. SHARED_CACHE_URL points it at Redis (needs redis-py);
+# without one it is process-local, which courses.checks only accepts for a
+# single worker (WEB_CONCURRENCY) without replicas.
+SHARED_CACHE_URL = os.environ.get('SHARED_CACHE_URL')
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': (
+        {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': SHARED_CACHE_URL}
+        if SHARED_CACHE_URL else
+        {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'}
+    ),
 }
+WEB_WORKERS = int(os.environ.get('WEB_CONCURRENCY', 1))
 
 
 # Password validation
@@ -154,17 +191,106 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
-import os
-
 # Media files (uploads)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Opt-in, ASGI only (ASYNC_READ_VIEWS=1): the course list/detail, category list
+# and profile GETs are then served by the coroutines in courses/async_views.py.
+# Off by default until bench_asgi measures them faster than the DRF views.
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS') == '1'
+
+# Lesson documents go out through /api/lessons/<id>/document/ (courses/media.py).
+# 'django' streams them (Range requests included); 'nginx' answers with
+# X-Accel-Redirect to PROTECTED_MEDIA_ACCEL_PREFIX + file name, which nginx maps
+# to MEDIA_ROOT in an `internal` location; 'sendfile' sets X-Sendfile
+# (Apache mod_xsendfile). Either way the front server must not expose
+# MEDIA_ROOT/lessons/ publicly.
+PROTECTED_MEDIA_SERVE = 'django'
+PROTECTED_MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Resumable chunked uploads (courses/uploads.py). Partial files live outside
+# MEDIA_ROOT until complete, so they are never served.
+CHUNKED_UPLOAD_DIR = os.path.join(BASE_DIR, 'tmp', 'uploads')
+CHUNKED_UPLOAD_MAX_SIZE = {
+    'document': 500 * 1024 * 1024,
+    'image': 10 * 1024 * 1024,
+}
+# a chunk request's claim on its offset; unfinished uploads idle this long are purged
+CHUNKED_UPLOAD_LEASE_SECONDS = 600
+CHUNKED_UPLOAD_EXPIRY_HOURS = 24
+
+# Resized WebP/JPEG copies of thumbnails and profile pictures (courses/variants.py),
+# rendered on a process pool after each upload commits.
+IMAGE_VARIANTS = {
+    'WIDTHS': (160, 320, 640),
+    'FORMATS': ('webp', 'jpeg'),
+    'QUALITY': 80,
+    'WORKERS': 2,
+}
+
 
 AUTH_USER_MODEL = 'courses.CustomUser'
 
 
+# EmailBackend extends ModelBackend (permissions included) and USERNAME_FIELD is
+# email, so a second backend would only repeat the lookup and the password hash
+# for every failed login.
 AUTHENTICATION_BACKENDS = [
-    'courses.backends.EmailBackend',  # Your custom backend
-    'django.contrib.auth.backends.ModelBackend',  # Keep default as fallback
-]
\ No newline at end of file
+    'courses.backends.EmailBackend',
+]
+
+# Password hashing (courses/hashers.py). Changing PASSWORD_HASH_ITERATIONS makes
+# existing hashes outdated; they are upgraded on each user's next login.
+PASSWORD_HASHERS = [
+    'courses.hashers.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_HASH_ITERATIONS = 1_000_000
+
+# Bounded pool that runs password hashes; MAX_WORKERS defaults to the CPU count
+# and MAX_PENDING to four times that. Logins that cannot get a slot within
+# QUEUE_TIMEOUT seconds are answered with 503. The login view awaits its hash,
+# so under ASGI no request thread is held while it runs.
+PASSWORD_HASH_POOL = {
+    'QUEUE_TIMEOUT': 2.0,
+}
+
+# Processes that hash passwords for user imports (courses/user_import.py): one
+# pool per server process, at most MAX_WORKERS, shut down after IDLE_SECONDS
+# without an import.
+USER_IMPORT_POOL = {
+    'MAX_WORKERS': 4,
+    'IDLE_SECONDS': 60,
+}
+
+# Token buckets for POST /api/auth/login/ (courses/throttling.py), per client IP
+# and per email tried: RATE tokens per second, up to BURST at once. The IP bucket
+# is loose because many users can share one NAT address; None turns it off.
+LOGIN_THROTTLE = {
+    'ip': {'RATE': 10.0, 'BURST': 300},
+    'email': {'RATE': 0.1, 'BURST': 5},
+}
+
+# Cache for published course trees (courses/cache.py). Version counters live in
+# the VERSION_CACHE alias, shared so invalidations reach every worker.
+COURSE_TREE_CACHE = {
+    'BACKEND': 'courses.cache.LRUBackend',
+    'OPTIONS': {
+        'max_entries': 1000,
+        'max_bytes': 64 * 1024 * 1024,
+    },
+    'VERSION_CACHE': 'shared',
+}
+
+# Enrollment counts in the course list move its validators at most this often
+# (seconds), so a busy course doesn't invalidate every cached catalog page.
+CATALOG_STATS_INTERVAL = 60
+
+# Lesson completions reach the instructor dashboard rollups (courses/analytics.py)
+# in one write per course and day at most this often (seconds); 0 writes them
+# inside the completion's transaction.
+ANALYTICS_FLUSH_SECONDS = 10
@@ -15,9 +15,10 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from django.http import HttpResponseNotFound
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -25,4 +26,6 @@ urlpatterns = [
 ]
 
 if settings.DEBUG:
+    # lesson documents are only served by /api/lessons/<id>/document/, which checks access
+    urlpatterns += [re_path(rf'^{settings.MEDIA_URL.lstrip("/")}lessons/', lambda request: HttpResponseNotFound())]
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file